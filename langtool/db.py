@@ -0,0 +1,123 @@
+"""
+SQLite tuning and the in-process write queue.
+"""
+
+from concurrent.futures import Future, TimeoutError
+from django.db import connection, transaction, close_old_connections
+from django.conf import settings
+
+import threading
+import queue
+import time
+
+
+def is_read_only(connection):
+    name = str(connection.settings_dict["NAME"])
+    return name.startswith("file:") and ("mode=ro" in name or "immutable=1" in name)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply settings.LANGTOOL_SQLITE_PRAGMAS (LANGTOOL_SQLITE_READ_ONLY_PRAGMAS
+    for read-only databases) to new SQLite connections (connected to the
+    connection_created signal).
+    """
+    if connection.vendor != "sqlite":
+        return
+
+    pragmas = settings.LANGTOOL_SQLITE_READ_ONLY_PRAGMAS if is_read_only(connection) else settings.LANGTOOL_SQLITE_PRAGMAS
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+class WriteQueue:
+    """
+    Serializes write transactions of this process through a single writer thread.
+
+    Writes waiting in the queue are coalesced into one transaction (each in its
+    own savepoint), so concurrent writers neither contend for the SQLite write
+    lock nor pay for a commit each.
+    """
+
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Called with the seconds a write waited in the queue for the writer
+        self.observe_wait = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="langtool-writer", daemon=True)
+                self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run func in a write transaction and return its result.
+        Runs inline if the queue is disabled or the caller is already
+        in a transaction (the writer would not see its uncommitted changes).
+        """
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+
+        if not settings.LANGTOOL_WRITE_QUEUE:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+
+        self.start()
+        future = Future()
+        self.queue.put((future, time.perf_counter(), func, args, kwargs))
+        try:
+            return future.result(timeout=settings.LANGTOOL_WRITE_QUEUE_TIMEOUT)
+        except TimeoutError:
+            # Only writes that never started time out, a started one
+            # is committed (or fails) with its batch
+            if future.cancel():
+                raise
+            return future.result()
+
+    def get_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = []
+            try:
+                batch = self.get_batch()
+                close_old_connections()
+                self.write(batch)
+            except Exception as e:
+                # Fail only this batch (e.g. the commit failed), the writer keeps running
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def write(self, batch):
+        results = []
+        with transaction.atomic():
+            for future, queued, func, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    # Timed out in the queue
+                    continue
+                try:
+                    if self.observe_wait is not None:
+                        self.observe_wait(time.perf_counter()-queued)
+                    with transaction.atomic():
+                        results.append((future, func(*args, **kwargs)))
+                except Exception as e:
+                    future.set_exception(e)
+
+        for future, result in results:
+            future.set_result(result)
+
+
+write_queue = WriteQueue()
@@ -0,0 +1,43 @@
+"""
+Bounded thread pool for running synchronous (database) code
+from async views and middleware.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.conf import settings
+
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.LANGTOOL_SYNC_WORKERS,
+    thread_name_prefix="langtool-sync"
+)
+
+
+def _with_connections(func, *args, **kwargs):
+    # Pool threads live outside the request cycle, so manage
+    # their connections the same way request_started/finished does
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run a synchronous function in the bounded pool, returns a Future.
+    """
+    return executor.submit(_with_connections, func, *args, **kwargs)
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Run a synchronous function in the bounded pool and await its result.
+    """
+    return await sync_to_async(_with_connections, thread_sensitive=False, executor=executor)(
+        func, *args, **kwargs
+    )
@@ -1,7 +1,12 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model, get_backends, authenticate
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
 from django.conf import settings
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+import hashlib
 import jwt
 import time
 
@@ -24,6 +29,16 @@ class TokenBackend(ModelBackend):
         if token is None:
             return None
 
+        # Only the verification is cached, the user is loaded on every
+        # request, so that changes made by any process apply at once
+        key = "langtool:jwt:token:" + hashlib.sha256(token.encode()).hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            pk, username, exp = cached
+            if exp <= int(time.time()):
+                return None
+            return self.get_active_user(pk=pk, username=username)
+
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"], require=["exp"])
         except jwt.PyJWTError:
@@ -37,29 +52,71 @@ class TokenBackend(ModelBackend):
             # Expired
             return None
 
+        user = self.get_active_user(username=payload["username"])
+        if user is None:
+            return None
+
+        timeout = min(settings.LANGTOOL_JWT_CACHE_TIMEOUT, payload["exp"]-int(time.time()))
+        if timeout > 0:
+            cache.set(key, (user.pk, user.username, payload["exp"]), timeout=timeout)
+        return user
+
+    def get_active_user(self, **lookup):
+        User = get_user_model()
         try:
-            User = get_user_model()
-            return User.objects.get(username=payload["username"])
+            user = User.objects.get(**lookup)
         except User.DoesNotExist:
             return None
 
+        if not self.user_can_authenticate(user):
+            return None
+        return user
+
 
 class JWTAuthenticationMiddleware:
+    """
+    Authenticate requests carrying a JWT token, unless the session already did.
+    The user is resolved lazily, so requests that never read request.user
+    don't touch the database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
-        self.backends = get_backends()
+        self.backend = next((b for b in get_backends() if isinstance(b, TokenBackend)), None)
         self.get_response = get_response
 
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
-        for backend in self.backends:
-            if isinstance(backend, TokenBackend):
-                if not request.user.is_authenticated:
-                    user = backend.authenticate(request)
-                    if user is not None:
-                        request.user = user
-                break
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
 
+        self.authenticate(request)
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        self.authenticate(request)
+        return await self.get_response(request)
+
+    def authenticate(self, request):
+        if self.backend is None:
+            return
+
+        token = self.backend.get_token_from_headers(request)
+        if token is None:
+            return
+
+        session_user = request.user
+        request.user = SimpleLazyObject(lambda: self.get_user(request, session_user, token))
+
+    def get_user(self, request, session_user, token):
+        if session_user.is_authenticated:
+            return session_user
+        return self.backend.authenticate(request, token=token) or session_user
+
 
 def create_jwt_token(user, validity=2592000, exp=None):
     """
@@ -0,0 +1,100 @@
+"""
+Placement of content and user state in separate databases.
+
+Content (languages, courses, words, sentences and their links) changes
+only on imports, user state (users, progress) takes all the writes.
+With settings.LANGTOOL_CONTENT_DATABASE set to another alias than
+default, content lives in that database, which app nodes can open as a
+read-only copy (see langtool/db.py), so content reads never wait for
+review writes.
+
+Queries can't join across databases: relations between both sides are
+looked up by ids instead (see ids and CrossDatabaseQuerySet). Relations
+from user state to content are DO_NOTHING, Django would collect them in the
+database of the deleted content; learn.signals deletes them in default.
+"""
+
+from django.db import models, router, connections
+from django.db.models.expressions import RawSQL
+from django.conf import settings
+
+import json
+
+
+CONTENT_MODELS = {"language", "course", "word", "wordform", "sentence", "translation", "sentence_words"}
+
+
+def is_content(model):
+    return model._meta.app_label == "learn" and model._meta.model_name in CONTENT_MODELS
+
+
+def content_connection():
+    return connections[settings.LANGTOOL_CONTENT_DATABASE]
+
+
+class ContentRouter:
+    def db_for_read(self, model, **hints):
+        # Always explicit, Django would otherwise follow the database of a related instance
+        if is_content(model):
+            return settings.LANGTOOL_CONTENT_DATABASE
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        content = settings.LANGTOOL_CONTENT_DATABASE
+        if content == "default":
+            return None
+        if app_label == "learn" and model_name in CONTENT_MODELS:
+            return db == content
+        return db != content
+
+
+def same_database(model, other):
+    return router.db_for_read(model) == router.db_for_read(other)
+
+
+def ids(queryset, model):
+    """
+    Right side of an __in lookup on model: the (flat values_list) queryset itself
+    if both are in the same database (a subquery), otherwise its values. They are
+    passed as a single JSON parameter, a list could exceed the limit of SQL variables.
+    """
+    if same_database(queryset.model, model):
+        return queryset
+    return RawSQL("SELECT value FROM json_each(%s)", [json.dumps(list(queryset))])
+
+
+class CrossDatabaseQuerySet(models.QuerySet):
+    """
+    QuerySet of a model with relations to the other database. select_related
+    of those relations (e.g. by the GraphQL optimizer) is turned into
+    prefetch_related, which loads them by ids with one query per relation.
+    """
+
+    def select_related(self, *fields):
+        if not fields or fields == (None,):
+            return super().select_related(*fields)
+
+        local = []
+        remote = {}
+        for path in fields:
+            name, _, rest = path.partition("__")
+            related_model = self.model._meta.get_field(name).related_model
+            if same_database(self.model, related_model):
+                local.append(path)
+            else:
+                remote.setdefault(name, (related_model, []))[1].extend([rest] if rest else [])
+
+        queryset = super().select_related(*local) if local else self._chain()
+        if remote:
+            queryset = queryset.prefetch_related(*[
+                models.Prefetch(name, queryset=related_model._default_manager.select_related(*paths))
+                if paths else name
+                for name, (related_model, paths) in remote.items()
+            ])
+        return queryset
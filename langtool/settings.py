@@ -80,9 +80,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Database of languages, courses, words and sentences (see langtool/routers.py).
+# Set to 'content' for a separate content database, app nodes can use a read-only copy of it, e.g.
+# DATABASES['content'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'file:/srv/content.sqlite3?mode=ro&immutable=1', 'OPTIONS': {'uri': True}}
+DATABASES['content'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'content.sqlite3',
+}
+LANGTOOL_CONTENT_DATABASE = 'default'
+
+DATABASE_ROUTERS = ['langtool.routers.ContentRouter']
+
+# Applied to every new SQLite connection (see langtool/db.py)
+LANGTOOL_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL', # readers don't block the writer and vice versa
+    'synchronous': 'NORMAL', # safe with WAL, syncs only on checkpoints
+    'mmap_size': 256*1024*1024,
+    'busy_timeout': 20_000, # in milliseconds
+}
+# Applied instead to read-only databases (opened with mode=ro or immutable=1)
+LANGTOOL_SQLITE_READ_ONLY_PRAGMAS = {
+    'mmap_size': 256*1024*1024,
+    'query_only': 1,
+}
+
+# Run write transactions through a single writer thread per process
+LANGTOOL_WRITE_QUEUE = True
+# How long a request waits for its write to start (in seconds), a write that
+# hasn't started by then is dropped
+LANGTOOL_WRITE_QUEUE_TIMEOUT = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared between processes, so that imports invalidate the server's responses
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'responses',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -145,3 +192,48 @@ LANGTOOL_LANGUAGES = [
 ]
 
 INITIAL_INTERVAL = (0.25, 4) # (failure, success) in hours
+
+LANGTOOL_RESPONSE_CACHE = "responses"
+LANGTOOL_RESPONSE_CACHE_TIMEOUT = 60*60*24 # in seconds, entries are also invalidated by content changes
+
+# Serve GraphQL with the async view (for ASGI deployments, see asgi.py)
+LANGTOOL_ASYNC_GRAPHQL = False
+LANGTOOL_SYNC_WORKERS = 8 # size of the thread pool running database work of async views
+
+# Limits of GraphQL operations, see learn/extensions.py for the cost estimate
+LANGTOOL_MAX_QUERY_DEPTH = 10
+LANGTOOL_MAX_QUERY_COST = 20_000
+LANGTOOL_QUERY_COST_LIST_SIZE = 100 # assumed length of lists without a pagination limit
+
+# Expose GraphQL timing and SQL metrics at /metrics/ (Prometheus text format)
+# to staff and to the listed addresses (of the Prometheus server)
+LANGTOOL_METRICS = True
+LANGTOOL_METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+LANGTOOL_METRICS_DEBUG = DEBUG # also report them in the response extensions
+
+# Operation names recorded in metrics, other operations are recorded by their
+# root field (e.g. Query.words) if they have only one, otherwise as "other"
+LANGTOOL_METRICS_OPERATIONS = []
+
+# How long verifications of JWT tokens are cached (in seconds), users are
+# still loaded on every request
+LANGTOOL_JWT_CACHE_TIMEOUT = 60
+
+# Keep progress packed in one blob per user and language (see learn/packed.py)
+# instead of UserWordProgress rows, move it with packprogress (--unpack) when
+# turning this on (off)
+LANGTOOL_PACKED_PROGRESS = False
+
+# Number of users whose packed progress (see learn/packed.py) is kept in memory
+LANGTOOL_PACKED_PROGRESS_CACHE_SIZE = 1024
+
+# Number of users whose progress is kept in memory for sentence ranking (see learn/ranking.py)
+LANGTOOL_RANKING_CACHE_SIZE = 1024
+
+# Retries of a review that lost a race with a concurrent review of the same word
+LANGTOOL_ATTEMPT_RETRIES = 5
+# How long idempotency keys of attempts are remembered (in seconds)
+LANGTOOL_ATTEMPT_KEY_TIMEOUT = 60*60*24
+
+# Difficulty added to sentences for every word, on top of the rarity of their rarest word (see learn/difficulty.py)
+LANGTOOL_DIFFICULTY_LENGTH_WEIGHT = 0.2
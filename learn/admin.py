@@ -1,37 +1,141 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, router, OperationalError
+from django.db.models import Func, Max, OuterRef, Subquery
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
 
 from . import models
 
 
+# Number of related objects shown on change pages
+PREVIEW_SIZE = 20
+
+
+def estimated_count(model):
+    """
+    Row count of a table from the statistics of SQLite (gathered by ANALYZE),
+    or from its largest primary key if it was never analyzed.
+    """
+    table = model._meta.db_table
+    try:
+        with connections[router.db_for_read(model)].cursor() as cursor:
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+        if row is not None:
+            return int(row[0].split()[0])
+    except OperationalError:
+        # Never analyzed, sqlite_stat1 does not exist
+        pass
+    return model.objects.aggregate(count=Max("pk"))["count"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for tables with millions of rows, where COUNT(*) is a full scan.
+    Unfiltered changelists are counted by estimated_count and filtered
+    ones only up to COUNT_LIMIT rows.
+    """
+    COUNT_LIMIT = 10_000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            return estimated_count(self.object_list.model)
+        return self.object_list[:self.COUNT_LIMIT].count()
+
+
+def preview(queryset, changelist, lookup):
+    """
+    Links to the first PREVIEW_SIZE objects of a queryset, followed by
+    a link to the changelist filtered by lookup if there are more.
+    """
+    objects = list(queryset[:PREVIEW_SIZE+1])
+    meta = queryset.model._meta
+
+    html = format_html_join(
+        "",
+        '<a href="{}">{}</a><br>',
+        (
+            (reverse(f"admin:{meta.app_label}_{meta.model_name}_change", args=[obj.pk]), obj)
+            for obj in objects[:PREVIEW_SIZE]
+        )
+    )
+    if len(objects) > PREVIEW_SIZE:
+        html += format_html('<a href="{}?{}">All…</a>', reverse(changelist), lookup)
+    return html
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Don't count the whole table next to filtered results
+    show_full_result_count = False
+
+
 class CustomUserAdmin(UserAdmin):
     fieldsets = list(UserAdmin.fieldsets) + [
         ("Course information", {"fields": ["course"]})
     ]
 
 
-class SentenceAdmin(admin.ModelAdmin):
-    list_display = ["text", "lang"]
-    readonly_fields = ["translations", "words"]
+class SentenceAdmin(ScalableAdmin):
+    list_display = ["text", "lang", "difficulty"]
+    list_select_related = ["lang"]
+    exclude = ["translations", "words"]
+    readonly_fields = ["difficulty", "translation_list", "word_list"]
     list_filter = ["lang"]
+    search_fields = ["text"]
+
+    @admin.display(description="Translations")
+    def translation_list(self, obj):
+        return preview(obj.translations.all(), "admin:learn_sentence_changelist", f"translation_of__id__exact={obj.pk}")
+
+    @admin.display(description="Words")
+    def word_list(self, obj):
+        return preview(obj.words.all(), "admin:learn_word_changelist", f"sentences__id__exact={obj.pk}")
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
 
-class WordAdmin(admin.ModelAdmin):
+
+class WordAdmin(ScalableAdmin):
     list_display = ["text", "lang", "freq", "number_of_sentences"]
+    list_select_related = ["lang"]
     readonly_fields = ["used_in_sentences"]
     list_filter = ["lang"]
 
+    def get_queryset(self, request):
+        # A correlated subquery is evaluated only for the rows on the page
+        sentences = (
+            models.Sentence.words.through.objects
+            .filter(word=OuterRef("pk"))
+            .order_by()
+            .values(count=Func("pk", function="COUNT"))
+        )
+        return super().get_queryset(request).annotate(sentence_count=Subquery(sentences))
+
+    @admin.display(description="Number of sentences")
     def number_of_sentences(self, obj):
-        return obj.sentences.count()
+        return obj.sentence_count
 
     def used_in_sentences(self, obj):
-        return "\n".join((str(s) for s in obj.sentences.all()))
+        return preview(obj.sentences.all(), "admin:learn_sentence_changelist", f"words__id__exact={obj.pk}")
+
+
+class UserWordProgressAdmin(ScalableAdmin):
+    list_display = ["user", "word", "last_review", "updated"]
+    list_select_related = ["user", "word"]
+    raw_id_fields = ["user", "word"]
 
 
 admin.site.register(models.User, CustomUserAdmin)
 admin.site.register(models.Sentence, SentenceAdmin)
 admin.site.register(models.Word, WordAdmin)
-admin.site.register(models.UserWordProgress)
+admin.site.register(models.UserWordProgress, UserWordProgressAdmin)
 admin.site.register(models.Language)
 admin.site.register(models.Course)
 
@@ -6,6 +6,10 @@ import typing
 
 import strawberry_django
 from strawberry_django.optimizer import DjangoOptimizerExtension
+from strawberry.extensions import QueryDepthLimiter
+
+from .extensions import QueryCostExtension, MetricsExtension
+from .incremental import IncrementalExecutionContext, add_directives
 
 # Auth
 from django.contrib.auth import get_user_model
@@ -13,10 +17,13 @@ from django.contrib.auth.forms import UserCreationForm
 from strawberry.django import auth
 
 from langtool.jwtauth import issue_jwt_token
+from langtool.db import write_queue
+from langtool.routers import ids
 
 # Models
-from django.db.models import Exists, OuterRef
 from . import models
+from . import ranking
+from . import packed
 
 # Time
 import datetime
@@ -68,6 +75,7 @@ class Course:
 @strawberry.django.ordering.order(models.Sentence)
 class SentenceOrder:
     text: auto
+    difficulty: auto
 
 
 @strawberry.django.filters.filter(models.Sentence)
@@ -82,7 +90,16 @@ class SentenceFilter:
 
     words: typing.Optional["WordFilter"]
 
+    difficulty: typing.Optional[strawberry.django.filters.FilterLookup[float]]
+
     has_audio: typing.Optional[bool]
+    # Full-text search, results are ranked unless ordered explicitly
+    search: typing.Optional[str]
+
+    def filter_search(self, queryset):
+        if self.search is not None:
+            queryset = queryset.search(self.search)
+        return queryset
 
     def filter_has_audio(self, queryset):
         if self.has_audio is None:
@@ -106,9 +123,12 @@ class Sentence:
 
     words: typing.List["Word"]
 
-    tokens: typing.List[str]
-    lemmas: typing.List[str]
-    spans: typing.List[typing.Tuple[int, int]]
+    difficulty: typing.Optional[float]
+
+    # Computed from the text by the tokenizer of the language (see multilang.tokenize)
+    tokens: typing.List[str] = strawberry.django.field(only=["text", "lang"])
+    lemmas: typing.List[str] = strawberry.django.field(only=["text", "lang"])
+    spans: typing.List[typing.Tuple[int, int]] = strawberry.django.field(only=["text", "lang"])
 
     @strawberry.django.field
     def audio(self):
@@ -144,16 +164,16 @@ class WordFilter:
             if not info.context.request.user.is_authenticated:
                 return models.Word.objects.none()
 
-            query = Exists(
-                    models.UserWordProgress.objects.filter(
-                        word=OuterRef("pk"),
-                        user=info.context.request.user
-                    )
-                )
+            # Progress may be in another database (see langtool/routers.py)
+            learned = ids(
+                models.UserWordProgress.objects.filter(user=info.context.request.user).values_list("word", flat=True),
+                models.Word
+            )
 
             if self.new:
-                query = ~query
-            queryset = queryset.filter(query)
+                queryset = queryset.exclude(pk__in=learned)
+            else:
+                queryset = queryset.filter(pk__in=learned)
 
         return queryset
 
@@ -167,7 +187,7 @@ class WordFilter:
             else:
                 raise NotImplementedError
             return queryset.filter(
-                **{key: self.filter_only_used(models.Word.objects.all())}
+                **{key: ids(self.filter_only_used(models.Word.objects.all()).values_list("pk", flat=True), queryset.model)}
             )
 
         if self.only_used:
@@ -184,17 +204,54 @@ class Word:
 
     sentences: typing.List["Sentence"] = strawberry.django.field(pagination=True)
 
-    @strawberry.django.field
-    def random_sentence(self, info: Info, filters: typing.Optional[SentenceFilter] = strawberry.UNSET) -> typing.Optional[Sentence]:
-        qs = self.sentences
+    @strawberry.django.field(only=["lang"])
+    def random_sentence(
+        self, info: Info,
+        filters: typing.Optional[SentenceFilter] = strawberry.UNSET,
+        min_difficulty: typing.Optional[float] = None,
+        max_difficulty: typing.Optional[float] = None
+    ) -> typing.Optional[Sentence]:
+        qs = self.sentences.all()
         if filters is not strawberry.UNSET:
             qs = strawberry_django.filters.apply(filters, qs, info)
+        if min_difficulty is not None or max_difficulty is not None:
+            # Sentences of the word are in its language, the lang lets SQLite range scan (lang, difficulty)
+            qs = qs.filter(lang_id=self.lang_id)
+        if min_difficulty is not None:
+            qs = qs.filter(difficulty__gte=min_difficulty)
+        if max_difficulty is not None:
+            qs = qs.filter(difficulty__lte=max_difficulty)
         return qs.random()
 
-    @strawberry.django.field(pagination=True)
+    @strawberry.django.field(only=["lang"])
+    def best_sentence(self, info: Info, filters: typing.Optional[SentenceFilter] = strawberry.UNSET) -> typing.Optional[Sentence]:
+        """A sentence with the fewest words unknown to the user besides this one."""
+        qs = self.sentences.all()
+        if filters is not strawberry.UNSET:
+            qs = strawberry_django.filters.apply(filters, qs, info)
+
+        user = info.context.request.user
+        if not user.is_authenticated:
+            return qs.random()
+
+        candidates = None
+        if filters is not strawberry.UNSET:
+            candidates = list(qs.values_list("pk", flat=True))
+
+        best = ranking.ranker.best(user, self, candidates)
+        if best is None:
+            return None
+        return models.Sentence.objects.get(pk=best)
+
+    @strawberry.django.field(pagination=True, only=["lang"])
     def progress(self, info: Info) -> typing.Optional["UserWordProgress"]:
         if not info.context.request.user.is_authenticated:
             return models.UserWordProgress.objects.none()
+        if settings.LANGTOOL_PACKED_PROGRESS:
+            progress = packed.store.progress(info.context.request.user, self)
+            if progress is not None:
+                progress.scheduled_review = progress.next_review
+            return progress
         return models.UserWordProgress.objects.filter(word=self, user=info.context.request.user).first()
 
 
@@ -241,6 +298,11 @@ class UserWordProgressFilter:
     last_review: typing.Optional[strawberry.django.filters.FilterLookup[datetime.datetime]]
     scheduled_review: typing.Optional[strawberry.django.filters.FilterLookup[datetime.datetime]]
 
+    def filter_word(self, queryset, info: Info):
+        # Filtered by ids, words may be in another database (see langtool/routers.py)
+        words = strawberry_django.filters.apply(self.word, models.Word.objects.all(), info)
+        return queryset.filter(word__in=ids(words.values_list("pk", flat=True), models.UserWordProgress))
+
     def filter_scheduled_review(self, queryset):
         filter_kwargs, _ = strawberry.django.filters.build_filter_kwargs(self.scheduled_review)
         return queryset.with_scheduled_review().filter(
@@ -250,7 +312,8 @@ class UserWordProgressFilter:
 
 @strawberry.django.type(models.UserWordProgress, filters=UserWordProgressFilter, order=UserWordProgressOrder)
 class UserWordProgress:
-    id: strawberry.ID
+    # None for packed progress (see learn/packed.py), which has no rows
+    id: typing.Optional[strawberry.ID]
     word: Word
     user: User
     last_review: datetime.datetime
@@ -263,6 +326,12 @@ class UserWordProgress:
         return self.predict(exact=exact, time=time)
 
 
+@strawberry.type
+class ReviewForecastDay:
+    day: datetime.date
+    count: int
+
+
 #######################
 # Field Utils         #
 #######################
@@ -315,6 +384,15 @@ class Query:
         pagination=True,
     )
 
+    @strawberry.field
+    def review_forecast(self, info: Info, days: int = 7) -> typing.List[ReviewForecastDay]:
+        """Number of reviews due on each of the next days, overdue ones are counted today."""
+        user = info.context.request.user
+        if not user.is_authenticated:
+            return []
+        days = min(max(days, 1), 366)
+        return [ReviewForecastDay(day=day, count=count) for day, count in models.DueCounter.objects.forecast(user, days)]
+
     @strawberry.django.field
     def sentence(self, id: strawberry.ID) -> Sentence:
         return models.Sentence.objects.get(id=id)
@@ -331,12 +409,38 @@ class Query:
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    def attempt(self, info: Info, id: strawberry.ID, success: bool) -> UserWordProgress:
-        progress, _ = models.UserWordProgress.objects.get_or_create(
-            user=info.context.request.user,
-            word=models.Word.objects.get(id=id)
-        )
-        progress.attempt(success)
+    def attempt(self, info: Info, id: strawberry.ID, success: bool, key: typing.Optional[str] = None) -> UserWordProgress:
+        """
+        Review a word. Clients retrying a submission should send
+        the same key, the review is then applied only once.
+        """
+        if key is not None and not 0 < len(key) <= 64:
+            raise Exception("The key must have 1 to 64 characters.")
+
+        def write(user):
+            word = models.Word.objects.get(id=id)
+            if key is not None:
+                attempt_key, created = models.AttemptKey.objects.claim(user, key)
+                if not created:
+                    if settings.LANGTOOL_PACKED_PROGRESS:
+                        return packed.progress_of(packed.store.load(user.pk, word.lang_id), user, word.pk)
+                    return attempt_key.progress
+
+            if settings.LANGTOOL_PACKED_PROGRESS:
+                # Kept only in the packed blob, there is no row to link the key to
+                return packed.store.attempt(user, word, success)
+
+            progress, _ = models.UserWordProgress.objects.get_or_create(user=user, word=word)
+            progress.attempt(success)
+
+            if key is not None:
+                attempt_key.progress = progress
+                attempt_key.save(update_fields=["progress"])
+            return progress
+
+        progress = write_queue.submit(write, info.context.request.user)
+        # Normally annotated by the queryset (see add_scheduled_review)
+        progress.scheduled_review = progress.next_review
         return progress
 
     # JWT auth
@@ -353,7 +457,7 @@ class Mutation:
     def register(self, data: UserRegistrationInput) -> typing.Optional[User]:
         form = CustomUserCreationForm(strawberry.asdict(data))
         if form.is_valid():
-            return form.save()
+            return write_queue.submit(form.save)
         else:
             raise Exception(form.errors.popitem()[1][0])
 
@@ -363,9 +467,11 @@ class Mutation:
         if not user.is_authenticated:
             return None
 
-        user.course = models.Course.objects.get(id=course_id)
-        user.save()
-        
+        def write():
+            user.course = models.Course.objects.get(id=course_id)
+            user.save(update_fields=["course"])
+
+        write_queue.submit(write)
         return user
 
 
@@ -373,6 +479,11 @@ schema = strawberry.Schema(
     Query,
     Mutation,
     extensions=[
+        MetricsExtension,
+        QueryDepthLimiter(max_depth=settings.LANGTOOL_MAX_QUERY_DEPTH),
+        QueryCostExtension,
         DjangoOptimizerExtension,
-    ]
+    ],
+    execution_context_class=IncrementalExecutionContext,
 )
+add_directives(schema)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class LearnConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'learn'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from langtool.db import configure_sqlite, write_queue
+        from functools import partial
+        from . import metrics
+
+        connection_created.connect(configure_sqlite)
+        write_queue.observe_wait = partial(metrics.write_wait_seconds.observe, "default")
+
+        from . import signals
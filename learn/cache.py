@@ -0,0 +1,154 @@
+# Cache
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import quote_etag
+
+# GraphQL
+from graphql import parse, print_ast, visit, Visitor, GraphQLError
+from graphql.language import OperationType
+
+# Other
+from django.conf import settings
+from contextlib import contextmanager
+import threading
+import hashlib
+import json
+
+
+VERSION_KEY = "langtool:content_version"
+
+# Fields whose result depends on the requesting user (or is random),
+# an operation selecting any of them is never cached.
+UNCACHEABLE_FIELDS = {"me", "progress", "progresses", "prediction", "user", "randomSentence", "bestSentence", "reviewForecast"}
+
+# Filter keys that make the result depend on the requesting user
+UNCACHEABLE_FILTERS = {"new", "progress"}
+
+
+def get_cache():
+    return caches[settings.LANGTOOL_RESPONSE_CACHE]
+
+
+#######################
+# Content version     #
+#######################
+
+
+_batch = threading.local()
+
+
+def content_version():
+    version = get_cache().get(VERSION_KEY)
+    if version is None:
+        version = 0
+        get_cache().add(VERSION_KEY, version, timeout=None)
+    return version
+
+
+def bump_content_version():
+    """Invalidate all cached responses."""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def content_changed():
+    """
+    Bump the content version once the current transaction commits.
+    Inside batch_content_changes the bump is postponed until the batch ends.
+    """
+    if getattr(_batch, "depth", 0):
+        _batch.dirty = True
+    else:
+        transaction.on_commit(bump_content_version)
+
+
+@contextmanager
+def batch_content_changes():
+    """
+    Coalesce content changes (e.g. during an import) into a single version bump.
+    """
+    _batch.depth = getattr(_batch, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _batch.depth -= 1
+        if not _batch.depth and getattr(_batch, "dirty", False):
+            _batch.dirty = False
+            content_changed()
+
+
+#######################
+# Responses           #
+#######################
+
+
+class _UncacheableVisitor(Visitor):
+    def __init__(self):
+        super().__init__()
+        self.cacheable = True
+
+    def enter_operation_definition(self, node, *args):
+        if node.operation != OperationType.QUERY:
+            self.cacheable = False
+            return self.BREAK
+
+    def enter_field(self, node, *args):
+        if node.name.value in UNCACHEABLE_FIELDS:
+            self.cacheable = False
+            return self.BREAK
+
+    def enter_object_field(self, node, *args):
+        if node.name.value in UNCACHEABLE_FILTERS:
+            self.cacheable = False
+            return self.BREAK
+
+
+def _has_uncacheable_filter(value):
+    if isinstance(value, dict):
+        return any(k in UNCACHEABLE_FILTERS or _has_uncacheable_filter(v) for k, v in value.items())
+    if isinstance(value, list):
+        return any(_has_uncacheable_filter(v) for v in value)
+    return False
+
+
+def response_key(query, variables=None, operation_name=None):
+    """
+    Get the cache key of a GraphQL request, or None if its response
+    depends on the requesting user and must not be cached.
+    """
+    if not query:
+        return None
+
+    try:
+        document = parse(query)
+    except GraphQLError:
+        # Let the schema report the error
+        return None
+
+    visitor = _UncacheableVisitor()
+    visit(document, visitor)
+    if not visitor.cacheable or _has_uncacheable_filter(variables):
+        return None
+
+    try:
+        normalized = json.dumps([print_ast(document), variables or {}, operation_name], sort_keys=True)
+    except (TypeError, ValueError):
+        # Variables that aren't JSON (e.g. bytes from a msgpack body)
+        return None
+    digest = hashlib.sha256(normalized.encode()).hexdigest()
+    return f"langtool:response:{content_version()}:{digest}"
+
+
+def get_response(key):
+    """Get a cached (content, etag) pair."""
+    return get_cache().get(key)
+
+
+def set_response(key, content):
+    etag = quote_etag(hashlib.sha1(content).hexdigest())
+    entry = (content, etag)
+    get_cache().set(key, entry, timeout=settings.LANGTOOL_RESPONSE_CACHE_TIMEOUT)
+    return entry
@@ -0,0 +1,39 @@
+"""
+Precomputed difficulty of sentences.
+
+The difficulty is how rare the rarest word of a sentence is (8 minus its
+Zipf frequency, so 0 for the most common words and 8 for unknown ones)
+plus settings.LANGTOOL_DIFFICULTY_LENGTH_WEIGHT for every word. It is
+computed from the lemmas on import (see addpair, or the sentencedifficulty
+command for existing sentences) and stored in Sentence.difficulty, so
+sentences of a level are an index range lookup.
+"""
+
+from django.conf import settings
+from wordfreq import zipf_frequency
+
+MAX_ZIPF = 8.0
+
+
+def difficulty(zipfs):
+    """Difficulty of a sentence with words of the given Zipf frequencies."""
+    if not zipfs:
+        return 0.0
+    return MAX_ZIPF-min(zipfs) + settings.LANGTOOL_DIFFICULTY_LENGTH_WEIGHT*len(zipfs)
+
+
+class Scorer:
+    """Difficulty of sentences of a language, Zipf frequencies are looked up once per lemma."""
+
+    def __init__(self, lang_code):
+        self.lang_code = lang_code
+        self.zipfs = {}
+
+    def zipf(self, lemma):
+        if lemma not in self.zipfs:
+            self.zipfs[lemma] = min(zipf_frequency(lemma, self.lang_code), MAX_ZIPF)
+        return self.zipfs[lemma]
+
+    def __call__(self, lemmas):
+        # Punctuation and numbers don't count as words
+        return difficulty([self.zipf(lemma) for lemma in lemmas if lemma.isalpha()])
@@ -0,0 +1,185 @@
+"""
+Streaming export of progress and the corpus as CSV or NDJSON.
+
+Rows are read with QuerySet.iterator(chunk_size=...) and encoded one
+at a time, so memory use doesn't grow with the size of the table.
+Times are ISO 8601 strings and intervals are in hours (as in learn/sync.py),
+links of sentences are lists of ids (space separated in CSV).
+"""
+
+# Database
+from django.db.models import Prefetch
+
+# Time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+import datetime
+
+# Other
+from langtool.routers import same_database
+import itertools
+import json
+import csv
+
+from . import models
+
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _time(value):
+    return None if value is None else value.isoformat()
+
+
+def _hours(value):
+    return None if value is None else models.duration_to_hours(value)
+
+
+def parse_time(value, name):
+    """Parse a date or a datetime (in the current time zone if naive)."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is not None:
+                parsed = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ExportError(f"{name} is not a date or a datetime")
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def progress(course=None, since=None, until=None, user=None):
+    queryset = models.UserWordProgress.objects.order_by("pk")
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    course_words = None
+    if course is not None:
+        words = models.Word.objects.filter(lang_id=course.learning_id).values_list("pk", flat=True)
+        if same_database(models.Word, models.UserWordProgress):
+            queryset = queryset.filter(word__in=words)
+        else:
+            # Rather than all word ids of the language, only the words
+            # of every chunk of rows are looked up in the content database
+            course_words = words
+    if since is not None:
+        queryset = queryset.filter(updated__gte=since)
+    if until is not None:
+        queryset = queryset.filter(updated__lt=until)
+
+    columns = ["id", "user", "word", "last_review", "alpha", "beta", "interval", "updated"]
+
+    def rows():
+        values = queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+        while chunk := list(itertools.islice(values, CHUNK_SIZE)):
+            if course_words is not None:
+                found = set(course_words.filter(pk__in={row[2] for row in chunk}))
+                chunk = [row for row in chunk if row[2] in found]
+            for pk, user, word, last_review, alpha, beta, interval, updated in chunk:
+                yield pk, user, word, _time(last_review), alpha, beta, _hours(interval), _time(updated)
+
+    return columns, rows()
+
+
+def words(course=None):
+    queryset = models.Word.objects.order_by("pk")
+    if course is not None:
+        queryset = queryset.filter(lang_id=course.learning_id)
+
+    columns = ["id", "lang", "text", "freq"]
+    return columns, queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+
+def sentences(course=None):
+    queryset = models.Sentence.objects.order_by("pk").prefetch_related(
+        Prefetch("translations", queryset=models.Sentence.objects.only("pk")),
+        Prefetch("words", queryset=models.Word.objects.only("pk")),
+    )
+    if course is not None:
+        queryset = queryset.filter(lang_id=course.learning_id)
+
+    columns = ["id", "lang", "text", "link_id", "audio", "translations", "words"]
+
+    def rows():
+        # Links are prefetched for every chunk
+        for sentence in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield (
+                sentence.pk, sentence.lang_id, sentence.text, sentence.link_id, sentence.audio.name or None,
+                [t.pk for t in sentence.translations.all()],
+                [w.pk for w in sentence.words.all()],
+            )
+
+    return columns, rows()
+
+
+EXPORTS = {
+    "progress": progress,
+    "words": words,
+    "sentences": sentences,
+}
+
+
+def export(kind, course=None, since=None, until=None, user=None):
+    """
+    Get the columns and a lazy iterator of rows of an export. course is
+    a Course id, since and until (only for progress) limit the time of
+    the last change, user limits progress to a single user.
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f"unknown export {kind}, expected one of {', '.join(EXPORTS)}")
+
+    if course is not None:
+        try:
+            course = models.Course.objects.get(pk=course)
+        except (models.Course.DoesNotExist, ValueError):
+            raise ExportError(f"course {course} does not exist")
+
+    since = parse_time(since, "since")
+    until = parse_time(until, "until")
+
+    if kind == "progress":
+        return progress(course, since, until, user)
+    if since is not None or until is not None:
+        raise ExportError("only progress can be filtered by time")
+    return EXPORTS[kind](course)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def to_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([" ".join(map(str, value)) if isinstance(value, list) else value for value in row])
+
+
+def to_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+
+
+def encode(columns, rows, format):
+    """Encode rows as lines (strings) of the given format."""
+    if format == "csv":
+        return to_csv(columns, rows)
+    if format == "ndjson":
+        return to_ndjson(columns, rows)
+    raise ExportError(f"unknown format {format}, expected one of {', '.join(FORMATS)}")
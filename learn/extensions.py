@@ -0,0 +1,253 @@
+# GraphQL
+from strawberry.extensions import SchemaExtension
+from graphql import ExecutionResult, GraphQLError, GraphQLObjectType, GraphQLInterfaceType
+from graphql import get_named_type, get_nullable_type, is_list_type
+from graphql.language import FieldNode, InlineFragmentNode, FragmentSpreadNode, FragmentDefinitionNode
+from graphql.utilities import get_operation_ast, value_from_ast_untyped
+
+# Database
+from django.db import connections
+
+# Other
+from django.conf import settings
+from contextlib import ExitStack
+from inspect import isawaitable
+import time
+
+from . import metrics
+
+
+#######################
+# Query cost          #
+#######################
+
+
+# Cost of resolving a field on a single object (on top of the
+# cost of 1 for every resolved object)
+FIELD_COSTS = {
+    "Sentence.tokens": 5,
+    "Sentence.lemmas": 20,
+    "Sentence.spans": 10,
+    "Word.randomSentence": 10,
+    "Word.bestSentence": 10,
+    "UserWordProgress.prediction": 2,
+}
+
+# Expected sizes of object lists requested without a pagination limit,
+# other lists are assumed to have settings.LANGTOOL_QUERY_COST_LIST_SIZE items
+LIST_SIZES = {
+    "Query.languages": 10,
+    "Query.courses": 50,
+    "Query.words": 10_000,
+    "Query.sentences": 100_000,
+    "Query.progresses": 10_000,
+    "Sentence.translations": 5,
+    "Sentence.words": 10,
+}
+
+
+def _list_size(field, key, variables):
+    for arg in field.arguments:
+        if arg.name.value == "pagination":
+            pagination = value_from_ast_untyped(arg.value, variables)
+            if isinstance(pagination, dict):
+                limit = pagination.get("limit")
+                if isinstance(limit, int) and limit >= 0:
+                    return limit
+    return LIST_SIZES.get(key, settings.LANGTOOL_QUERY_COST_LIST_SIZE)
+
+
+def _field_cost(schema, field, parent_type, fragments, variables):
+    name = field.name.value
+    if not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)) or name not in parent_type.fields:
+        # Introspection or an invalid field
+        return 0
+
+    key = f"{parent_type.name}.{name}"
+    field_type = get_nullable_type(parent_type.fields[name].type)
+
+    cost = FIELD_COSTS.get(key, 0)
+    if field.selection_set is None:
+        return cost
+
+    cost += 1 + _selection_set_cost(schema, field.selection_set, get_named_type(field_type), fragments, variables)
+    if is_list_type(field_type):
+        cost *= _list_size(field, key, variables)
+    return cost
+
+
+def _selection_set_cost(schema, selection_set, parent_type, fragments, variables):
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            cost += _field_cost(schema, selection, parent_type, fragments, variables)
+        elif isinstance(selection, InlineFragmentNode):
+            if selection.type_condition is not None:
+                fragment_type = schema.get_type(selection.type_condition.name.value)
+            else:
+                fragment_type = parent_type
+            cost += _selection_set_cost(schema, selection.selection_set, fragment_type, fragments, variables)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                fragment_type = schema.get_type(fragment.type_condition.name.value)
+                cost += _selection_set_cost(schema, fragment.selection_set, fragment_type, fragments, variables)
+    return cost
+
+
+def query_cost(schema, document, variables=None, operation_name=None):
+    """
+    Estimate the cost of an operation (roughly the number of resolved objects).
+    Lists multiply the cost of their items by their pagination limit or expected size.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root_type = schema.get_root_type(operation.operation)
+    return _selection_set_cost(schema, operation.selection_set, root_type, fragments, variables or {})
+
+
+class QueryCostExtension(SchemaExtension):
+    """
+    Reject operations estimated to cost more than settings.LANGTOOL_MAX_QUERY_COST
+    and report the estimate in the response extensions.
+    """
+
+    cost = None
+
+    def on_execute(self):
+        context = self.execution_context
+        self.cost = query_cost(
+            context.schema._schema,
+            context.graphql_document,
+            context.variables,
+            context.operation_name
+        )
+
+        if self.cost > settings.LANGTOOL_MAX_QUERY_COST:
+            # Setting the result skips the execution
+            context.result = ExecutionResult(data=None, errors=[GraphQLError(
+                f"Query is too expensive: estimated cost {self.cost} exceeds {settings.LANGTOOL_MAX_QUERY_COST}."
+            )])
+
+        yield
+
+    def get_results(self):
+        if self.cost is None:
+            return {}
+        return {"cost": {"estimated": self.cost, "budget": settings.LANGTOOL_MAX_QUERY_COST}}
+
+
+#######################
+# Metrics             #
+#######################
+
+
+def operation_label(schema, document, operation_name=None):
+    """
+    Label of an operation in metrics: its name if it's listed in
+    settings.LANGTOOL_METRICS_OPERATIONS, otherwise its root field
+    (e.g. Query.words) if it selects only one, otherwise "other".
+    Operation names are chosen by clients and every label is a series
+    kept in memory, so they aren't used as they are.
+    """
+    if operation_name in settings.LANGTOOL_METRICS_OPERATIONS:
+        return operation_name
+
+    operation = get_operation_ast(document, operation_name) if document is not None else None
+    if operation is None or len(operation.selection_set.selections) != 1:
+        return "other"
+    selection = operation.selection_set.selections[0]
+    root_type = schema.get_root_type(operation.operation)
+    if not isinstance(selection, FieldNode) or root_type is None or selection.name.value not in root_type.fields:
+        return "other"
+    return f"{root_type.name}.{selection.name.value}"
+
+
+class MetricsExtension(SchemaExtension):
+    """
+    Record wall time, SQL query count and SQL time of the operation
+    and of every resolved field into learn.metrics.
+    With settings.LANGTOOL_METRICS_DEBUG, also report them in the response extensions.
+    """
+
+    def __init__(self, *, execution_context):
+        super().__init__(execution_context=execution_context)
+        self.sql_queries = 0
+        self.sql_seconds = 0.
+        self.seconds = 0.
+        self.fields = {}
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter()-start
+            self.sql_queries += 1
+
+    def on_operation(self):
+        start = time.perf_counter()
+        # Content and user state may be in separate databases
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.sql_wrapper))
+            yield
+        self.seconds = time.perf_counter()-start
+
+        context = self.execution_context
+        operation = operation_label(context.schema._schema, context.graphql_document, context.operation_name)
+        metrics.operation_seconds.observe(operation, self.seconds)
+        metrics.operation_sql_queries.observe(operation, self.sql_queries)
+        metrics.operation_sql_seconds.observe(operation, self.sql_seconds)
+
+        for field, (_, seconds, sql_queries) in self.fields.items():
+            metrics.resolver_seconds.observe(field, seconds)
+            metrics.resolver_sql_queries.observe(field, sql_queries)
+
+    def record(self, field, start, sql_queries):
+        calls, seconds, queries = self.fields.get(field, (0, 0., 0))
+        self.fields[field] = (
+            calls+1,
+            seconds+time.perf_counter()-start,
+            queries+self.sql_queries-sql_queries
+        )
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        field = f"{info.parent_type.name}.{info.field_name}"
+        start = time.perf_counter()
+        sql_queries = self.sql_queries
+
+        result = _next(root, info, *args, **kwargs)
+
+        if isawaitable(result):
+            async def timed():
+                try:
+                    return await result
+                finally:
+                    self.record(field, start, sql_queries)
+            return timed()
+
+        self.record(field, start, sql_queries)
+        return result
+
+    def get_results(self):
+        if not settings.LANGTOOL_METRICS_DEBUG:
+            return {}
+
+        # Results are collected while the operation is still running,
+        # so its total wall time is only available in the histograms
+        return {"metrics": {
+            "sqlQueries": self.sql_queries,
+            "sqlSeconds": self.sql_seconds,
+            "resolvers": {
+                field: {"calls": calls, "seconds": seconds, "sqlQueries": sql_queries}
+                for field, (calls, seconds, sql_queries) in self.fields.items()
+            }
+        }}
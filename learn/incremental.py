@@ -0,0 +1,275 @@
+"""
+Incremental delivery (@defer and @stream) of GraphQL results.
+
+graphql-core 3.2 doesn't implement the directives, so they are declared
+here and handled by IncrementalExecutionContext: fields of a deferred
+fragment and the items of a streamed list after initialCount are left
+out of the initial result and executed afterwards, every part is sent
+to request.graphql_incremental as soon as it is complete (see
+IncrementalMixin in learn/views.py, which streams the parts as a
+multipart/mixed response). Without it the directives are ignored and
+the result is complete.
+
+Payloads follow the incremental delivery proposal: the initial one has
+data and hasNext, later ones a list of incremental results with data
+(deferred fragments) or items (streamed lists) and their path.
+
+Relations in deferred fragments are still prefetched with their parents
+by the optimizer, what's deferred is resolving and completing them
+(e.g. randomSentence, tokens or spans).
+"""
+
+from graphql import (
+    GraphQLDirective, GraphQLArgument, GraphQLNonNull, GraphQLBoolean, GraphQLString, GraphQLInt,
+    DirectiveLocation, GraphQLError, located_error,
+)
+from graphql.execution import ExecutionContext
+from graphql.execution.values import get_directive_values
+from graphql.language import InlineFragmentNode, FragmentSpreadNode, SelectionSetNode
+from graphql.pyutils import is_iterable
+
+from collections import deque
+from copy import copy
+
+
+DeferDirective = GraphQLDirective(
+    name="defer",
+    locations=[DirectiveLocation.FRAGMENT_SPREAD, DirectiveLocation.INLINE_FRAGMENT],
+    args={
+        "if": GraphQLArgument(GraphQLNonNull(GraphQLBoolean), default_value=True),
+        "label": GraphQLArgument(GraphQLString),
+    },
+    description="Deliver the fragment after the rest of the result (with Accept: multipart/mixed).",
+    # Printed by strawberry like its own directives
+    extensions={"strawberry-definition": None},
+)
+
+StreamDirective = GraphQLDirective(
+    name="stream",
+    locations=[DirectiveLocation.FIELD],
+    args={
+        "if": GraphQLArgument(GraphQLNonNull(GraphQLBoolean), default_value=True),
+        "label": GraphQLArgument(GraphQLString),
+        "initialCount": GraphQLArgument(GraphQLNonNull(GraphQLInt), default_value=0),
+    },
+    description="Deliver items of the list after the first initialCount one by one (with Accept: multipart/mixed).",
+    extensions={"strawberry-definition": None},
+)
+
+MULTIPART = "multipart/mixed"
+
+
+def add_directives(schema):
+    """Declare @defer and @stream in a strawberry schema."""
+    schema._schema.directives = (*schema._schema.directives, DeferDirective, StreamDirective)
+
+
+def uses_directives(query):
+    # Cheap check, a false positive only skips the response cache
+    return query is not None and ("@defer" in query or "@stream" in query)
+
+
+def uses_defer(selection_set):
+    for selection in selection_set.selections:
+        if any(directive.name.value == DeferDirective.name for directive in selection.directives):
+            return True
+        if getattr(selection, "selection_set", None) is not None and uses_defer(selection.selection_set):
+            return True
+    return False
+
+
+def encode_part(payload, dumps):
+    return f"\r\n---\r\nContent-Type: application/json; charset=utf-8\r\n\r\n{dumps(payload)}"
+
+
+END = "\r\n-----\r\n"
+
+IMMEDIATE = object()
+
+
+class DeferredFragment:
+    def __init__(self, label, parent_type, source, path, fields):
+        self.label = label
+        self.parent_type = parent_type
+        self.source = source
+        self.path = path
+        self.fields = fields
+
+
+class StreamedItems:
+    def __init__(self, label, item_type, field_nodes, info, path, items, start):
+        self.label = label
+        self.item_type = item_type
+        self.field_nodes = field_nodes
+        self.info = info
+        self.path = path
+        self.items = items
+        self.start = start
+
+
+class IncrementalExecutionContext(ExecutionContext):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = getattr(self.context_value, "request", None)
+        self.send = getattr(request, "graphql_incremental", None)
+        # Ids of field nodes of deferred fragments -> labels
+        self.deferred = {}
+        self.pending = deque()
+        self._stream_cache = {}
+
+    def execute_operation(self, operation, root_value):
+        if any(uses_defer(definition.selection_set) for definition in [operation, *self.fragments.values()]):
+            # Fragments are inlined into a copy of the operation, so every field
+            # node in a deferred fragment is distinct
+            operation = copy(operation)
+            operation.selection_set = self.inline(operation.selection_set)
+            self.operation = operation
+
+        if self.send is None:
+            return super().execute_operation(operation, root_value)
+
+        data = super().execute_operation(operation, root_value)
+
+        self.send(self.payload({"data": data}, self.errors))
+        while self.pending:
+            record = self.pending.popleft()
+            if isinstance(record, DeferredFragment):
+                self.execute_deferred(record)
+            else:
+                self.execute_streamed(record)
+        return data
+
+    def inline(self, selection_set, label=None, deferred=False):
+        selections = []
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                selection = InlineFragmentNode(
+                    type_condition=fragment.type_condition,
+                    directives=selection.directives,
+                    selection_set=fragment.selection_set,
+                    loc=selection.loc,
+                )
+            else:
+                selection = copy(selection)
+
+            if isinstance(selection, InlineFragmentNode):
+                defer = get_directive_values(DeferDirective, selection, self.variable_values)
+                if not deferred and defer is not None and defer["if"]:
+                    selection.selection_set = self.inline(selection.selection_set, defer.get("label"), True)
+                else:
+                    selection.selection_set = self.inline(selection.selection_set, label, deferred)
+
+                if selection.type_condition is None:
+                    # The optimizer needs type conditions, the fragment is merged into
+                    # its parent (its @skip and @include apply to every selection)
+                    directives = [d for d in selection.directives if d.name.value != DeferDirective.name]
+                    for child in selection.selection_set.selections:
+                        child.directives = (*child.directives, *directives)
+                        selections.append(child)
+                    continue
+            else:
+                if selection.selection_set is not None:
+                    selection.selection_set = self.inline(selection.selection_set)
+                if deferred and self.send is not None:
+                    self.deferred[id(selection)] = label
+            selections.append(selection)
+        return SelectionSetNode(selections=tuple(selections), loc=selection_set.loc)
+
+    def payload(self, payload, errors=None):
+        if errors:
+            payload["errors"] = [error.formatted for error in errors]
+        payload["hasNext"] = bool(self.pending)
+        return payload
+
+    #######################
+    # @defer              #
+    #######################
+
+    def execute_fields(self, parent_type, source_value, path, fields):
+        if not self.deferred:
+            return super().execute_fields(parent_type, source_value, path, fields)
+
+        immediate = {}
+        deferred = {}
+        for response_name, field_nodes in fields.items():
+            labels = [self.deferred.get(id(node), IMMEDIATE) for node in field_nodes]
+            # Fields also selected outside of a deferred fragment are not deferred
+            if IMMEDIATE in labels:
+                immediate[response_name] = field_nodes
+            else:
+                deferred.setdefault(labels[0], {})[response_name] = field_nodes
+
+        for label, group in deferred.items():
+            self.pending.append(DeferredFragment(label, parent_type, source_value, path, group))
+        return super().execute_fields(parent_type, source_value, path, immediate)
+
+    def execute_deferred(self, record):
+        errors = len(self.errors)
+        try:
+            data = super().execute_fields(record.parent_type, record.source, record.path, record.fields)
+        except GraphQLError as error:
+            # A non-null field failed
+            self.errors.append(error)
+            data = None
+
+        result = {"data": data, "path": record.path.as_list() if record.path else []}
+        if record.label is not None:
+            result["label"] = record.label
+        if len(self.errors) > errors:
+            result["errors"] = [error.formatted for error in self.errors[errors:]]
+        self.send(self.payload({"incremental": [result]}))
+
+    #######################
+    # @stream             #
+    #######################
+
+    def stream_arguments(self, field_node):
+        key = id(field_node)
+        if key not in self._stream_cache:
+            stream = get_directive_values(StreamDirective, field_node, self.variable_values)
+            if stream is not None and not stream["if"]:
+                stream = None
+            if stream is not None and stream["initialCount"] < 0:
+                raise GraphQLError("initialCount must be a positive integer.", field_node)
+            self._stream_cache[key] = stream
+        return self._stream_cache[key]
+
+    def complete_list_value(self, return_type, field_nodes, info, path, result):
+        if self.send is None or not is_iterable(result):
+            return super().complete_list_value(return_type, field_nodes, info, path, result)
+        stream = self.stream_arguments(field_nodes[0])
+        if stream is None:
+            return super().complete_list_value(return_type, field_nodes, info, path, result)
+
+        items = list(result)
+        count = stream["initialCount"]
+        if len(items) > count:
+            self.pending.append(StreamedItems(stream.get("label"), return_type.of_type, field_nodes, info, path, items, count))
+        return super().complete_list_value(return_type, field_nodes, info, path, items[:count])
+
+    def execute_streamed(self, record):
+        for index in range(record.start, len(record.items)):
+            errors = len(self.errors)
+            item_path = record.path.add_key(index, None)
+            try:
+                items = [self.complete_value(record.item_type, record.field_nodes, record.info, item_path, record.items[index])]
+            except Exception as raw_error:
+                error = located_error(raw_error, record.field_nodes, item_path.as_list())
+                try:
+                    self.handle_field_error(error, record.item_type)
+                    items = [None]
+                except GraphQLError:
+                    # A non-null item failed
+                    self.errors.append(error)
+                    items = None
+
+            result = {"items": items, "path": item_path.as_list()}
+            if record.label is not None:
+                result["label"] = record.label
+            if len(self.errors) > errors:
+                result["errors"] = [error.formatted for error in self.errors[errors:]]
+
+            payload = self.payload({"incremental": [result]})
+            payload["hasNext"] = payload["hasNext"] or index < len(record.items)-1
+            self.send(payload)
@@ -6,7 +6,10 @@ from django.db.models import Q
 
 from django.conf import settings
 
-from learn.models import Language, Sentence, Word
+from learn.models import Language, Course, Sentence, Word, WordForm, Translation
+from learn.cache import batch_content_changes, content_changed
+from learn import search
+from learn.difficulty import Scorer
 
 from multilang import normalize, lemmatize
 from wordfreq import word_frequency, zipf_frequency, iter_wordlist
@@ -26,9 +29,15 @@ class Command(BaseCommand):
         parser.add_argument("target_lang", type=str)
         parser.add_argument("-w", "--nwords", default=10_000, type=int)
         parser.add_argument("-s", "--nsents", type=int, default=float("inf"))
+        parser.add_argument("-p", "--pivot", type=str, help="also translate sentences through this language (for pairs without a direct file)")
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        # Invalidate cached responses only once, after the import is committed
+        with batch_content_changes():
+            self.add_pair(options)
+
+    @transaction.atomic(using=settings.LANGTOOL_CONTENT_DATABASE)
+    def add_pair(self, options):
         self.setup_languages()
 
         self.source = Language.objects.get(code=options["source_lang"])
@@ -37,16 +46,21 @@ class Command(BaseCommand):
         self.nsents = options["nsents"]
 
         self.course, created = Course.objects.get_or_create(known=self.source, learning=self.target)
-        if created:
+        if not created:
             raise CommandError(f"Course {self.course} already exists.")
 
         sent_file = Path("data") / f"{self.target.code}-{self.source.code}.tsv"
         voice_file = Path("data/commonvoice/") / self.target.code / "clips.tsv"
 
-        if not sent_file.exists():
-            raise CommandError(f"Could not find all required file: {sent_file}.")
-
-        self.load_sentences(sent_file)
+        if options["pivot"] is not None:
+            self.pivot = Language.objects.get(code=options["pivot"])
+            if sent_file.exists():
+                self.load_sentences(sent_file, self.target, self.source)
+            self.load_pivot()
+        elif sent_file.exists():
+            self.load_sentences(sent_file, self.target, self.source)
+        else:
+            raise CommandError(f"Could not find all required file: {sent_file} (use --pivot to translate through another language).")
 
         if voice_file.exists():
             self.load_voice(voice_file)
@@ -61,7 +75,7 @@ class Command(BaseCommand):
             for code, name, native_name in settings.LANGTOOL_LANGUAGES
         ], ignore_conflicts=True)
 
-    def load_sentences(self, sent_file):
+    def load_sentences(self, sent_file, lang, trans_lang):
         self.stdout.write(f"Loading {sent_file}.")
         with sent_file.open() as f:
             # Skip BOM
@@ -80,17 +94,39 @@ class Command(BaseCommand):
                 trans, _ = Sentence.objects.get_or_create(
                     link_id=trans_id, 
                     text=trans_text, 
-                    lang=self.source
+                    lang=trans_lang
                 )
                 sent, _ = Sentence.objects.get_or_create(
                     link_id=sent_id, 
                     text=sent_text, 
-                    lang=self.target
+                    lang=lang
                 )
                 sent.translations.add(trans)
 
         self.stdout.write(self.style.SUCCESS("Sentences loaded."))
 
+    def load_pivot(self):
+        """
+        Load both languages paired with the pivot language and translate
+        target sentences to source sentences sharing a pivot sentence.
+        """
+        files = [
+            Path("data") / f"{self.target.code}-{self.pivot.code}.tsv",
+            Path("data") / f"{self.source.code}-{self.pivot.code}.tsv",
+        ]
+        for file in files:
+            if not file.exists():
+                raise CommandError(f"Could not find all required file: {file}.")
+
+        self.load_sentences(files[0], self.target, self.pivot)
+        self.load_sentences(files[1], self.source, self.pivot)
+
+        self.stdout.write(f"Translating {self.target} to {self.source} through {self.pivot}.")
+        added = Translation.objects.add_pivot(self.source, self.target, self.pivot)
+        if added:
+            content_changed()
+        self.stdout.write(self.style.SUCCESS(f"Added {added} translations."))
+
     def link_words(self):
         self.stdout.write(f"Building words for {self.target}.")
 
@@ -120,12 +156,37 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Linking words in {self.target} with sentences.")
 
-        for sent in self.tqdm(Sentence.objects.filter(lang=self.target)):
+        words = dict(Word.objects.filter(lang=self.target).values_list("text", "pk"))
+        # Every distinct surface form is lemmatized only once
+        form_lemmas = {}
+        scorer = Scorer(self.target.code)
+
+        lemmas = []
+        links = []
+        difficulties = []
+        for sent in self.tqdm(Sentence.objects.filter(lang=self.target).select_related("lang")):
+            sent_lemmas = []
             for w in sent.tokens:
-                try:
-                    sent.words.add(Word.objects.get(lang=self.target, text=lemmatize(w, self.target.code)))
-                except Word.DoesNotExist:
-                    pass
+                form = normalize(w, self.target.code)
+                if form not in form_lemmas:
+                    form_lemmas[form] = lemmatize(w, self.target.code)
+                sent_lemmas.append(form_lemmas[form])
+
+            lemmas.append((sent.pk, sent_lemmas))
+            difficulties.append((sent.pk, scorer(sent_lemmas)))
+            links.extend(
+                Sentence.words.through(sentence_id=sent.pk, word_id=words[lw])
+                for lw in set(sent_lemmas) if lw in words
+            )
+
+        Sentence.words.through.objects.bulk_create(links, batch_size=10_000, ignore_conflicts=True)
+        Sentence.objects.set_difficulty(difficulties)
+        search.index_lemmas(lemmas)
+
+        WordForm.objects.bulk_create([
+            WordForm(lang=self.target, form=form, word_id=words[lw])
+            for form, lw in form_lemmas.items() if lw in words and len(form) <= 64
+        ], batch_size=10_000, ignore_conflicts=True)
 
         self.stdout.write(self.style.SUCCESS("Words linked."))
 
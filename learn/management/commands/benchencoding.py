@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from strawberry.django.context import StrawberryDjangoContext
+from strawberry.http import process_result
+
+from learn.api import schema
+from learn.models import User
+
+from pathlib import Path
+import statistics
+import msgpack
+import json
+import gzip
+import time
+
+
+DEFAULT_QUERY = """
+query {
+  words(pagination: {limit: 20}) {
+    id
+    text
+    randomSentence {
+      id
+      text
+      tokens
+      lemmas
+      spans
+      translations {
+        text
+      }
+    }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare size and encoding time of JSON and msgpack GraphQL responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-q", "--query", type=Path, help="file with the GraphQL query to encode the result of")
+        parser.add_argument("-u", "--user", type=str, help="username to run the query as")
+        parser.add_argument("-n", "--repetitions", default=1000, type=int)
+
+    def handle(self, *args, **options):
+        if options["query"] is not None:
+            if not options["query"].exists():
+                raise CommandError(f"Could not find query file {options['query']}.")
+            query = options["query"].read_text()
+        else:
+            query = DEFAULT_QUERY
+
+        request = RequestFactory().post("/graphql/")
+        if options["user"] is not None:
+            try:
+                request.user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist.")
+        else:
+            request.user = AnonymousUser()
+
+        result = schema.execute_sync(query, context_value=StrawberryDjangoContext(request=request, response=None))
+        if result.errors:
+            raise CommandError(f"The query failed: {result.errors[0].message}")
+        data = process_result(result)
+
+        self.stdout.write(f"Encoding the result {options['repetitions']} times.")
+        self.stdout.write(f"{'format':<10}{'bytes':>10}{'gzipped':>10}{'encode µs':>12}{'decode µs':>12}")
+        for name, dumps, loads in (
+            ("json", lambda d: json.dumps(d).encode(), json.loads),
+            ("msgpack", msgpack.packb, msgpack.unpackb),
+        ):
+            encoded = dumps(data)
+            encode = self.measure(dumps, data, options["repetitions"])
+            decode = self.measure(loads, encoded, options["repetitions"])
+            self.stdout.write(
+                f"{name:<10}{len(encoded):>10}{len(gzip.compress(encoded)):>10}"
+                f"{encode*1e6:>12.1f}{decode*1e6:>12.1f}"
+            )
+
+    def measure(self, func, arg, repetitions):
+        times = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            func(arg)
+            times.append(time.perf_counter()-start)
+        return statistics.median(times)
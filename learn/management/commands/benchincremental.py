@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from strawberry.django.context import StrawberryDjangoContext
+from strawberry.http import process_result
+
+from learn.api import schema
+from learn.models import User
+
+from pathlib import Path
+import statistics
+import json
+import time
+
+
+DEFAULT_QUERY = """
+query {
+  words(pagination: {limit: 20}) @stream(initialCount: 1) {
+    id
+    text
+    ... @defer {
+      randomSentence {
+        id
+        text
+        tokens
+        lemmas
+        spans
+        translations {
+          text
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare time to the first payload of an incremental (@defer/@stream) result with the full result"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-q", "--query", type=Path, help="file with the GraphQL query (with @defer or @stream)")
+        parser.add_argument("-u", "--user", type=str, help="username to run the query as")
+        parser.add_argument("-n", "--repetitions", default=20, type=int)
+
+    def handle(self, *args, **options):
+        if options["query"] is not None:
+            if not options["query"].exists():
+                raise CommandError(f"Could not find query file {options['query']}.")
+            query = options["query"].read_text()
+        else:
+            query = DEFAULT_QUERY
+
+        user = AnonymousUser()
+        if options["user"] is not None:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist.")
+
+        full = []
+        first = []
+        total = []
+        for _ in range(options["repetitions"]):
+            full.append(self.full(query, user))
+            first_seconds, total_seconds, payloads = self.incremental(query, user)
+            first.append(first_seconds)
+            total.append(total_seconds)
+
+        self.stdout.write(f"Median of {options['repetitions']} runs, the incremental result has {payloads} payloads:")
+        self.stdout.write(f"  full response:         {statistics.median(full)*1000:8.1f} ms")
+        self.stdout.write(f"  first payload:         {statistics.median(first)*1000:8.1f} ms")
+        self.stdout.write(f"  all payloads:          {statistics.median(total)*1000:8.1f} ms")
+
+    def request(self, user):
+        request = RequestFactory().post("/graphql/")
+        request.user = user
+        return request
+
+    def full(self, query, user):
+        start = time.perf_counter()
+        result = schema.execute_sync(query, context_value=StrawberryDjangoContext(request=self.request(user), response=None))
+        if result.errors:
+            raise CommandError(f"The query failed: {result.errors[0].message}")
+        json.dumps(process_result(result))
+        return time.perf_counter()-start
+
+    def incremental(self, query, user):
+        times = []
+
+        def send(payload):
+            # Encoded as a part of the multipart response would be
+            json.dumps(payload)
+            times.append(time.perf_counter())
+
+        request = self.request(user)
+        request.graphql_incremental = send
+
+        start = time.perf_counter()
+        result = schema.execute_sync(query, context_value=StrawberryDjangoContext(request=request, response=None))
+        if result.errors:
+            raise CommandError(f"The query failed: {result.errors[0].message}")
+        if not times:
+            raise CommandError("Nothing was sent incrementally.")
+        return times[0]-start, times[-1]-start, len(times)
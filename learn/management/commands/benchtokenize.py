@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from learn.models import Language, Sentence
+from multilang import tokenizers, tokenize, nltk_tokenize
+
+import time
+
+
+class Command(BaseCommand):
+    help = "Compare the regex tokenizers (multilang.tokenize) with nltk.word_tokenize on a sample of sentences"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-l", "--lang", type=str, help="code of the language (all languages with a tokenizer if omitted)")
+        parser.add_argument("-n", "--sample", default=5000, type=int, help="sentences per language")
+        parser.add_argument("--show", default=10, type=int, help="differing sentences to print")
+
+    def handle(self, *args, **options):
+        codes = sorted(tokenizers) if options["lang"] is None else [options["lang"]]
+        for code in codes:
+            if code not in tokenizers:
+                raise CommandError(f"There is no tokenizer for {code}.")
+
+        self.stdout.write(f"{'lang':<6}{'sentences':>10}{'same':>8}{'nltk µs':>10}{'regex µs':>10}{'speedup':>9}")
+        for code in codes:
+            try:
+                language = Language.objects.get(code=code)
+            except Language.DoesNotExist:
+                continue
+            texts = list(Sentence.objects.filter(lang=language).order_by("?").values_list("text", flat=True)[:options["sample"]])
+            if not texts:
+                continue
+
+            try:
+                expected, nltk_seconds = self.measure(lambda text: nltk_tokenize(text, language.name.lower()), texts)
+            except LookupError:
+                raise CommandError("Punkt models are missing, download them by python3 -m nltk.downloader punkt.")
+            results, regex_seconds = self.measure(lambda text: tokenize(text, code), texts)
+
+            different = [(text, e, r) for text, e, r in zip(texts, expected, results) if e != r]
+            for text, (expected_tokens, expected_spans), (tokens, spans) in different[:options["show"]]:
+                self.stdout.write(f"  {text}")
+                if tokens != expected_tokens:
+                    self.stdout.write(f"    nltk:  {expected_tokens}")
+                    self.stdout.write(f"    regex: {tokens}")
+                else:
+                    self.stdout.write(f"    nltk:  {expected_spans}")
+                    self.stdout.write(f"    regex: {spans}")
+
+            self.stdout.write(
+                f"{code:<6}{len(texts):>10}{(1 - len(different)/len(texts))*100:>7.2f}%"
+                f"{nltk_seconds/len(texts)*1e6:>10.1f}{regex_seconds/len(texts)*1e6:>10.1f}"
+                f"{nltk_seconds/regex_seconds:>8.1f}x"
+            )
+
+    def measure(self, func, texts):
+        start = time.perf_counter()
+        results = [func(text) for text in texts]
+        return results, time.perf_counter()-start
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django.db import transaction, connection, OperationalError
+
+from langtool.db import write_queue
+from learn.models import User, Word, UserWordProgress
+
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent attempt writes with and without the write queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-t", "--threads", default=16, type=int)
+        parser.add_argument("-n", "--attempts", default=100, type=int, help="attempts per thread")
+
+    def handle(self, *args, **options):
+        self.words = list(Word.objects.all()[:1000])
+        if not self.words:
+            raise CommandError("There are no words to attempt, add a language pair first.")
+
+        self.users = [
+            User.objects.create(username=f"benchwrites-{i}")
+            for i in range(options["threads"])
+        ]
+
+        try:
+            for mode, description in (("direct", "directly"), ("queue", "through the write queue")):
+                self.stdout.write(f"Writing {description} with {options['threads']} threads.")
+                self.report(*self.run(mode, options["attempts"]))
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in self.users]).delete()
+
+    @staticmethod
+    def attempt(user, word):
+        progress, _ = UserWordProgress.objects.get_or_create(user=user, word=word)
+        progress.attempt(random.random() < 0.8)
+
+    def worker(self, mode, user, attempts):
+        latencies = []
+        errors = 0
+        try:
+            for _ in range(attempts):
+                word = random.choice(self.words)
+                start = time.perf_counter()
+                try:
+                    if mode == "queue":
+                        write_queue.submit(self.attempt, user, word)
+                    else:
+                        with transaction.atomic():
+                            self.attempt(user, word)
+                except OperationalError:
+                    # database is locked
+                    errors += 1
+                latencies.append(time.perf_counter()-start)
+        finally:
+            connection.close()
+        return latencies, errors
+
+    def run(self, mode, attempts):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.users)) as pool:
+            results = list(pool.map(lambda user: self.worker(mode, user, attempts), self.users))
+        elapsed = time.perf_counter()-start
+
+        latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+        errors = sum(worker_errors for _, worker_errors in results)
+        return latencies, errors, elapsed
+
+    def report(self, latencies, errors, elapsed):
+        q = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"  throughput: {(len(latencies)-errors)/elapsed:.1f} attempts/s\n"
+            f"  latency p50: {q[49]*1000:.1f} ms, p95: {q[94]*1000:.1f} ms, p99: {q[98]*1000:.1f} ms\n"
+            f"  database is locked errors: {errors}"
+        )
@@ -0,0 +1,148 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.conf import settings
+
+from learn.models import Sentence, Translation
+from learn.cache import batch_content_changes, content_changed
+from langtool.routers import content_connection
+
+import unicodedata
+import hashlib
+import re
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(lang_id, text):
+    """64-bit hash of the normalized text of a sentence."""
+    digest = hashlib.blake2b(f"{lang_id}\0{normalize_text(text)}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class Command(BaseCommand):
+    help = "Merge sentences with the same language and (normalized) text"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--dry-run", action="store_true", help="only count the duplicates")
+        parser.add_argument("--no-vacuum", action="store_true", help="don't VACUUM the database afterwards")
+
+    def handle(self, *args, **options):
+        duplicates = self.find_duplicates()
+        canonical = len(set(duplicates.values()))
+        self.stdout.write(f"Found {len(duplicates)} duplicates of {canonical} sentences.")
+        if options["dry_run"] or not duplicates:
+            return
+
+        size_before = self.database_size()
+        links_before = self.link_counts()
+
+        with batch_content_changes():
+            self.merge(duplicates)
+            content_changed()
+
+        if not options["no_vacuum"]:
+            self.stdout.write("Vacuuming the database.")
+            with content_connection().cursor() as cursor:
+                cursor.execute("VACUUM")
+
+        size_after = self.database_size()
+        links_after = self.link_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {len(duplicates)} sentences into {canonical}, "
+            f"removed {links_before[0]-links_after[0]} translation and {links_before[1]-links_after[1]} word links. "
+            f"Database size {size_before/2**20:.1f} MiB -> {size_after/2**20:.1f} MiB "
+            f"(saved {(size_before-size_after)/2**20:.1f} MiB)."
+        ))
+
+    def find_duplicates(self):
+        """
+        Map ids of duplicate sentences to the id of their canonical sentence
+        (the oldest one). Only hashes are kept in memory, texts of the
+        candidates are compared afterwards to rule out collisions.
+        """
+        first = {}
+        candidates = {}
+        for pk, lang_id, text in Sentence.objects.order_by("pk").values_list("pk", "lang_id", "text").iterator(chunk_size=10_000):
+            key = text_hash(lang_id, text)
+            if key in first:
+                candidates[pk] = first[key]
+            else:
+                first[key] = pk
+        del first
+
+        duplicates = {}
+        ids = list(candidates.items())
+        for i in range(0, len(ids), 10_000):
+            batch = ids[i:i+10_000]
+            texts = Sentence.objects.in_bulk([pk for pair in batch for pk in pair])
+            for pk, canonical in batch:
+                if texts[pk].lang_id == texts[canonical].lang_id and normalize_text(texts[pk].text) == normalize_text(texts[canonical].text):
+                    duplicates[pk] = canonical
+        return duplicates
+
+    @transaction.atomic(using=settings.LANGTOOL_CONTENT_DATABASE)
+    def merge(self, duplicates):
+        self.stdout.write("Merging links.")
+        translations = Translation._meta.db_table
+        words = Sentence.words.through._meta.db_table
+        sentences = Sentence._meta.db_table
+
+        with content_connection().cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE compact_map (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+            try:
+                cursor.executemany("INSERT INTO compact_map VALUES (%s, %s)", list(duplicates.items()))
+
+                # Repoint links of duplicates to the canonical sentences, direct translations first
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {translations} (from_sentence_id, to_sentence_id, pivot_id, pivot_link_id)
+                    SELECT from_id, to_id, pivot_id, pivot_link_id FROM (
+                        SELECT COALESCE(f.new_id, t.from_sentence_id) AS from_id, COALESCE(o.new_id, t.to_sentence_id) AS to_id,
+                               t.pivot_id, t.pivot_link_id
+                        FROM {translations} t
+                        LEFT JOIN compact_map f ON f.old_id = t.from_sentence_id
+                        LEFT JOIN compact_map o ON o.old_id = t.to_sentence_id
+                        WHERE f.old_id IS NOT NULL OR o.old_id IS NOT NULL
+                    )
+                    WHERE from_id != to_id
+                    ORDER BY pivot_id IS NOT NULL
+                """)
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {words} (sentence_id, word_id)
+                    SELECT m.new_id, w.word_id FROM {words} w JOIN compact_map m ON m.old_id = w.sentence_id
+                """)
+
+                # Keep audio and link ids of duplicates missing on the canonical sentence
+                for field, has_value in [("audio", "{0}.audio IS NOT NULL AND {0}.audio != ''"), ("link_id", "{0}.link_id IS NOT NULL")]:
+                    cursor.execute(f"""
+                        UPDATE {sentences} SET {field} = (
+                            SELECT MIN(d.{field}) FROM compact_map m JOIN {sentences} d ON d.id = m.old_id
+                            WHERE m.new_id = {sentences}.id AND {has_value.format("d")}
+                        )
+                        WHERE NOT ({has_value.format(sentences)}) AND id IN (
+                            SELECT m.new_id FROM compact_map m JOIN {sentences} d ON d.id = m.old_id
+                            WHERE {has_value.format("d")}
+                        )
+                    """)
+
+                self.stdout.write("Deleting duplicates.")
+                cursor.execute(f"""
+                    DELETE FROM {translations}
+                    WHERE from_sentence_id IN (SELECT old_id FROM compact_map) OR to_sentence_id IN (SELECT old_id FROM compact_map)
+                """)
+                cursor.execute(f"DELETE FROM {words} WHERE sentence_id IN (SELECT old_id FROM compact_map)")
+                # The full-text index is kept in sync by triggers
+                cursor.execute(f"DELETE FROM {sentences} WHERE id IN (SELECT old_id FROM compact_map)")
+            finally:
+                cursor.execute("DROP TABLE compact_map")
+
+    def link_counts(self):
+        return Translation.objects.count(), Sentence.words.through.objects.count()
+
+    def database_size(self):
+        with content_connection().cursor() as cursor:
+            cursor.execute("PRAGMA page_count")
+            pages = cursor.fetchone()[0]
+            cursor.execute("PRAGMA page_size")
+            return pages*cursor.fetchone()[0]
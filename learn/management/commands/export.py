@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from learn import export
+
+from pathlib import Path
+import gzip
+import sys
+
+
+class Command(BaseCommand):
+    help = "Export progress, words or sentences as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(export.EXPORTS))
+        parser.add_argument("-f", "--format", default="ndjson", choices=list(export.FORMATS))
+        parser.add_argument("-c", "--course", type=int, help="id of the course")
+        parser.add_argument("--since", type=str, help="only progress changed since this date or datetime")
+        parser.add_argument("--until", type=str, help="only progress changed before this date or datetime")
+        parser.add_argument("-o", "--output", type=Path, help="output file (standard output if omitted)")
+        parser.add_argument("-z", "--gzip", action="store_true", help="compress the output (implied by a .gz output)")
+
+    def handle(self, *args, **options):
+        try:
+            columns, rows = export.export(
+                options["kind"],
+                course=options["course"],
+                since=options["since"],
+                until=options["until"],
+            )
+            lines = export.encode(columns, rows, options["format"])
+        except export.ExportError as e:
+            raise CommandError(str(e))
+
+        output = options["output"]
+        compress = options["gzip"] or (output is not None and output.suffix == ".gz")
+
+        if output is None and not compress:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        if output is None:
+            f = gzip.open(sys.stdout.buffer, "wt", encoding="utf-8")
+        elif compress:
+            f = gzip.open(output, "wt", encoding="utf-8", newline="")
+        else:
+            f = output.open("w", encoding="utf-8", newline="")
+
+        count = 0
+        with f:
+            for line in lines:
+                f.write(line)
+                count += 1
+
+        if output is not None:
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} lines to {output}."))
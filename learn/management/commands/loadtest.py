@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import urllib.request
+import urllib.error
+import statistics
+import json
+import time
+
+
+DEFAULT_QUERY = """
+query {
+  words(pagination: {limit: 20}) {
+    text
+    randomSentence {
+      text
+      translations {
+        text
+      }
+    }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure concurrency of running GraphQL servers, e.g. a WSGI and an ASGI deployment"
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", type=str, help="GraphQL endpoints to compare")
+        parser.add_argument("-c", "--concurrency", default=32, type=int)
+        parser.add_argument("-n", "--requests", default=1000, type=int)
+        parser.add_argument("-q", "--query", type=Path, help="file with the GraphQL query to send")
+        parser.add_argument("-t", "--token", type=str, help="JWT token to authenticate with")
+
+    def handle(self, *args, **options):
+        if options["query"] is not None:
+            if not options["query"].exists():
+                raise CommandError(f"Could not find query file {options['query']}.")
+            query = options["query"].read_text()
+        else:
+            query = DEFAULT_QUERY
+
+        self.body = json.dumps({"query": query}).encode()
+        self.headers = {"Content-Type": "application/json"}
+        if options["token"] is not None:
+            self.headers["Authorization"] = f"Bearer {options['token']}"
+
+        for url in options["urls"]:
+            self.stdout.write(f"Loading {url} with {options['concurrency']} concurrent clients.")
+            self.report(*self.run(url, options["concurrency"], options["requests"]))
+
+    def request(self, url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=self.body, headers=self.headers)) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter()-start, ok
+
+    def run(self, url, concurrency, requests):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: self.request(url), range(requests)))
+        elapsed = time.perf_counter()-start
+
+        latencies = [latency for latency, ok in results if ok]
+        errors = len(results)-len(latencies)
+        return latencies, errors, elapsed
+
+    def report(self, latencies, errors, elapsed):
+        if len(latencies) < 2:
+            self.stdout.write(self.style.ERROR(f"Too many failed requests ({errors})."))
+            return
+
+        q = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"  throughput: {len(latencies)/elapsed:.1f} req/s\n"
+            f"  latency p50: {q[49]*1000:.1f} ms, p95: {q[94]*1000:.1f} ms, p99: {q[98]*1000:.1f} ms\n"
+            f"  errors: {errors}"
+        )
@@ -0,0 +1,184 @@
+from django.core.management.base import CommandError
+from django_tqdm import BaseCommand
+
+from django.db import transaction, connection, OperationalError
+
+from langtool.routers import ids
+from learn.models import Language, Word, UserWordProgress, PackedProgress, DueCounter
+from learn import packed
+
+from itertools import groupby
+import numpy as np
+import tracemalloc
+import time
+
+
+class Command(BaseCommand):
+    help = "Migrate user word progress between rows and packed blobs, or compare the two"
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--unpack", action="store_true", help="convert packed blobs back to rows")
+        group.add_argument("--compare", action="store_true", help="compare memory and latency of rows and packed blobs (changes nothing)")
+        parser.add_argument("--keep", action="store_true", help="keep the converted rows (or blobs)")
+        parser.add_argument("-u", "--users", default=100, type=int, help="number of users to compare")
+        parser.add_argument("-b", "--batch", default=500, type=int)
+
+    def handle(self, *args, **options):
+        self.batch = options["batch"]
+        self.word_ids = {}
+
+        if options["unpack"]:
+            self.unpack(keep=options["keep"])
+        elif options["compare"]:
+            self.compare(options["users"])
+        else:
+            self.pack(keep=options["keep"])
+
+    def words(self, lang):
+        """Ids of the words of a language for UserWordProgress.word__in, words may be in another database."""
+        if lang not in self.word_ids:
+            self.word_ids[lang] = ids(Word.objects.filter(lang_id=lang).values_list("pk", flat=True), UserWordProgress)
+        return self.word_ids[lang]
+
+    @transaction.atomic
+    def pack(self, keep=False):
+        """Move progress rows into blobs (turn LANGTOOL_PACKED_PROGRESS on afterwards)."""
+        self.stdout.write("Packing progress rows.")
+
+        blobs = []
+        for lang in Language.objects.values_list("pk", flat=True):
+            rows = (
+                UserWordProgress.objects
+                .filter(word__in=self.words(lang))
+                .order_by("user", "word")
+                .values_list("user", "word", "alpha", "beta", "interval", "last_review", "updated")
+                .iterator(chunk_size=10_000)
+            )
+
+            for user, group in self.tqdm(groupby(rows, key=lambda r: r[0])):
+                array = np.array([
+                    packed.from_progress(UserWordProgress(
+                        word_id=word, alpha=alpha, beta=beta, interval=interval, last_review=last_review, updated=updated
+                    ))
+                    for _, word, alpha, beta, interval, last_review, updated in group
+                ], dtype=packed.DTYPE)
+                blobs.append(PackedProgress(user_id=user, lang_id=lang, data=packed.pack(array)))
+
+                if len(blobs) >= self.batch:
+                    self.save_blobs(blobs)
+                    blobs = []
+        self.save_blobs(blobs)
+
+        if not keep:
+            UserWordProgress.objects.all().delete()
+        self.stdout.write(self.style.SUCCESS("Progress packed."))
+
+    def save_blobs(self, blobs):
+        PackedProgress.objects.bulk_create(
+            blobs,
+            update_conflicts=True,
+            unique_fields=["user", "lang"],
+            update_fields=["data", "updated"],
+        )
+
+    @transaction.atomic
+    def unpack(self, keep=False):
+        """Move blobs back into progress rows (turn LANGTOOL_PACKED_PROGRESS off afterwards)."""
+        self.stdout.write("Unpacking progress blobs.")
+
+        users = set()
+        for blob in self.tqdm(PackedProgress.objects.select_related("user").iterator(chunk_size=self.batch)):
+            UserWordProgress.objects.filter(user=blob.user, word__in=self.words(blob.lang_id)).delete()
+            rows = [packed.to_progress(row, blob.user) for row in packed.unpack(blob.data)]
+            updated = [progress.updated for progress in rows]
+            UserWordProgress.objects.bulk_create(rows, batch_size=self.batch)
+
+            # bulk_create sets updated to now, sync watermarks rely on the original times
+            for progress, original in zip(rows, updated):
+                if original is not None:
+                    progress.updated = original
+            UserWordProgress.objects.bulk_update(rows, ["updated"], batch_size=self.batch)
+            users.add(blob.user_id)
+
+        users = list(users)
+        for i in range(0, len(users), self.batch):
+            DueCounter.objects.rebuild(users[i:i+self.batch])
+
+        if not keep:
+            PackedProgress.objects.all().delete()
+        self.stdout.write(self.style.SUCCESS("Progress unpacked."))
+
+    def measure(self, func):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter()-start
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def compare(self, n):
+        # Both storages are filled in a transaction that is rolled back
+        with transaction.atomic():
+            if not PackedProgress.objects.exists():
+                self.pack(keep=True)
+            elif not UserWordProgress.objects.exists():
+                self.unpack(keep=True)
+            self.report(n)
+            transaction.set_rollback(True)
+
+    def report(self, n):
+        blobs = [
+            (blob, packed.unpack(blob.data)[:1])
+            for blob in PackedProgress.objects.select_related("user")[:n]
+        ]
+        blobs = [(blob, int(first["word"][0])) for blob, first in blobs if len(first)]
+        if not blobs:
+            raise CommandError("There is no progress to compare.")
+        words = {word.pk: word for word in Word.objects.filter(pk__in=[word for _, word in blobs])}
+
+        def rows():
+            for blob, _ in blobs:
+                [p.predict() for p in UserWordProgress.objects.filter(user=blob.user_id, word__in=self.words(blob.lang_id))]
+
+        def arrays():
+            for blob, _ in blobs:
+                packed.predict(packed.store.load(blob.user_id, blob.lang_id))
+
+        rows_time, rows_memory = self.measure(rows)
+        arrays_time, arrays_memory = self.measure(arrays)
+
+        self.stdout.write(f"Predicting all progress of {len(blobs)} users:")
+        self.stdout.write(f"  rows:   {rows_time/len(blobs)*1000:.2f} ms/user, peak memory {rows_memory/1024:.0f} KiB")
+        self.stdout.write(f"  packed: {arrays_time/len(blobs)*1000:.2f} ms/user, peak memory {arrays_memory/1024:.0f} KiB")
+
+        def attempt_rows():
+            for blob, word in blobs:
+                UserWordProgress.objects.get(user=blob.user_id, word=word).attempt(True)
+
+        def attempt_packed():
+            for blob, word in blobs:
+                packed.store.attempt(blob.user, words[word], True)
+
+        rows_time, _ = self.measure(attempt_rows)
+        arrays_time, _ = self.measure(attempt_packed)
+
+        self.stdout.write(f"Reviewing a word of {len(blobs)} users:")
+        self.stdout.write(f"  rows:   {rows_time/len(blobs)*1000:.2f} ms/review")
+        self.stdout.write(f"  packed: {arrays_time/len(blobs)*1000:.2f} ms/review")
+
+        packed_size = sum(len(data) for data in PackedProgress.objects.values_list("data", flat=True))
+        self.stdout.write(f"Packed storage: {packed_size/1024:.0f} KiB")
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE %s",
+                    [f"{UserWordProgress._meta.db_table}%"]
+                )
+                rows_size = cursor.fetchone()[0] or 0
+            self.stdout.write(f"Row storage (with indexes): {rows_size/1024:.0f} KiB")
+        except OperationalError:
+            self.stdout.write(self.style.NOTICE("Notice: SQLite is compiled without dbstat, row storage size unknown."))
@@ -0,0 +1,199 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections, transaction, DatabaseError
+from django.test import RequestFactory
+
+from strawberry.django.context import StrawberryDjangoContext
+
+from learn.api import schema
+from learn.models import User
+
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+import cProfile
+import pstats
+import json
+import time
+import sys
+import os
+
+
+class StackProfiler:
+    """
+    Deterministic profiler recording the time spent in every call stack,
+    written in the collapsed format of flamegraph.pl (and speedscope).
+    """
+
+    def __init__(self):
+        self.stacks = defaultdict(float)
+        self.stack = []
+        self.last = None
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if self.stack:
+            self.stacks[";".join(self.stack)] += now-self.last
+
+        if event == "call":
+            code = frame.f_code
+            self.stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        elif event == "c_call":
+            self.stack.append(getattr(arg, "__qualname__", repr(arg)))
+        elif self.stack:
+            # return, c_return and c_exception
+            self.stack.pop()
+
+        self.last = time.perf_counter()
+
+    def run(self, func):
+        sys.setprofile(self)
+        try:
+            func()
+        finally:
+            sys.setprofile(None)
+
+    def write(self, f):
+        for stack, seconds in sorted(self.stacks.items()):
+            f.write(f"{stack} {round(seconds*1e6)}\n")
+
+
+class Command(BaseCommand):
+    help = "Profile a GraphQL operation and explain its SQL queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("query", type=Path, help="file with the GraphQL operation")
+        parser.add_argument("-V", "--variables", type=str, default="{}", help="variables as JSON, or a JSON file")
+        parser.add_argument("-u", "--user", type=str, help="username to run the operation as")
+        parser.add_argument("-n", "--repetitions", default=10, type=int)
+        parser.add_argument("-o", "--output", type=Path, help="write the pstats dump to this file")
+        parser.add_argument("--collapsed", type=Path, help="write collapsed stacks (for flame graphs) to this file")
+        parser.add_argument("--sort", default="cumulative", type=str, help="pstats sort key")
+        parser.add_argument("--top", default=30, type=int, help="number of functions to print")
+        parser.add_argument("--commit", action="store_true", help="commit the changes of mutations")
+
+    def handle(self, *args, **options):
+        if not options["query"].exists():
+            raise CommandError(f"Could not find query file {options['query']}.")
+        self.query = options["query"].read_text()
+
+        variables = options["variables"]
+        # Inline JSON can be longer than a path may be
+        if not variables.lstrip().startswith("{") and Path(variables).is_file():
+            variables = Path(variables).read_text()
+        try:
+            self.variables = json.loads(variables)
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Invalid variables: {e}.")
+
+        self.request = RequestFactory().post("/graphql/")
+        if options["user"] is not None:
+            try:
+                self.request.user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist.")
+        else:
+            self.request.user = AnonymousUser()
+        self.commit = options["commit"]
+
+        # Warm up (and fail early)
+        self.run_operation()
+
+        self.profile(options)
+        if options["collapsed"] is not None:
+            profiler = StackProfiler()
+            profiler.run(lambda: self.repeat(options["repetitions"]))
+            with options["collapsed"].open("w") as f:
+                profiler.write(f)
+            self.stdout.write(f"Collapsed stacks written to {options['collapsed']}.")
+
+        self.explain()
+
+    def run_operation(self):
+        with transaction.atomic():
+            result = schema.execute_sync(
+                self.query,
+                variable_values=self.variables,
+                context_value=StrawberryDjangoContext(request=self.request, response=None)
+            )
+            if not self.commit:
+                transaction.set_rollback(True)
+
+        if result.errors:
+            raise CommandError(f"The operation failed: {result.errors[0].message}")
+        return result
+
+    def repeat(self, n):
+        for _ in range(n):
+            self.run_operation()
+
+    def profile(self, options):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.runcall(self.repeat, options["repetitions"])
+        elapsed = time.perf_counter()-start
+
+        self.stdout.write(f"{options['repetitions']} executions, {elapsed/options['repetitions']*1000:.1f} ms each (profiled).")
+        stats = pstats.Stats(profile, stream=self.stdout)
+        stats.sort_stats(options["sort"]).print_stats(options["top"])
+
+        if options["output"] is not None:
+            stats.dump_stats(options["output"])
+            self.stdout.write(f"Profile written to {options['output']}, view it e.g. with snakeviz.")
+
+    def explain(self):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                statements.append((context["connection"].alias, sql, params, time.perf_counter()-start))
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            self.run_operation()
+
+        # Group executions of the same statement (in the same database)
+        grouped = {}
+        for alias, sql, params, seconds in statements:
+            if (alias, sql) not in grouped:
+                grouped[alias, sql] = {"params": params, "count": 0, "seconds": 0.}
+            grouped[alias, sql]["count"] += 1
+            grouped[alias, sql]["seconds"] += seconds
+
+        total = sum(seconds for *_, seconds in statements)
+        self.stdout.write(f"\n{len(statements)} SQL statements ({len(grouped)} distinct), {total*1000:.1f} ms:")
+
+        for i, ((alias, sql), info) in enumerate(grouped.items(), 1):
+            flags = []
+            if info["count"] > 1:
+                flags.append(f"repeated {info['count']}x")
+
+            plan = self.query_plan(alias, sql, info["params"])
+            if any(line.startswith("SCAN ") and " INDEX " not in line for line in plan):
+                flags.append("full table scan")
+            if any("TEMP B-TREE" in line for line in plan):
+                flags.append("temporary sort")
+
+            header = f"\n{i}. {info['count']}x, {info['seconds']*1000:.2f} ms"
+            if len(connections.all()) > 1:
+                header += f" on {alias}"
+            if flags:
+                header += " " + self.style.WARNING(f"[{', '.join(flags)}]")
+            self.stdout.write(header)
+            self.stdout.write(f"   {sql}")
+            for line in plan:
+                self.stdout.write(f"     {line}")
+
+    def query_plan(self, alias, sql, params):
+        if not sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return []
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                return [row[-1] for row in cursor.fetchall()]
+        except DatabaseError as e:
+            return [f"(could not explain: {e})"]
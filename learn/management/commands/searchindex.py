@@ -0,0 +1,33 @@
+from django_tqdm import BaseCommand
+
+from django.db import transaction
+
+from learn.models import Sentence
+from learn import search
+
+from multilang import supported
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text sentence search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lemmas", action="store_true", help="index lemmas of the sentences too (slow)")
+        parser.add_argument("-b", "--batch", default=1000, type=int)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.stdout.write("Indexing sentences.")
+        search.rebuild()
+
+        if options["lemmas"]:
+            self.stdout.write("Indexing lemmas.")
+            rows = []
+            for sent in self.tqdm(Sentence.objects.filter(lang__code__in=supported).only("text", "lang").iterator(chunk_size=options["batch"])):
+                rows.append((sent.pk, sent.lemmas))
+                if len(rows) >= options["batch"]:
+                    search.index_lemmas(rows)
+                    rows = []
+            search.index_lemmas(rows)
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
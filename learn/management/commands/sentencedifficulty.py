@@ -0,0 +1,42 @@
+from django_tqdm import BaseCommand
+
+from django.db import transaction
+from django.conf import settings
+
+from learn.models import Sentence
+from learn.difficulty import Scorer
+from learn.cache import batch_content_changes, content_changed
+
+from multilang import supported
+
+
+class Command(BaseCommand):
+    help = "Recompute the difficulty of sentences (computed by addpair on import)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-l", "--lang", type=str, help="code of the language (all supported languages if omitted)")
+        parser.add_argument("-b", "--batch", default=1000, type=int)
+
+    def handle(self, *args, **options):
+        with batch_content_changes():
+            self.recompute(options)
+            content_changed()
+
+    @transaction.atomic(using=settings.LANGTOOL_CONTENT_DATABASE)
+    def recompute(self, options):
+        sentences = Sentence.objects.filter(lang__code__in=supported).only("text", "lang")
+        if options["lang"] is not None:
+            sentences = sentences.filter(lang_id=options["lang"])
+
+        scorers = {}
+        rows = []
+        for sent in self.tqdm(sentences.iterator(chunk_size=options["batch"])):
+            if sent.lang_id not in scorers:
+                scorers[sent.lang_id] = Scorer(sent.lang_id)
+            rows.append((sent.pk, scorers[sent.lang_id](sent.lemmas)))
+            if len(rows) >= options["batch"]:
+                Sentence.objects.set_difficulty(rows)
+                rows = []
+        Sentence.objects.set_difficulty(rows)
+
+        self.stdout.write(self.style.SUCCESS("Difficulty recomputed."))
@@ -0,0 +1,277 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections, OperationalError
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.timezone import timedelta
+
+from strawberry.django.context import StrawberryDjangoContext
+
+from langtool.jwtauth import create_jwt_token
+from learn.api import schema
+from learn.models import User, Course, Word, UserWordProgress, DueCounter
+from learn import metrics
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import urllib.request
+import urllib.error
+import statistics
+import random
+import json
+import time
+import re
+
+
+SESSION_QUERY = """
+query ($now: DateTime) {
+  progresses(filters: {scheduledReview: {lte: $now}}, order: {scheduledReview: ASC}, pagination: {limit: 10}) {
+    word {
+      id
+    }
+    prediction(exact: true)
+  }
+}
+"""
+
+NEW_WORDS_QUERY = """
+query ($lang: String, $limit: Int!) {
+  words(filters: {new: true, lang: {code: $lang}}, pagination: {limit: $limit}) {
+    id
+  }
+}
+"""
+
+RANDOM_SENTENCE_QUERY = """
+query ($word: ID!) {
+  word(id: $word) {
+    randomSentence {
+      text
+      translations {
+        text
+      }
+    }
+  }
+}
+"""
+
+ATTEMPT_MUTATION = """
+mutation ($word: ID!, $success: Boolean!) {
+  attempt(id: $word, success: $success) {
+    id
+  }
+}
+"""
+
+
+class SimulationError(Exception):
+    pass
+
+
+class InProcessClient:
+    def __init__(self, user):
+        self.user = user
+
+    def execute(self, query, variables):
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user or AnonymousUser()
+
+        result = schema.execute_sync(
+            query,
+            variable_values=variables,
+            context_value=StrawberryDjangoContext(request=request, response=None)
+        )
+        if result.errors:
+            raise SimulationError(result.errors[0].message)
+        return result.data
+
+
+class HTTPClient:
+    def __init__(self, url, token):
+        self.url = url
+        self.headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+
+    def execute(self, query, variables):
+        body = json.dumps({"query": query, "variables": variables}).encode()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url, data=body, headers=self.headers)) as response:
+                result = json.loads(response.read())
+        except (urllib.error.URLError, OSError) as e:
+            raise SimulationError(str(e))
+
+        if result.get("errors"):
+            raise SimulationError(result["errors"][0]["message"])
+        return result["data"]
+
+
+class Command(BaseCommand):
+    help = "Simulate learners studying concurrently, in-process or against a running server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-u", "--users", default=100, type=int, help="number of simulated learners")
+        parser.add_argument("-c", "--concurrency", default=16, type=int)
+        parser.add_argument("-d", "--duration", default=30, type=float, help="seconds to simulate")
+        parser.add_argument("-l", "--lang", type=str, help="code of the learned language")
+        parser.add_argument("-k", "--known", default=200, type=int, help="words every learner has already studied")
+        parser.add_argument("-n", "--new-words", default=3, type=int, help="new words per session")
+        parser.add_argument("--url", type=str, help="GraphQL endpoint of a running server (in-process if omitted)")
+        parser.add_argument("--metrics-url", type=str, help="metrics endpoint of the server, for the write queue wait time")
+        parser.add_argument("--keep", action="store_true", help="keep the simulated learners")
+
+    def handle(self, *args, **options):
+        self.lang = options["lang"]
+        if self.lang is None:
+            course = Course.objects.first()
+            if course is None:
+                raise CommandError("There is no course, add a language pair first.")
+            self.lang = course.learning_id
+
+        words = list(Word.objects.filter(lang=self.lang).exclude(sentences__isnull=True).values_list("pk", flat=True))
+        if not words:
+            raise CommandError(f"There are no words in {self.lang} to learn.")
+
+        self.options = options
+        self.stdout.write(f"Seeding {options['users']} learners.")
+        users = self.seed(options["users"], words, options["known"])
+
+        try:
+            self.stdout.write(
+                f"Simulating for {options['duration']:.0f} s with {options['concurrency']} concurrent learners "
+                f"({'against ' + options['url'] if options['url'] else 'in-process'})."
+            )
+            wait_before = self.queue_wait()
+            results, elapsed = self.run(users, options["concurrency"], options["duration"])
+            wait_after = self.queue_wait()
+            self.report(results, elapsed, wait_before, wait_after)
+        finally:
+            if not options["keep"]:
+                User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+    def seed(self, n, words, known):
+        users = User.objects.bulk_create([
+            User(username=f"simulate-{i}-{random.getrandbits(32):08x}") for i in range(n)
+        ])
+
+        now = timezone.now()
+        UserWordProgress.objects.bulk_create([
+            UserWordProgress(
+                user=user,
+                word_id=word,
+                last_review=now-timedelta(hours=random.uniform(0, 14*24)),
+                interval=timedelta(hours=random.uniform(4, 240)),
+            )
+            for user in users
+            for word in random.sample(words, min(known, len(words)))
+        ], batch_size=10_000)
+        DueCounter.objects.rebuild([u.pk for u in users])
+
+        return users
+
+    def client(self, user):
+        if self.options["url"] is not None:
+            return HTTPClient(self.options["url"], create_jwt_token(user))
+        return InProcessClient(user)
+
+    def timed(self, results, name, client, query, variables):
+        start = time.perf_counter()
+        try:
+            data = client.execute(query, variables)
+        except (SimulationError, OperationalError) as e:
+            results[name].append((time.perf_counter()-start, str(e)))
+            return None
+        results[name].append((time.perf_counter()-start, None))
+        return data
+
+    def session(self, results, client, skill):
+        """One study session: due reviews first, then a few new words."""
+        data = self.timed(results, "session", client, SESSION_QUERY, {"now": timezone.now().isoformat()})
+        for progress in (data or {}).get("progresses", []):
+            success = random.random() < float(progress["prediction"] or 0.)
+            self.timed(results, "attempt", client, ATTEMPT_MUTATION, {"word": progress["word"]["id"], "success": success})
+
+        data = self.timed(results, "new_words", client, NEW_WORDS_QUERY, {"lang": self.lang, "limit": self.options["new_words"]})
+        for word in (data or {}).get("words") or []:
+            self.timed(results, "random_sentence", client, RANDOM_SENTENCE_QUERY, {"word": word["id"]})
+            self.timed(results, "attempt", client, ATTEMPT_MUTATION, {"word": word["id"], "success": random.random() < skill})
+
+    def worker(self, users, deadline):
+        results = defaultdict(list)
+        learners = [(self.client(user), random.uniform(.3, .7)) for user in users]
+        try:
+            while learners and time.perf_counter() < deadline:
+                for client, skill in learners:
+                    if time.perf_counter() >= deadline:
+                        break
+                    self.session(results, client, skill)
+        finally:
+            connections.close_all()
+        return results
+
+    def run(self, users, concurrency, duration):
+        start = time.perf_counter()
+        deadline = start+duration
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            workers = list(pool.map(lambda i: self.worker(users[i::concurrency], deadline), range(concurrency)))
+        elapsed = time.perf_counter()-start
+
+        results = defaultdict(list)
+        for worker_results in workers:
+            for name, samples in worker_results.items():
+                results[name].extend(samples)
+        return results, elapsed
+
+    def queue_wait(self):
+        """
+        Total seconds and number of writes that waited in the write queue
+        (see langtool/db.py) for the writer thread.
+        """
+        if self.options["url"] is None:
+            if not settings.LANGTOOL_WRITE_QUEUE:
+                return None
+            text = metrics.write_wait_seconds.expose()
+        elif self.options["metrics_url"] is None:
+            return None
+        else:
+            try:
+                with urllib.request.urlopen(self.options["metrics_url"]) as response:
+                    text = response.read().decode()
+            except (urllib.error.URLError, OSError):
+                return None
+
+        values = {
+            name: float(value)
+            for name, value in re.findall(r"^langtool_write_wait_seconds_(sum|count)\{[^}]*\} (\S+)$", text, re.M)
+        }
+        return values.get("sum", 0.), int(values.get("count", 0))
+
+    def report(self, results, elapsed, wait_before, wait_after):
+        total = sum(len(samples) for samples in results.values())
+        self.stdout.write(f"{total} operations in {elapsed:.1f} s, {total/elapsed:.1f} ops/s")
+        self.stdout.write(f"{'operation':<18}{'count':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+        locked = 0
+        for name, samples in sorted(results.items()):
+            latencies = [latency for latency, error in samples if error is None]
+            errors = [error for _, error in samples if error is not None]
+            locked += sum("locked" in error for error in errors)
+
+            if len(latencies) >= 2:
+                q = statistics.quantiles(latencies, n=100)
+                quantiles = f"{q[49]*1000:>10.1f}{q[94]*1000:>10.1f}{q[98]*1000:>10.1f}"
+            else:
+                quantiles = f"{'-':>10}{'-':>10}{'-':>10}"
+            self.stdout.write(f"{name:<18}{len(samples):>8}{len(errors):>8}{len(samples)/elapsed:>10.1f}{quantiles}")
+
+        if self.options["url"] is None and not settings.LANGTOOL_WRITE_QUEUE:
+            # Writers wait for the lock in SQLite's busy timeout, which isn't measured
+            self.stdout.write("Write queue wait: none, LANGTOOL_WRITE_QUEUE is off.")
+        elif wait_before is None or wait_after is None:
+            self.stdout.write("Write queue wait: unknown, pass --metrics-url of the server.")
+        else:
+            seconds, writes = wait_after[0]-wait_before[0], wait_after[1]-wait_before[1]
+            if writes:
+                self.stdout.write(f"Write queue wait: {seconds:.2f} s over {writes} queued writes (mean {seconds/writes*1000:.1f} ms)")
+            else:
+                self.stdout.write("Write queue wait: no queued writes, is the write queue of the server off?")
+        self.stdout.write(f"database is locked errors: {locked}")
@@ -0,0 +1,104 @@
+"""
+In-process histograms exported in the Prometheus text format.
+Every process keeps its own metrics, so scrape each worker separately.
+"""
+
+import threading
+import bisect
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+class Histogram:
+    def __init__(self, name, help, label, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            counts, total = self.series.get(label_value, ([0]*(len(self.buckets)+1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[label_value] = (counts, total+value)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {k: (list(counts), total) for k, (counts, total) in self.series.items()}
+
+        for label_value, (counts, total) in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_format_value(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {_format_value(total)}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return "\n".join(lines)
+
+
+operation_seconds = Histogram(
+    "langtool_graphql_operation_seconds",
+    "Wall time of GraphQL operations.",
+    "operation"
+)
+operation_sql_queries = Histogram(
+    "langtool_graphql_operation_sql_queries",
+    "Number of SQL queries executed by GraphQL operations.",
+    "operation",
+    buckets=COUNT_BUCKETS
+)
+operation_sql_seconds = Histogram(
+    "langtool_graphql_operation_sql_seconds",
+    "Time spent in SQL queries by GraphQL operations.",
+    "operation"
+)
+resolver_seconds = Histogram(
+    "langtool_graphql_resolver_seconds",
+    "Total wall time of the resolvers of a field per GraphQL operation.",
+    "field"
+)
+resolver_sql_queries = Histogram(
+    "langtool_graphql_resolver_sql_queries",
+    "Total number of SQL queries executed by the resolvers of a field per GraphQL operation.",
+    "field",
+    buckets=COUNT_BUCKETS
+)
+
+write_wait_seconds = Histogram(
+    "langtool_write_wait_seconds",
+    "Time writes waited in the write queue for the writer thread.",
+    "queue"
+)
+
+registry = [
+    operation_seconds,
+    operation_sql_queries,
+    operation_sql_seconds,
+    resolver_seconds,
+    resolver_sql_queries,
+    write_wait_seconds,
+]
+
+
+def expose():
+    return "\n".join(histogram.expose() for histogram in registry) + "\n"
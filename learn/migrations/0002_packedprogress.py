@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 22:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackedProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('lang', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packed_progress', to='learn.language')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packed_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Packed progresses',
+                'unique_together': {('user', 'lang')},
+            },
+        ),
+    ]
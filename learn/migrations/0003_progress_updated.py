@@ -0,0 +1,22 @@
+# Generated by Django 4.2.4 on 2026-10-18 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0002_packedprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userwordprogress',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='userwordprogress',
+            index=models.Index(fields=['user', 'updated'], name='learn_userw_user_id_ce876d_idx'),
+        ),
+    ]
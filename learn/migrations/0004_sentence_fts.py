@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0003_progress_updated'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE VIRTUAL TABLE learn_sentence_fts USING fts5(
+                    text, lemmas, tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """,
+                "INSERT INTO learn_sentence_fts(rowid, text) SELECT id, text FROM learn_sentence",
+                """
+                CREATE TRIGGER learn_sentence_fts_insert AFTER INSERT ON learn_sentence BEGIN
+                    INSERT INTO learn_sentence_fts(rowid, text) VALUES (new.id, new.text);
+                END
+                """,
+                """
+                CREATE TRIGGER learn_sentence_fts_update AFTER UPDATE OF text ON learn_sentence BEGIN
+                    UPDATE learn_sentence_fts SET text = new.text, lemmas = NULL WHERE rowid = old.id;
+                END
+                """,
+                """
+                CREATE TRIGGER learn_sentence_fts_delete AFTER DELETE ON learn_sentence BEGIN
+                    DELETE FROM learn_sentence_fts WHERE rowid = old.id;
+                END
+                """,
+            ],
+            reverse_sql=[
+                "DROP TRIGGER learn_sentence_fts_delete",
+                "DROP TRIGGER learn_sentence_fts_update",
+                "DROP TRIGGER learn_sentence_fts_insert",
+                "DROP TABLE learn_sentence_fts",
+            ],
+            # Routed with the sentences (see langtool/routers.py)
+            hints={"model_name": "sentence"},
+        ),
+    ]
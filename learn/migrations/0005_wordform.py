@@ -0,0 +1,26 @@
+# Generated by Django 4.2.4 on 2026-10-18 22:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0004_sentence_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WordForm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('form', models.CharField(max_length=64)),
+                ('lang', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='word_forms', to='learn.language')),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forms', to='learn.word')),
+            ],
+            options={
+                'unique_together': {('lang', 'form')},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.4 on 2026-10-18 22:43
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def count_due_reviews(apps, schema_editor):
+    UserWordProgress = apps.get_model("learn", "UserWordProgress")
+    DueCounter = apps.get_model("learn", "DueCounter")
+
+    rows = (
+        UserWordProgress.objects
+        .filter(last_review__isnull=False, interval__isnull=False)
+        .annotate(scheduled_day=TruncDay(models.ExpressionWrapper(
+            F("last_review") + F("interval"),
+            output_field=models.DateTimeField()
+        )))
+        .order_by()
+        .values("user", "scheduled_day")
+        .annotate(count=Count("pk"))
+        .values_list("user", "scheduled_day", "count")
+    )
+    DueCounter.objects.bulk_create(
+        [DueCounter(user_id=user, day=timezone.localdate(day), count=count) for user, day, count in rows],
+        batch_size=10_000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0005_wordform'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='due_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.RunPython(count_due_reviews, migrations.RunPython.noop, hints={"model_name": "duecounter"}),
+    ]
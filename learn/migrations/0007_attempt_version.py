@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-18 22:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0006_duecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userwordprogress',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AttemptKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('created', models.DateTimeField()),
+                ('progress', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learn.userwordprogress')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempt_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created'], name='learn_attem_user_id_4e2cb7_idx')],
+                'unique_together': {('user', 'key')},
+            },
+        ),
+    ]
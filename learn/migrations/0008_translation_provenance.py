@@ -0,0 +1,50 @@
+# Generated by Django 4.2.4 on 2026-10-18 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0007_attempt_version'),
+    ]
+
+    operations = [
+        # Adopt the existing implicit through table as the Translation model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Translation',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('from_sentence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learn.sentence')),
+                        ('to_sentence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learn.sentence')),
+                    ],
+                    options={
+                        'db_table': 'learn_sentence_translations',
+                        'unique_together': {('from_sentence', 'to_sentence')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='sentence',
+                    name='translations',
+                    field=models.ManyToManyField(blank=True, related_name='translation_of', through='learn.Translation', through_fields=('from_sentence', 'to_sentence'), to='learn.sentence'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='translation',
+            name='pivot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learn.language'),
+        ),
+        migrations.AddField(
+            model_name='translation',
+            name='pivot_link_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=models.Index(fields=['lang', 'link_id'], name='learn_sente_lang_id_ebcc45_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 23:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0008_translation_provenance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='packedprogress',
+            name='lang',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='packed_progress', to='learn.language'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='course',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='learners', to='learn.course'),
+        ),
+        migrations.AlterField(
+            model_name='userwordprogress',
+            name='word',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_progress', to='learn.word'),
+        ),
+    ]
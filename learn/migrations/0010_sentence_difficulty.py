@@ -0,0 +1,22 @@
+# Generated by Django 4.2.4 on 2026-10-18 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0009_content_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sentence',
+            name='difficulty',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=models.Index(fields=['lang', 'difficulty'], name='learn_sente_lang_id_3a30c9_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0010_sentence_difficulty'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userwordprogress',
+            index=models.Index(fields=['user', 'last_review', 'interval'], name='learn_userw_user_id_8ba573_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-19 00:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0011_progress_schedule_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='packedprogress',
+            name='lang',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='packed_progress', to='learn.language'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='course',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='learners', to='learn.course'),
+        ),
+        migrations.AlterField(
+            model_name='userwordprogress',
+            name='word',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='user_progress', to='learn.word'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 # Database
-from django.db import models
+from django.db import models, connections, router, transaction, IntegrityError
 from django.db.models import Q, F, Count
 from django.db.models.functions import TruncDay
 
@@ -14,10 +14,7 @@ from django.utils import timezone
 from django.utils.timezone import timedelta
 
 # Language
-from nltk.tokenize import word_tokenize
-from nltk.tokenize.util import align_tokens
-
-from multilang import normalize, lemmatize
+from multilang import tokenize, tokenizers, nltk_tokenize
 
 # Learning
 import ebisu
@@ -25,6 +22,12 @@ import random
 
 # Other
 from django.conf import settings
+from django.utils.functional import cached_property
+from langtool.routers import CrossDatabaseQuerySet
+from langtool.db import write_queue
+
+from . import search
+from . import wordforms
 
 
 def duration_to_hours(td):
@@ -50,7 +53,9 @@ class Course(models.Model):
 
 
 class User(AbstractUser):
-    course = models.ForeignKey(Course, null=True, blank=True, related_name="learners", on_delete=models.SET_NULL)
+    # Courses may be in another database (see langtool/routers.py), deleting
+    # one resets course in learn.signals
+    course = models.ForeignKey(Course, null=True, blank=True, related_name="learners", on_delete=models.DO_NOTHING, db_constraint=False)
 
 
 class Word(models.Model):
@@ -66,6 +71,22 @@ class Word(models.Model):
         unique_together = [["lang", "text"]]
 
 
+class WordForm(models.Model):
+    """
+    Normalized surface form of a word occurring in the corpus, built by addpair
+    so that tokens can be resolved to words without lemmatizing them.
+    """
+    lang = models.ForeignKey(Language, on_delete=models.CASCADE, related_name="word_forms")
+    form = models.CharField(max_length=64)
+    word = models.ForeignKey(Word, on_delete=models.CASCADE, related_name="forms")
+
+    def __str__(self):
+        return f"{self.form} → {self.word}"
+
+    class Meta:
+        unique_together = [["lang", "form"]]
+
+
 class FakeQuerySet:
     def __init__(self, data):
         self.data = data
@@ -80,7 +101,11 @@ class FakeQuerySet:
         return self.data[item]
 
 
-class UserWordProgressQuerySet(models.QuerySet):
+class ConcurrentUpdateError(Exception):
+    pass
+
+
+class UserWordProgressQuerySet(CrossDatabaseQuerySet):
     def with_scheduled_review(self):
         return self.annotate(scheduled_review=models.ExpressionWrapper(
                 F("last_review") + F("interval"),
@@ -103,7 +128,8 @@ class UserWordProgressQuerySet(models.QuerySet):
 class UserWordProgress(models.Model):
     # Basic information
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="word_progress")
-    word = models.ForeignKey(Word, on_delete=models.CASCADE, related_name="user_progress")
+    # Deleted with the word in learn.signals (see langtool/routers.py)
+    word = models.ForeignKey(Word, on_delete=models.DO_NOTHING, related_name="user_progress", db_constraint=False)
     last_review = models.DateTimeField(null=True, blank=True)
 
     # Spaced repetition parameters
@@ -111,15 +137,20 @@ class UserWordProgress(models.Model):
     beta = models.FloatField(default=3.0)
     interval = models.DurationField(null=True) # hours
 
+    # Last change, used for synchronization with offline clients
+    updated = models.DateTimeField(auto_now=True)
+    # Incremented by every review, reviews are written only if it didn't change
+    version = models.PositiveIntegerField(default=0)
+
     objects = UserWordProgressQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user}: {self.word}"
 
-    def attempt(self, success, time=None, save=True):
-        if time is None:
-            time = timezone.now()
+    REVIEW_FIELDS = ["alpha", "beta", "interval", "last_review"]
 
+    def review(self, success, time):
+        """Update the spaced repetition model in memory."""
         if self.interval is None:
             self.interval = timedelta(hours=settings.INITIAL_INTERVAL[success])
         else:
@@ -133,8 +164,54 @@ class UserWordProgress(models.Model):
             self.interval = timedelta(hours=new_model[2])
 
         self.last_review = time
-        if save:
+
+    def save_review(self):
+        """
+        Write the review fields with a conditional UPDATE, only if the row is still
+        at the version it was read at. Returns False (and writes nothing) otherwise.
+        """
+        if self.pk is None:
             self.save()
+            return True
+
+        self.updated = timezone.now()
+        written = UserWordProgress.objects.filter(pk=self.pk, version=self.version).update(
+            version=F("version")+1,
+            updated=self.updated,
+            **{field: getattr(self, field) for field in self.REVIEW_FIELDS}
+        )
+        if written:
+            self.version += 1
+        return bool(written)
+
+    def attempt(self, success, time=None, save=True):
+        """
+        Update the model with a review. When saved, the due counters are updated too,
+        callers with save=False have to call DueCounter.objects.move themselves.
+
+        Concurrent reviews of the same progress don't overwrite each other, a review
+        that lost the race is reapplied on the fresh row (at most LANGTOOL_ATTEMPT_RETRIES
+        times, then ConcurrentUpdateError is raised).
+        """
+        if time is None:
+            time = timezone.now()
+
+        if not save:
+            self.review(success, time)
+            return
+
+        for _ in range(settings.LANGTOOL_ATTEMPT_RETRIES):
+            due_day = self.due_day()
+            self.review(success, time)
+
+            with transaction.atomic(savepoint=False):
+                if self.save_review():
+                    DueCounter.objects.move(self.user_id, due_day, self.due_day())
+                    return
+
+            self.refresh_from_db(fields=self.REVIEW_FIELDS+["version", "updated"])
+
+        raise ConcurrentUpdateError(f"Progress {self.pk} is being updated concurrently, try again.")
 
     def predict(self, time=None, exact=False):
         if self.last_review is None or self.interval is None:
@@ -150,6 +227,12 @@ class UserWordProgress(models.Model):
         model = (self.alpha, self.beta, duration_to_hours(self.interval))
         return ebisu.predictRecall(model, elapsed, exact=exact)
 
+    def due_day(self):
+        """Local date of the next review, the day it is counted in DueCounter."""
+        if self.last_review is None or self.interval is None:
+            return None
+        return timezone.localdate(self.last_review + self.interval)
+
     @property
     def next_review(self):
         """
@@ -161,6 +244,135 @@ class UserWordProgress(models.Model):
 
     class Meta:
         verbose_name_plural = "User word progresses"
+        indexes = [
+            models.Index(fields=["user", "updated"]),
+            # Covers the schedule of a user (see with_scheduled_day)
+            models.Index(fields=["user", "last_review", "interval"]),
+        ]
+
+
+class DueCounterQuerySet(models.QuerySet):
+    def move(self, user_id, old_day, new_day):
+        """Move one scheduled review of a user from old_day to new_day (either may be None)."""
+        if old_day == new_day:
+            return
+
+        if old_day is not None:
+            self.filter(user_id=user_id, day=old_day).update(count=F("count")-1)
+        if new_day is not None:
+            if not self.filter(user_id=user_id, day=new_day).update(count=F("count")+1):
+                self.create(user_id=user_id, day=new_day, count=1)
+
+    def rebuild(self, user_ids):
+        """Recount the scheduled reviews of users with a single GROUP BY."""
+        self.filter(user_id__in=user_ids).delete()
+        self.bulk_create([
+            DueCounter(user_id=user, day=timezone.localdate(day), count=count)
+            for user, day, count in (
+                UserWordProgress.objects
+                .filter(user_id__in=user_ids, last_review__isnull=False, interval__isnull=False)
+                .with_scheduled_day()
+                .order_by()
+                .values("user", "scheduled_day")
+                .annotate(count=Count("pk"))
+                .values_list("user", "scheduled_day", "count")
+            )
+        ])
+
+    def forecast(self, user, days, today=None):
+        """
+        Number of reviews due on each of the next days, starting with today
+        (overdue reviews are counted today).
+        """
+        if today is None:
+            today = timezone.localdate()
+
+        counters = list(self.filter(user=user, day__lt=today+timedelta(days=days)).values_list("day", "count"))
+        if not counters and not self.filter(user=user).exists() and user.word_progress.filter(
+            last_review__isnull=False, interval__isnull=False
+        ).exists():
+            # The progress was written in bulk without maintaining the counters
+            write_queue.submit(DueCounter.objects.rebuild, [user.pk])
+            counters = list(self.filter(user=user, day__lt=today+timedelta(days=days)).values_list("day", "count"))
+
+        forecast = [0]*days
+        for day, count in counters:
+            forecast[max((day-today).days, 0)] += max(count, 0)
+        return [(today+timedelta(days=i), count) for i, count in enumerate(forecast)]
+
+
+class DueCounter(models.Model):
+    """
+    Number of reviews of a user scheduled on a day, maintained incrementally
+    by UserWordProgress.attempt.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="due_counters")
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    objects = DueCounterQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user}: {self.day} ({self.count})"
+
+    class Meta:
+        unique_together = [["user", "day"]]
+
+
+class AttemptKeyQuerySet(models.QuerySet):
+    def claim(self, user, key):
+        """
+        Claim an idempotency key of a user. Returns (attempt key, created),
+        created is False if the key was already used (the attempt is a retry).
+        Expired keys of the user are deleted.
+        """
+        now = timezone.now()
+        self.filter(user=user, created__lt=now-timedelta(seconds=settings.LANGTOOL_ATTEMPT_KEY_TIMEOUT)).delete()
+        try:
+            with transaction.atomic():
+                return self.create(user=user, key=key, created=now), True
+        except IntegrityError:
+            return self.select_related("progress").get(user=user, key=key), False
+
+
+class AttemptKey(models.Model):
+    """
+    Idempotency key of an attempt, a retried submission with
+    the same key returns the progress instead of reviewing again.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="attempt_keys")
+    key = models.CharField(max_length=64)
+    progress = models.ForeignKey(UserWordProgress, null=True, on_delete=models.CASCADE, related_name="+")
+    created = models.DateTimeField()
+
+    objects = AttemptKeyQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user}: {self.key}"
+
+    class Meta:
+        unique_together = [["user", "key"]]
+        indexes = [models.Index(fields=["user", "created"])]
+
+
+class PackedProgress(models.Model):
+    """
+    Progress of a user on all words of a language, packed by learn.packed
+    into a single blob (an alternative to UserWordProgress rows).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="packed_progress")
+    # Deleted with the language in learn.signals (see langtool/routers.py)
+    lang = models.ForeignKey(Language, on_delete=models.DO_NOTHING, related_name="packed_progress", db_constraint=False)
+
+    data = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.lang}"
+
+    class Meta:
+        unique_together = [["user", "lang"]]
+        verbose_name_plural = "Packed progresses"
 
 
 class SentenceQuerySet(models.QuerySet):
@@ -170,6 +382,17 @@ class SentenceQuerySet(models.QuerySet):
             return None
         return self[randint(0, count-1)]
 
+    def search(self, query):
+        return search.search(self, query)
+
+    def set_difficulty(self, difficulties):
+        """Store difficulties given as (sentence id, difficulty) pairs."""
+        with connections[router.db_for_write(self.model)].cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {self.model._meta.db_table} SET difficulty = %s WHERE id = %s",
+                [(value, pk) for pk, value in difficulties]
+            )
+
 
 class Sentence(models.Model):
     lang = models.ForeignKey(Language, related_name="sentences", on_delete=models.CASCADE)
@@ -179,26 +402,103 @@ class Sentence(models.Model):
     link_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     audio = models.FileField(storage=FileSystemStorage(location="data", base_url="/data"), null=True, blank=True)
-    translations = models.ManyToManyField("Sentence", blank=True, related_name="translation_of")
+    translations = models.ManyToManyField(
+        "Sentence", blank=True, related_name="translation_of",
+        through="Translation", through_fields=("from_sentence", "to_sentence")
+    )
 
     words = models.ManyToManyField(Word, blank=True, related_name="sentences")
 
+    # Computed on import, see learn/difficulty.py
+    difficulty = models.FloatField(null=True, blank=True, editable=False)
+
     objects = SentenceQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
+    @cached_property
+    def _tokenized(self):
+        # Tokens and spans in one pass, the code of the language is its primary key
+        if self.lang_id in tokenizers:
+            return tokenize(self.text, self.lang_id)
+        return nltk_tokenize(self.text, self.lang.name.lower())
+
     @property
     def tokens(self):
-        return word_tokenize(self.text, self.lang.name.lower())
+        return self._tokenized[0]
 
     @property
     def lemmas(self):
-        return [lemmatize(t, self.lang.code) for t in self.tokens]
+        forms = wordforms.index.forms_for(self.lang_id)
+        return [forms.lemma(t) for t in self.tokens]
 
     @property
     def spans(self):
-        try:
-            return align_tokens(self.tokens, self.text)
-        except ValueError:
-            return align_tokens([tok.replace("''", "\"").replace("``", "\"") for tok in self.tokens], self.text)
+        return self._tokenized[1]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lang", "link_id"]),
+            models.Index(fields=["lang", "difficulty"]),
+        ]
+
+
+class TranslationQuerySet(models.QuerySet):
+    def add_pivot(self, source, target, pivot):
+        """
+        Translate sentences in target to sentences in source that translate
+        the same pivot sentence (the same Tatoeba link id, in either direction),
+        computed by a single set join. Existing translations are kept.
+        Returns the number of added translations.
+        """
+        translations = self.model._meta.db_table
+        sentences = Sentence._meta.db_table
+
+        with connections[router.db_for_write(self.model)].cursor() as cursor:
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO {translations} (from_sentence_id, to_sentence_id, pivot_id, pivot_link_id)
+                WITH links(sentence_id, lang_id, pivot_link_id) AS (
+                    SELECT s.id, s.lang_id, p.link_id
+                    FROM {translations} t
+                    JOIN {sentences} s ON s.id = t.from_sentence_id
+                    JOIN {sentences} p ON p.id = t.to_sentence_id
+                    WHERE p.lang_id = %(pivot)s AND p.link_id IS NOT NULL
+                    UNION
+                    SELECT s.id, s.lang_id, p.link_id
+                    FROM {translations} t
+                    JOIN {sentences} s ON s.id = t.to_sentence_id
+                    JOIN {sentences} p ON p.id = t.from_sentence_id
+                    WHERE p.lang_id = %(pivot)s AND p.link_id IS NOT NULL
+                )
+                SELECT a.sentence_id, b.sentence_id, %(pivot)s, MIN(a.pivot_link_id)
+                FROM links a
+                JOIN links b ON b.pivot_link_id = a.pivot_link_id
+                WHERE a.lang_id = %(target)s AND b.lang_id = %(source)s
+                GROUP BY a.sentence_id, b.sentence_id
+            """, {"source": source.pk, "target": target.pk, "pivot": pivot.pk})
+            return cursor.rowcount
+
+
+class Translation(models.Model):
+    """
+    Sentence.translations link. Translations inferred through a pivot
+    language (see TranslationQuerySet.add_pivot) record its language and
+    the link id of the pivot sentence, both are null for direct translations.
+    """
+    # The table was created by Django as the implicit through table
+    id = models.AutoField(primary_key=True)
+    from_sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name="+")
+    to_sentence = models.ForeignKey(Sentence, on_delete=models.CASCADE, related_name="+")
+
+    pivot = models.ForeignKey(Language, null=True, blank=True, on_delete=models.CASCADE, related_name="+")
+    pivot_link_id = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = TranslationQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.from_sentence_id} → {self.to_sentence_id}"
+
+    class Meta:
+        db_table = "learn_sentence_translations"
+        unique_together = [["from_sentence", "to_sentence"]]
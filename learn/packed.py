@@ -0,0 +1,240 @@
+"""
+Compact progress storage.
+
+The progress of a user on the words of a language is kept as a NumPy
+structured array sorted by word id, stored as a single PackedProgress blob.
+Recently used arrays are kept in an in-memory LRU. With
+LANGTOOL_PACKED_PROGRESS, the blobs replace the UserWordProgress rows:
+reviews, sync and predictions only read and write them. Progress is moved
+between the two by the packprogress command.
+"""
+
+# Database
+from django.db import transaction
+
+# Time
+from django.utils import timezone
+from django.utils.timezone import timedelta
+import datetime
+
+# Math
+import numpy as np
+from scipy.special import betaln
+
+# Other
+from django.conf import settings
+from collections import OrderedDict
+import threading
+
+from langtool.db import write_queue
+
+from . import models
+
+
+# interval is in hours, last_review and updated are unix timestamps,
+# interval and last_review are NaN for words that were never reviewed
+DTYPE = np.dtype([
+    ("word", "<i8"),
+    ("alpha", "<f8"),
+    ("beta", "<f8"),
+    ("interval", "<f8"),
+    ("last_review", "<f8"),
+    ("updated", "<f8"),
+])
+
+
+def pack(array):
+    return array.tobytes()
+
+
+def unpack(data):
+    return np.frombuffer(bytes(data), dtype=DTYPE).copy()
+
+
+def _timestamp(dt):
+    return np.nan if dt is None else dt.timestamp()
+
+
+def _datetime(timestamp):
+    return None if np.isnan(timestamp) else datetime.datetime.fromtimestamp(float(timestamp), tz=datetime.timezone.utc)
+
+
+def from_progress(progress):
+    """Convert a UserWordProgress into a packed row."""
+    return (
+        progress.word_id,
+        progress.alpha,
+        progress.beta,
+        np.nan if progress.interval is None else models.duration_to_hours(progress.interval),
+        _timestamp(progress.last_review),
+        _timestamp(progress.updated),
+    )
+
+
+def to_progress(row, user):
+    """Convert a packed row into an unsaved UserWordProgress."""
+    progress = models.UserWordProgress(
+        user=user,
+        word_id=int(row["word"]),
+        alpha=float(row["alpha"]),
+        beta=float(row["beta"]),
+        last_review=_datetime(row["last_review"]),
+        updated=_datetime(row["updated"]),
+    )
+    if not np.isnan(row["interval"]):
+        progress.interval = timedelta(hours=float(row["interval"]))
+    return progress
+
+
+def find(array, word_id):
+    """Index of a word in a packed array, or None."""
+    i = np.searchsorted(array["word"], word_id)
+    if i < len(array) and array["word"][i] == word_id:
+        return i
+    return None
+
+
+def progress_of(array, user, word_id):
+    """Progress of a user on a word in a packed array, a new UserWordProgress if it isn't there."""
+    i = find(array, word_id)
+    if i is None:
+        return models.UserWordProgress(user=user, word_id=word_id)
+    return to_progress(array[i], user)
+
+
+def merge(array, progresses):
+    """
+    Write UserWordProgress into a (writable) packed array. Words already in it are
+    updated in place, only new words are inserted. Returns the resulting array.
+    """
+    new = []
+    for progress in progresses:
+        i = find(array, progress.word_id)
+        if i is None:
+            new.append(from_progress(progress))
+        else:
+            array[i] = from_progress(progress)
+
+    if new:
+        rows = np.array(new, dtype=DTYPE)
+        rows.sort(order="word")
+        array = np.insert(array, np.searchsorted(array["word"], rows["word"]), rows)
+    return array
+
+
+def predict(array, time=None, exact=False):
+    """
+    Vectorized UserWordProgress.predict for all rows of a packed array.
+    """
+    if time is None:
+        time = timezone.now()
+
+    with np.errstate(invalid="ignore"):
+        elapsed = (time.timestamp()-array["last_review"]) / 3600
+        dt = elapsed / array["interval"]
+        ret = betaln(array["alpha"]+dt, array["beta"]) - betaln(array["alpha"], array["beta"])
+
+    if exact:
+        ret = np.exp(ret)
+
+    ret[np.isnan(array["interval"]) | np.isnan(array["last_review"])] = 0. if exact else -np.inf
+    return ret
+
+
+class PackedProgressStore:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.arrays = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, user_id, lang_id):
+        data = models.PackedProgress.objects.filter(user_id=user_id, lang_id=lang_id).values_list("data", flat=True).first()
+        if data is None:
+            return np.empty(0, dtype=DTYPE)
+        return unpack(data)
+
+    def remember(self, key, updated, array):
+        with self.lock:
+            self.arrays[key] = (updated, array)
+            self.arrays.move_to_end(key)
+            while len(self.arrays) > self.capacity:
+                self.arrays.popitem(last=False)
+
+    def get(self, user_id, lang_id):
+        """
+        Get the (read-only) progress array of a user in a language. The blob is
+        reloaded only after it changes, possibly in another process.
+        """
+        key = (user_id, lang_id)
+        blobs = models.PackedProgress.objects.filter(user_id=user_id, lang_id=lang_id)
+        updated = blobs.values_list("updated", flat=True).first()
+        with self.lock:
+            cached = self.arrays.get(key)
+            if cached is not None and cached[0] == updated:
+                self.arrays.move_to_end(key)
+                return cached[1]
+
+        updated, data = blobs.values_list("updated", "data").first() or (None, None)
+        array = np.empty(0, dtype=DTYPE) if data is None else unpack(data)
+        array.flags.writeable = False
+        self.remember(key, updated, array)
+        return array
+
+    def save(self, user_id, lang_id, array):
+        """Store an array as the blob of a language, has to be called in a write transaction."""
+        updated = timezone.now()
+        blobs = models.PackedProgress.objects.filter(user_id=user_id, lang_id=lang_id)
+        if not blobs.update(data=pack(array), updated=updated):
+            updated = models.PackedProgress.objects.create(user_id=user_id, lang_id=lang_id, data=pack(array)).updated
+        array.flags.writeable = False
+        transaction.on_commit(lambda: self.remember((user_id, lang_id), updated, array))
+
+    def progress(self, user, word):
+        """Progress of the user on a word (an unsaved UserWordProgress), or None."""
+        array = self.get(user.pk, word.lang_id)
+        i = find(array, word.pk)
+        return None if i is None else to_progress(array[i], user)
+
+    def attempt(self, user, word, success, time=None):
+        """
+        Same as UserWordProgress.attempt, the due counters are updated too.
+        Returns the updated (unsaved) UserWordProgress.
+        """
+        def write():
+            # Read the blob in the write transaction, another process may have changed it
+            array = self.load(user.pk, word.lang_id)
+            progress = progress_of(array, user, word.pk)
+            due_day = progress.due_day()
+            progress.attempt(success, time=time, save=False)
+            progress.updated = timezone.now()
+
+            self.save(user.pk, word.lang_id, merge(array, [progress]))
+            models.DueCounter.objects.move(user.pk, due_day, progress.due_day())
+            return progress
+
+        return write_queue.submit(write)
+
+    def predict(self, user, lang, time=None, exact=False):
+        """
+        Get the ids of all words the user has progress on with their predicted recall.
+        """
+        array = self.get(user.pk, lang.pk)
+        return array["word"], predict(array, time=time, exact=exact)
+
+    def changes(self, user, since=None):
+        """
+        Rows of all languages of a user updated at or after since (a unix
+        timestamp), ordered by the time of the update.
+        """
+        blobs = models.PackedProgress.objects.filter(user=user)
+        if since is not None:
+            blobs = blobs.filter(updated__gte=datetime.datetime.fromtimestamp(since, tz=datetime.timezone.utc))
+
+        arrays = [unpack(data) for data in blobs.values_list("data", flat=True)]
+        array = np.concatenate(arrays) if arrays else np.empty(0, dtype=DTYPE)
+        if since is not None:
+            array = array[array["updated"] >= since]
+        return array[np.argsort(array["updated"], kind="stable")]
+
+
+store = PackedProgressStore(settings.LANGTOOL_PACKED_PROGRESS_CACHE_SIZE)
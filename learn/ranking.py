@@ -0,0 +1,182 @@
+"""
+Comprehensible-input sentence selection.
+
+For a target word, candidate sentences are scored by the mean predicted
+recall of their other words, so the learner gets sentences in which the
+target word is (ideally) the only unknown one.
+
+Both sides are precomputed NumPy arrays:
+ - SentenceIndex holds the word ids of every sentence of a language
+   (and the sentences of every word) in CSR form, it is rebuilt when
+   the content version changes (see learn/cache.py),
+ - the progress of a user is kept as a packed array (see learn/packed.py)
+   until the user reviews a word, the recall of all known words is then
+   predicted in one vectorized call.
+"""
+
+# Database
+from django.db.models import Max
+
+# Math
+import numpy as np
+
+# Other
+from django.conf import settings
+from collections import OrderedDict
+import threading
+import random
+
+from .cache import content_version
+from . import models
+from . import packed
+
+
+class SentenceIndex:
+    def __init__(self, lang_id):
+        links = np.array(
+            models.Sentence.words.through.objects
+            .filter(sentence__lang_id=lang_id)
+            .order_by("sentence_id", "word_id")
+            .values_list("sentence_id", "word_id"),
+            dtype=np.int64
+        ).reshape(-1, 2)
+
+        # Sentences in CSR form, sentence_words are dense word indexes
+        self.sentence_ids, sentence_starts = np.unique(links[:, 0], return_index=True)
+        self.sentence_offsets = np.append(sentence_starts, len(links))
+        self.word_ids, self.sentence_words = np.unique(links[:, 1], return_inverse=True)
+
+        # Sentences of every word (indexes into sentence_ids)
+        order = np.argsort(self.sentence_words, kind="stable")
+        self.word_sentences = np.repeat(np.arange(len(self.sentence_ids)), np.diff(self.sentence_offsets))[order]
+        self.word_offsets = np.searchsorted(self.sentence_words[order], np.arange(len(self.word_ids)+1))
+
+    def word_index(self, word_id):
+        i = np.searchsorted(self.word_ids, word_id)
+        if i == len(self.word_ids) or self.word_ids[i] != word_id:
+            return None
+        return i
+
+    def recall(self, array, time=None):
+        """
+        Predicted recall of every word of the index, array is the packed
+        progress of a user (0 for words without progress).
+        """
+        recall = np.zeros(len(self.word_ids))
+        i = np.searchsorted(self.word_ids, array["word"])
+        found = i < len(self.word_ids)
+        found[found] = self.word_ids[i[found]] == array["word"][found]
+        recall[i[found]] = packed.predict(array[found], time=time, exact=True)
+        return recall
+
+    def scores(self, word, recall, candidates=None):
+        """
+        Score sentences of a word (given as a word index) by the mean recall
+        of their other words. Returns sentence ids and their scores.
+        """
+        sentences = self.word_sentences[self.word_offsets[word]:self.word_offsets[word+1]]
+        if candidates is not None:
+            sentences = sentences[np.isin(self.sentence_ids[sentences], candidates)]
+
+        starts = self.sentence_offsets[sentences]
+        lengths = self.sentence_offsets[sentences+1] - starts
+        # Positions of the words of all the sentences, concatenated
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends-lengths), lengths)
+
+        sums = np.add.reduceat(recall[self.sentence_words[positions]], ends-lengths) if len(ends) else np.zeros(0)
+        others = lengths-1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores = np.where(others > 0, (sums-recall[word]) / others, 1.)
+        return self.sentence_ids[sentences], scores
+
+
+class SentenceRanker:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.indexes = {}
+        self.progress = OrderedDict()
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+            self.progress.clear()
+
+    def get_index(self, lang_id):
+        version = content_version()
+        with self.lock:
+            cached = self.indexes.get(lang_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        index = SentenceIndex(lang_id)
+        with self.lock:
+            self.indexes[lang_id] = (version, index)
+        return index
+
+    def get_progress(self, user_id, lang_id):
+        """
+        Packed progress of a user in a language, reloaded only
+        after the user reviews a word.
+        """
+        if settings.LANGTOOL_PACKED_PROGRESS:
+            return packed.store.get(user_id, lang_id)
+
+        # Without packed progress, the rows of all languages are kept (words may be
+        # in another database, see langtool/routers.py), recall only uses the
+        # words of the index
+        progresses = models.UserWordProgress.objects.filter(user_id=user_id)
+        updated = progresses.aggregate(updated=Max("updated"))["updated"]
+
+        key = user_id
+        with self.lock:
+            cached = self.progress.get(key)
+            if cached is not None and cached[0] == updated:
+                self.progress.move_to_end(key)
+                return cached[1]
+
+        array = np.array([
+            packed.from_progress(models.UserWordProgress(
+                word_id=word, alpha=alpha, beta=beta, interval=interval, last_review=last_review
+            ))
+            for word, alpha, beta, interval, last_review
+            in progresses.values_list("word", "alpha", "beta", "interval", "last_review")
+        ], dtype=packed.DTYPE)
+
+        with self.lock:
+            self.progress[key] = (updated, array)
+            self.progress.move_to_end(key)
+            while len(self.progress) > self.capacity:
+                self.progress.popitem(last=False)
+        return array
+
+    def rank(self, user, word, candidates=None, time=None):
+        """
+        Get ids of the sentences of a word with their scores, sorted from the
+        most comprehensible for the user. candidates optionally restricts the
+        sentences to the given ids.
+        """
+        index = self.get_index(word.lang_id)
+        i = index.word_index(word.pk)
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        recall = index.recall(self.get_progress(user.pk, word.lang_id), time=time)
+        ids, scores = index.scores(i, recall, candidates)
+
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    def best(self, user, word, candidates=None, time=None, choice=random.choice):
+        """
+        Get the id of the most comprehensible sentence of a word for the user,
+        ties are broken randomly. Returns None if the word has no sentences.
+        """
+        ids, scores = self.rank(user, word, candidates, time)
+        if not len(ids):
+            return None
+        return int(choice(ids[scores >= scores[0]-1e-9]))
+
+
+ranker = SentenceRanker(settings.LANGTOOL_RANKING_CACHE_SIZE)
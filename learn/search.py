@@ -0,0 +1,75 @@
+"""
+Full-text sentence search.
+
+learn_sentence_fts is an SQLite FTS5 table with the text of every Sentence
+(kept in sync by triggers, see migration 0004) and optionally its lemmas
+(filled by addpair or the searchindex command), so that searching for
+a base form also finds its inflections.
+"""
+
+from langtool.routers import content_connection
+
+import re
+
+
+FTS_TABLE = "learn_sentence_fts"
+
+# bm25 weights of the text and lemmas columns, exact matches rank higher
+RANK = f"bm25({FTS_TABLE}, 2.0, 1.0)"
+
+
+def match_expression(query):
+    """
+    Convert user input into an FTS5 MATCH expression. Quoted parts are
+    searched as phrases, other words must all occur (as prefixes).
+    Returns None if the query contains no words.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\w+)', query):
+        if phrase:
+            words = re.findall(r"\w+", phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+        else:
+            terms.append(f'"{word}"*')
+
+    if not terms:
+        return None
+    return " ".join(terms)
+
+
+def search(queryset, query):
+    """
+    Filter a Sentence queryset to sentences matching the query,
+    annotated with search_rank (lower is better) and ordered by it.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return queryset.none()
+
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        select={"search_rank": RANK},
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE} MATCH %s", f"{FTS_TABLE}.rowid = {table}.id"],
+        params=[expression],
+    ).order_by("search_rank")
+
+
+def index_lemmas(rows):
+    """
+    Store lemmas of sentences in the index, rows are (sentence id, lemmas) pairs.
+    """
+    with content_connection().cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {FTS_TABLE} SET lemmas = %s WHERE rowid = %s",
+            [(" ".join(lemmas), pk) for pk, lemmas in rows]
+        )
+
+
+def rebuild():
+    """Reindex the text of all sentences, dropping their lemmas."""
+    with content_connection().cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, text) SELECT id, text FROM learn_sentence")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
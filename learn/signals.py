@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import models
+from .cache import content_changed
+
+
+CONTENT_MODELS = (models.Language, models.Course, models.Word, models.Sentence)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def content_saved(sender, **kwargs):
+    if sender in CONTENT_MODELS:
+        content_changed()
+
+
+# User state of deleted content, which is in the default database
+# even with a separate content database (see langtool/routers.py)
+
+@receiver(post_delete, sender=models.Word)
+def word_deleted(sender, instance, **kwargs):
+    models.UserWordProgress.objects.filter(word_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=models.Language)
+def language_deleted(sender, instance, **kwargs):
+    models.PackedProgress.objects.filter(lang_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=models.Course)
+def course_deleted(sender, instance, **kwargs):
+    models.User.objects.filter(course_id=instance.pk).update(course=None)
+
+
+@receiver(m2m_changed, sender=models.Sentence.translations.through)
+@receiver(m2m_changed, sender=models.Sentence.words.through)
+def content_links_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        content_changed()
@@ -0,0 +1,156 @@
+"""
+Delta synchronization of UserWordProgress with offline clients.
+
+Changes are sent in a columnar form, times are unix timestamps
+and intervals are in hours:
+
+    {
+        "watermark": <pass as since in the next sync>,
+        "word": [...], "alpha": [...], "beta": [...],
+        "interval": [...], "last_review": [...]
+    }
+
+Offline reviews are sent as a list of [word id, success, time] events.
+"""
+
+# Time
+from django.utils import timezone
+import datetime
+
+# Other
+# Math
+import numpy as np
+
+# Other
+from django.conf import settings
+from langtool.db import write_queue
+
+from . import models
+from . import packed
+
+
+class SyncError(Exception):
+    pass
+
+
+def _timestamp(dt):
+    return None if dt is None else dt.timestamp()
+
+
+def parse_timestamp(value):
+    """Convert a unix timestamp to an aware datetime, raises SyncError if it's out of range."""
+    try:
+        return datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise SyncError(f"invalid timestamp {value!r}")
+
+
+def changes_since(user, since=None):
+    """
+    Get progress of a user changed at or after the since watermark.
+    Rows changed exactly at the watermark are sent again, so that no change is missed.
+    """
+    changes = {
+        "watermark": since,
+        "word": [],
+        "alpha": [],
+        "beta": [],
+        "interval": [],
+        "last_review": [],
+    }
+
+    if settings.LANGTOOL_PACKED_PROGRESS:
+        array = packed.store.changes(user, since)
+        changes["word"] = array["word"].tolist()
+        changes["alpha"] = array["alpha"].tolist()
+        changes["beta"] = array["beta"].tolist()
+        changes["interval"] = [None if np.isnan(v) else v for v in array["interval"].tolist()]
+        changes["last_review"] = [None if np.isnan(v) else v for v in array["last_review"].tolist()]
+        if len(array):
+            changes["watermark"] = float(array["updated"][-1])
+        return changes
+
+    progresses = models.UserWordProgress.objects.filter(user=user)
+    if since is not None:
+        progresses = progresses.filter(updated__gte=parse_timestamp(since))
+
+    rows = progresses.order_by("updated").values_list("word", "alpha", "beta", "interval", "last_review", "updated")
+    for word, alpha, beta, interval, last_review, updated in rows.iterator(chunk_size=2000):
+        changes["word"].append(word)
+        changes["alpha"].append(alpha)
+        changes["beta"].append(beta)
+        changes["interval"].append(None if interval is None else models.duration_to_hours(interval))
+        changes["last_review"].append(_timestamp(last_review))
+        changes["watermark"] = updated.timestamp()
+
+    return changes
+
+
+def parse_events(events):
+    try:
+        return sorted(
+            (parse_timestamp(time), int(word), bool(success))
+            for word, success, time in events
+        )
+    except (TypeError, ValueError):
+        raise SyncError("events must be a list of [word, success, time]")
+
+
+def replay(user, events):
+    """
+    Apply offline reviews in time order through UserWordProgress.attempt.
+    Reviews older than the last review known to the server are skipped,
+    the ebisu model can't be rewound. Returns the number of applied reviews.
+    """
+    events = parse_events(events)
+
+    def write():
+        words = {e[1] for e in events}
+        langs = dict(models.Word.objects.filter(pk__in=words).values_list("pk", "lang"))
+        if settings.LANGTOOL_PACKED_PROGRESS:
+            arrays = {lang: packed.store.load(user.pk, lang) for lang in set(langs.values())}
+            progresses = {word: packed.progress_of(arrays[lang], user, word) for word, lang in langs.items()}
+        else:
+            progresses = {
+                p.word_id: p
+                for p in models.UserWordProgress.objects.filter(user=user, word__in=words)
+            }
+
+        due_days = {}
+        count = 0
+        for time, word, success in events:
+            if word not in langs:
+                continue
+
+            progress = progresses.setdefault(word, models.UserWordProgress(user=user, word_id=word))
+            if time > timezone.now() or (progress.last_review is not None and time <= progress.last_review):
+                continue
+
+            due_days.setdefault(word, progress.due_day())
+            progress.attempt(success, time=time, save=False)
+            count += 1
+
+        if settings.LANGTOOL_PACKED_PROGRESS:
+            now = timezone.now()
+            for lang, array in arrays.items():
+                reviewed = [progresses[word] for word in due_days if langs[word] == lang]
+                for progress in reviewed:
+                    progress.updated = now
+                if reviewed:
+                    packed.store.save(user.pk, lang, packed.merge(array, reviewed))
+        else:
+            for word in due_days:
+                if not progresses[word].save_review():
+                    raise models.ConcurrentUpdateError(f"Progress of word {word} was updated concurrently.")
+
+        for word, due_day in due_days.items():
+            models.DueCounter.objects.move(user.pk, due_day, progresses[word].due_day())
+        return count
+
+    # A concurrent review rolls the whole replay back, it is then replayed on fresh rows
+    for _ in range(settings.LANGTOOL_ATTEMPT_RETRIES-1):
+        try:
+            return write_queue.submit(write)
+        except models.ConcurrentUpdateError:
+            pass
+    return write_queue.submit(write)
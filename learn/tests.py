@@ -1,3 +1,1693 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, RequestFactory, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import caches
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
+from django.utils.timezone import timedelta
 
-# Create your tests here.
+from strawberry.django.context import StrawberryDjangoContext
+from strawberry.django.views import GraphQLView
+
+from nltk.tokenize import NLTKWordTokenizer
+
+import statistics
+import unittest
+import unittest.mock
+import threading
+import time
+import msgpack
+import json
+import os
+
+from . import models
+from .api import schema
+from .cache import content_version, bump_content_version
+from .views import AsyncCachedGraphQLView
+from . import packed
+from . import sync
+from . import search
+from . import ranking
+from . import admin
+from . import wordforms
+from . import difficulty
+from . import incremental
+from . import metrics
+from . import export
+from . import views
+from .management.commands import simulate
+
+from langtool.jwtauth import create_jwt_token
+from langtool.db import WriteQueue
+from langtool.routers import ContentRouter, ids
+import multilang
+
+from django.core.management import call_command, CommandError
+from io import StringIO
+from pathlib import Path
+import tempfile
+import gzip
+import csv
+
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError
+
+
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "responses": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-responses"},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTest(TestCase):
+    languages = "query { languages { code name } }"
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+
+    def graphql(self, query, **headers):
+        return self.client.post("/graphql/", {"query": query}, content_type="application/json", headers=headers)
+
+    def test_catalog_query_cached(self):
+        first = self.graphql(self.languages)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("ETag", first)
+
+        with self.assertNumQueries(0):
+            second = self.graphql(self.languages)
+        self.assertEqual(second.content, first.content)
+
+        not_modified = self.graphql(self.languages, if_none_match=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_user_query_not_cached(self):
+        response = self.graphql("query { me { username } }")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+        response = self.graphql("query { words(filters: {new: true}) { text } }")
+        self.assertNotIn("ETag", response)
+
+    def test_content_change_invalidates(self):
+        first = self.graphql(self.languages)
+        version = content_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Language.objects.create(code="en", name="English", native_name="English")
+
+        self.assertEqual(content_version(), version+1)
+        second = self.graphql(self.languages)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertIn(b"English", second.content)
+
+    def test_msgpack(self):
+        json_response = self.graphql(self.languages)
+
+        response = self.client.post(
+            "/graphql/",
+            msgpack.packb({"query": self.languages}),
+            content_type="application/msgpack",
+            headers={"accept": "application/msgpack"}
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertIn("Accept", response["Vary"])
+        self.assertEqual(msgpack.unpackb(response.content)["data"], json_response.json()["data"])
+        # Cached separately from JSON
+        self.assertNotEqual(response["ETag"], json_response["ETag"])
+
+        response = self.graphql("query { me { username } }", accept="application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content)["data"], {"me": None})
+
+        response = self.client.post("/graphql/", b"\xc1", content_type="application/msgpack")
+        self.assertEqual(response.status_code, 400)
+
+        # Variables that can't be a cache key
+        response = self.client.post(
+            "/graphql/",
+            msgpack.packb({"query": "query ($code: String) { languages { code } }", "variables": {"code": b"cs"}}),
+            content_type="application/msgpack"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncGraphQLViewTest(TransactionTestCase):
+    async def test_execute(self):
+        await models.Language.objects.acreate(code="cs", name="Czech", native_name="Čeština")
+
+        request = AsyncRequestFactory().post(
+            "/graphql/",
+            {"query": "query { languages { code } }"},
+            content_type="application/json"
+        )
+        response = await AsyncCachedGraphQLView.as_view(schema=schema)(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["data"], {"languages": [{"code": "cs"}]})
+
+    async def test_msgpack(self):
+        await models.Language.objects.acreate(code="cs", name="Czech", native_name="Čeština")
+
+        request = AsyncRequestFactory().post(
+            "/graphql/",
+            msgpack.packb({"query": "query { languages { code } }"}),
+            content_type="application/msgpack",
+            headers={"accept": "application/msgpack"}
+        )
+        response = await AsyncCachedGraphQLView.as_view(schema=schema)(request)
+
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content)["data"], {"languages": [{"code": "cs"}]})
+
+    async def test_middleware(self):
+        response = await self.async_client.post(
+            "/graphql/",
+            {"query": "query { me { username } }"},
+            content_type="application/json",
+            headers={"Authorization": "Bearer invalid"}
+        )
+        self.assertEqual(json.loads(response.content)["data"], {"me": None})
+
+
+class QueryCostTest(TestCase):
+    def test_cost_reported(self):
+        result = schema.execute_sync("query { words(pagination: {limit: 20}) { text sentences(pagination: {limit: 5}) { text } } }")
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.extensions["cost"]["estimated"], 20*(1 + 5))
+
+    def test_expensive_rejected(self):
+        result = schema.execute_sync("""
+            query {
+              sentences {
+                translations {
+                  words {
+                    sentences { text }
+                  }
+                }
+              }
+            }
+        """)
+        self.assertIsNone(result.data)
+        self.assertIn("too expensive", result.errors[0].message)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MetricsTest(TestCase):
+    @override_settings(LANGTOOL_METRICS_OPERATIONS=["languageList"])
+    def test_metrics_recorded(self):
+        models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        schema.execute_sync("query languageList { languages { code } }")
+        # Names that aren't listed are recorded by the root field or as other
+        schema.execute_sync("query randomName1 { courses { id } }")
+        schema.execute_sync("query randomName2 { languages { code } courses { id } }")
+
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('langtool_graphql_operation_sql_queries_bucket{operation="languageList",le="1"}', content)
+        self.assertIn('langtool_graphql_operation_seconds_count{operation="Query.courses"}', content)
+        self.assertIn('langtool_graphql_operation_seconds_count{operation="other"}', content)
+        self.assertNotIn("randomName", content)
+        self.assertIn('langtool_graphql_resolver_seconds_count{field="Query.languages"}', content)
+
+    @override_settings(LANGTOOL_METRICS_ALLOWED_IPS=[])
+    def test_metrics_staff_only(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+
+        staff = models.User.objects.create(username="admin", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+    @override_settings(LANGTOOL_METRICS_DEBUG=True)
+    def test_debug_extension(self):
+        result = schema.execute_sync("query { languages { code } }")
+        self.assertEqual(result.extensions["metrics"]["sqlQueries"], 1)
+        self.assertEqual(result.extensions["metrics"]["resolvers"]["Query.languages"]["sqlQueries"], 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class JWTAuthenticationTest(TestCase):
+    me = "query { me { username } }"
+
+    def setUp(self):
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {create_jwt_token(self.user)}"
+
+    def graphql(self, query):
+        response = self.client.post("/graphql/", {"query": query}, content_type="application/json")
+        return json.loads(response.content)["data"]
+
+    def test_user_not_loaded_unless_used(self):
+        with self.assertNumQueries(1):
+            self.graphql("query { languages { code } }")
+
+    def test_verified_token_cached(self):
+        self.assertEqual(self.graphql(self.me), {"me": {"username": "learner"}})
+        # Only the user is loaded
+        with self.assertNumQueries(1):
+            self.assertEqual(self.graphql(self.me), {"me": {"username": "learner"}})
+
+    def test_deactivation_invalidates(self):
+        self.graphql(self.me)
+
+        # Also by another process, which doesn't touch this process' cache
+        models.User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertEqual(self.graphql(self.me), {"me": None})
+
+    def test_set_course_saves_only_course(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        course = models.Course.objects.create(known=en, learning=cs)
+
+        user = models.User.objects.get(pk=self.user.pk)
+        models.User.objects.filter(pk=self.user.pk).update(first_name="Changed")
+        result = schema.execute_sync(
+            "mutation ($id: ID!) { setCourse(courseId: $id) { username } }",
+            variable_values={"id": course.pk},
+            context_value=StrawberryDjangoContext(request=self.request(user), response=None),
+        )
+        self.assertIsNone(result.errors)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.course, course)
+        self.assertEqual(self.user.first_name, "Changed")
+
+    def request(self, user):
+        request = RequestFactory().post("/graphql/")
+        request.user = user
+        return request
+
+
+class WriteQueueTest(TransactionTestCase):
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(5)])
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.queue = WriteQueue()
+
+    def attempt(self, word):
+        progress, _ = models.UserWordProgress.objects.get_or_create(user=self.user, word=word)
+        progress.attempt(True)
+
+    def test_concurrent_writes(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: self.queue.submit(self.attempt, self.words[i%5]), range(40)))
+
+        self.assertEqual(models.UserWordProgress.objects.count(), 5)
+
+    def test_failure_isolated(self):
+        def fail():
+            models.UserWordProgress.objects.create(user=self.user, word=self.words[0])
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            self.queue.submit(fail)
+        self.queue.submit(self.attempt, self.words[1])
+
+        self.assertEqual(list(models.UserWordProgress.objects.values_list("word", flat=True)), [self.words[1].pk])
+
+    def test_writer_survives(self):
+        with unittest.mock.patch("langtool.db.close_old_connections", side_effect=[RuntimeError, None]):
+            with self.assertRaises(RuntimeError):
+                self.queue.submit(self.attempt, self.words[0])
+            self.queue.submit(self.attempt, self.words[1])
+
+        self.assertEqual(list(models.UserWordProgress.objects.values_list("word", flat=True)), [self.words[1].pk])
+
+    @override_settings(LANGTOOL_WRITE_QUEUE_TIMEOUT=0.01)
+    def test_timeout(self):
+        started = threading.Event()
+        self.queue.submit(lambda: None)
+        self.queue.queue.put((Future(), time.perf_counter(), started.wait, (1,), {}))
+
+        with self.assertRaises(TimeoutError):
+            self.queue.submit(self.attempt, self.words[0])
+        started.set()
+        self.queue.submit(self.attempt, self.words[1])
+
+        self.assertEqual(list(models.UserWordProgress.objects.values_list("word", flat=True)), [self.words[1].pk])
+
+    @override_settings(LANGTOOL_WRITE_QUEUE_TIMEOUT=0.2)
+    def test_no_timeout_once_started(self):
+        def slow():
+            # Still writing when the timeout fires
+            time.sleep(0.5)
+            self.attempt(self.words[0])
+            return "written"
+
+        self.queue.submit(lambda: None)
+        self.assertEqual(self.queue.submit(slow), "written")
+        self.assertEqual(list(models.UserWordProgress.objects.values_list("word", flat=True)), [self.words[0].pk])
+
+
+class PackedProgressTest(TestCase):
+    def setUp(self):
+        self.cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.words = models.Word.objects.bulk_create([models.Word(lang=self.cs, text=f"slovo{i}", freq=1) for i in range(3)])
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.store = packed.PackedProgressStore(capacity=10)
+
+    def test_same_semantics_as_rows(self):
+        other = models.User.objects.create_user("other", password="other")
+        start = timezone.now()-timedelta(days=3)
+        events = [(self.words[2], True, 0), (self.words[0], False, 1), (self.words[2], True, 5), (self.words[2], False, 30)]
+        events = [[w.pk, s, (start+timedelta(hours=h)).timestamp()] for w, s, h in events]
+
+        sync.replay(other, events)
+        with override_settings(LANGTOOL_PACKED_PROGRESS=True):
+            sync.replay(self.user, events)
+        self.assertFalse(models.UserWordProgress.objects.filter(user=self.user).exists())
+
+        later = start+timedelta(hours=50)
+        words, predictions = self.store.predict(self.user, self.cs, time=later, exact=True)
+        self.assertEqual(list(words), [self.words[0].pk, self.words[2].pk])
+        for word, prediction in zip(words, predictions):
+            progress = models.UserWordProgress.objects.get(user=other, word=word)
+            self.assertAlmostEqual(prediction, progress.predict(time=later, exact=True))
+        self.assertEqual(self.forecast(self.user), self.forecast(other))
+
+    def forecast(self, user):
+        return models.DueCounter.objects.forecast(user, 7, today=timezone.localdate())
+
+    def test_updated_in_place(self):
+        first = self.store.attempt(self.user, self.words[1], True)
+        self.store.attempt(self.user, self.words[0], True)
+        array = self.store.load(self.user.pk, self.cs.pk)
+        self.assertEqual(list(array["word"]), [self.words[0].pk, self.words[1].pk])
+
+        self.store.attempt(self.user, self.words[1], False, time=first.last_review+timedelta(hours=1))
+        array = self.store.load(self.user.pk, self.cs.pk)
+        self.assertEqual(list(array["word"]), [self.words[0].pk, self.words[1].pk])
+        self.assertEqual(array["last_review"][1], (first.last_review+timedelta(hours=1)).timestamp())
+        self.assertEqual(sum(count for _, count in self.forecast(self.user)), 2)
+
+    def test_reloads_changed_blob(self):
+        self.assertEqual(len(self.store.get(self.user.pk, self.cs.pk)), 0)
+
+        # Written by another process
+        packed.PackedProgressStore(capacity=10).attempt(self.user, self.words[1], True)
+
+        self.assertEqual(list(self.store.get(self.user.pk, self.cs.pk)["word"]), [self.words[1].pk])
+
+    @override_settings(LANGTOOL_PACKED_PROGRESS=True)
+    def test_attempt_mutation(self):
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        query = """
+            mutation ($word: ID!) {
+              attempt(id: $word, success: true, key: "retry") { id lastReview word { text progress { prediction } } }
+            }
+        """
+        results = [
+            schema.execute_sync(query, variable_values={"word": self.words[0].pk}, context_value=StrawberryDjangoContext(request=request, response=None))
+            for _ in range(2)
+        ]
+        self.assertIsNone(results[0].errors)
+        # The retry isn't applied again
+        self.assertEqual(results[0].data["attempt"]["lastReview"], results[1].data["attempt"]["lastReview"])
+        self.assertIsNone(results[0].data["attempt"]["id"])
+        self.assertGreater(results[0].data["attempt"]["word"]["progress"]["prediction"], -1)
+
+        self.assertFalse(models.UserWordProgress.objects.exists())
+        self.assertEqual(len(self.store.load(self.user.pk, self.cs.pk)), 1)
+
+    @override_settings(LANGTOOL_PACKED_PROGRESS=True)
+    def test_changes_since(self):
+        self.store.attempt(self.user, self.words[2], True)
+        changes = sync.changes_since(self.user)
+        self.assertEqual(changes["word"], [self.words[2].pk])
+
+        self.store.attempt(self.user, self.words[0], True)
+        changes = sync.changes_since(self.user, changes["watermark"])
+        self.assertEqual(changes["word"], [self.words[2].pk, self.words[0].pk])
+
+        changes = sync.changes_since(self.user, changes["watermark"]+1)
+        self.assertEqual(changes["word"], [])
+
+    def test_pack_unpack(self):
+        progress = models.UserWordProgress.objects.create(user=self.user, word=self.words[1])
+        progress.attempt(True)
+
+        out = StringIO()
+        call_command("packprogress", "--compare", stdout=out)
+        self.assertIn("ms/review", out.getvalue())
+        self.assertFalse(models.PackedProgress.objects.exists())
+
+        call_command("packprogress", stdout=StringIO())
+        self.assertFalse(models.UserWordProgress.objects.exists())
+        call_command("packprogress", "--unpack", stdout=StringIO())
+        self.assertFalse(models.PackedProgress.objects.exists())
+
+        unpacked = models.UserWordProgress.objects.get()
+        self.assertEqual(unpacked.word, self.words[1])
+        self.assertEqual(unpacked.interval, progress.interval)
+        self.assertEqual(unpacked.last_review, progress.last_review)
+        self.assertEqual(unpacked.updated, progress.updated)
+
+
+class SyncTest(TestCase):
+    def setUp(self):
+        self.cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.words = models.Word.objects.bulk_create([models.Word(lang=self.cs, text=f"slovo{i}", freq=1) for i in range(3)])
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.other = models.User.objects.create_user("other", password="other")
+
+    def test_replay_matches_attempts(self):
+        start = timezone.now()-timedelta(days=3)
+        events = [(self.words[2], True, 5), (self.words[0], False, 1), (self.words[2], True, 0), (self.words[2], False, 30)]
+
+        # Sent out of order, replayed in time order
+        applied = sync.replay(self.user, [[w.pk, s, (start+timedelta(hours=h)).timestamp()] for w, s, h in events])
+        self.assertEqual(applied, 4)
+
+        for word, success, hours in sorted(events, key=lambda e: e[2]):
+            progress, _ = models.UserWordProgress.objects.get_or_create(user=self.other, word=word)
+            progress.attempt(success, time=start+timedelta(hours=hours))
+
+        for word in (self.words[0], self.words[2]):
+            synced = models.UserWordProgress.objects.get(user=self.user, word=word)
+            expected = models.UserWordProgress.objects.get(user=self.other, word=word)
+            self.assertAlmostEqual(synced.alpha, expected.alpha)
+            self.assertAlmostEqual(synced.beta, expected.beta)
+            self.assertEqual(synced.interval, expected.interval)
+            self.assertEqual(synced.last_review, expected.last_review)
+
+    def test_replay_skips_stale_events(self):
+        progress = models.UserWordProgress.objects.create(user=self.user, word=self.words[0])
+        progress.attempt(True)
+
+        now = timezone.now()
+        applied = sync.replay(self.user, [
+            [self.words[0].pk, False, (now-timedelta(days=1)).timestamp()],
+            [self.words[1].pk, True, (now+timedelta(days=1)).timestamp()],
+            [-1, True, now.timestamp()],
+        ])
+        self.assertEqual(applied, 0)
+        self.assertFalse(models.UserWordProgress.objects.filter(word=self.words[1]).exists())
+
+        with self.assertRaises(sync.SyncError):
+            sync.replay(self.user, [[self.words[0].pk, True]])
+
+    def test_changes_since(self):
+        first = models.UserWordProgress.objects.create(user=self.user, word=self.words[0])
+        models.UserWordProgress.objects.create(user=self.other, word=self.words[0])
+
+        changes = sync.changes_since(self.user)
+        self.assertEqual(changes["word"], [self.words[0].pk])
+        self.assertEqual(changes["interval"], [None])
+
+        first.attempt(True)
+        second = models.UserWordProgress.objects.create(user=self.user, word=self.words[1])
+        since = changes["watermark"]
+        changes = sync.changes_since(self.user, since)
+        self.assertEqual(changes["word"], [self.words[0].pk, self.words[1].pk])
+        self.assertEqual(changes["last_review"][0], first.last_review.timestamp())
+        self.assertEqual(changes["watermark"], second.updated.timestamp())
+
+    def test_view(self):
+        self.assertEqual(self.client.get("/sync/").status_code, 401)
+
+        self.client.force_login(self.user)
+        response = self.client.post(
+            "/sync/",
+            msgpack.packb({"events": [[self.words[1].pk, True, timezone.now().timestamp()]]}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        changes = msgpack.unpackb(response.content)
+        self.assertEqual(changes["applied"], 1)
+        self.assertEqual(changes["word"], [self.words[1].pk])
+
+        response = self.client.get("/sync/", {"since": changes["watermark"]+1})
+        self.assertEqual(response.json()["word"], [])
+
+        response = self.client.post("/sync/", "[]", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        for since in ("inf", "nan", "1e20"):
+            self.assertEqual(self.client.get("/sync/", {"since": since}).status_code, 400)
+        response = self.client.post("/sync/", json.dumps({"events": [[self.words[0].pk, True, 1e20]]}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.sentences = models.Sentence.objects.bulk_create([
+            models.Sentence(lang=self.cs, text=text) for text in (
+                "Kočka spí na okně.",
+                "Pes honí kočku po zahradě.",
+                "Na zahradě roste strom.",
+            )
+        ])
+
+    def search(self, query):
+        return [s.text for s in models.Sentence.objects.search(query)]
+
+    def test_search(self):
+        # Diacritics are ignored
+        self.assertCountEqual(self.search("zahrade"), ["Pes honí kočku po zahradě.", "Na zahradě roste strom."])
+        self.assertEqual(self.search("koč spí"), ["Kočka spí na okně."])
+        self.assertEqual(self.search('"roste strom"'), ["Na zahradě roste strom."])
+        self.assertEqual(self.search('"strom roste"'), [])
+        self.assertEqual(self.search("*)"), [])
+
+    def test_index_in_sync(self):
+        sentence = self.sentences[2]
+        sentence.text = "Na louce roste tráva."
+        sentence.save()
+        self.sentences[0].delete()
+
+        self.assertEqual(self.search("strom"), [])
+        self.assertEqual(self.search("louce"), ["Na louce roste tráva."])
+        self.assertEqual(self.search("kočka"), [])
+
+    def test_lemmas(self):
+        search.index_lemmas([(self.sentences[1].pk, ["pes", "honit", "kočka", "po", "zahrada"])])
+        # The exact form ranks above the lemma match
+        self.assertEqual(self.search("kočka"), ["Kočka spí na okně.", "Pes honí kočku po zahradě."])
+
+    def test_filter(self):
+        result = schema.execute_sync('query { sentences(filters: {search: "zahrade roste"}, pagination: {limit: 10}) { text } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["sentences"], [{"text": "Na zahradě roste strom."}])
+
+
+class RankingTest(TestCase):
+    def setUp(self):
+        ranking.ranker.clear()
+        self.now = timezone.now()
+
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.target, self.a, self.b, self.c = models.Word.objects.bulk_create([
+            models.Word(lang=cs, text=text, freq=1) for text in ("cíl", "a", "b", "c")
+        ])
+        self.sentences = models.Sentence.objects.bulk_create([
+            models.Sentence(lang=cs, text=f"věta {i}") for i in range(4)
+        ])
+        for sentence, words in zip(self.sentences, [
+            (self.target, self.a, self.b),
+            (self.target, self.c),
+            (self.target, self.a, self.c),
+            (self.a,),
+        ]):
+            sentence.words.set(words)
+
+        self.user = models.User.objects.create_user("learner", password="learner")
+        for word in (self.a, self.b):
+            models.UserWordProgress.objects.create(user=self.user, word=word).attempt(True, time=self.now)
+
+    def test_rank(self):
+        ids, scores = ranking.ranker.rank(self.user, self.target, time=self.now)
+        self.assertEqual(list(ids), [self.sentences[0].pk, self.sentences[2].pk, self.sentences[1].pk])
+        self.assertAlmostEqual(scores[0], 1.)
+        self.assertAlmostEqual(scores[1], .5)
+        self.assertAlmostEqual(scores[2], 0.)
+
+        self.assertEqual(ranking.ranker.best(self.user, self.target), self.sentences[0].pk)
+        self.assertEqual(ranking.ranker.best(self.user, self.target, candidates=[self.sentences[1].pk]), self.sentences[1].pk)
+        self.assertIsNone(ranking.ranker.best(self.user, self.b, candidates=[self.sentences[1].pk]))
+
+    def test_progress_reloaded(self):
+        ranking.ranker.rank(self.user, self.target)
+        with CaptureQueriesContext(connection) as queries:
+            ranking.ranker.rank(self.user, self.target)
+        # Only the time of the last review, without the words of the language
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("learn_word", queries[0]["sql"])
+
+        # Progress in other languages is ignored
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        word = models.Word.objects.create(lang=en, text="word", freq=1)
+        models.UserWordProgress.objects.create(user=self.user, word=word).attempt(True, time=self.now)
+        _, scores = ranking.ranker.rank(self.user, self.target, time=self.now)
+        self.assertAlmostEqual(scores[0], 1.)
+        self.assertAlmostEqual(scores[2], 0.)
+
+        models.UserWordProgress.objects.create(user=self.user, word=self.c).attempt(True, time=self.now)
+        _, scores = ranking.ranker.rank(self.user, self.target, time=self.now)
+        for score in scores:
+            self.assertAlmostEqual(score, 1.)
+
+    @override_settings(LANGTOOL_PACKED_PROGRESS=True)
+    def test_packed_progress(self):
+        call_command("packprogress", stdout=StringIO())
+        ids, _ = ranking.ranker.rank(self.user, self.target, time=self.now)
+        self.assertEqual(list(ids), [self.sentences[0].pk, self.sentences[2].pk, self.sentences[1].pk])
+
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        result = schema.execute_sync(
+            "mutation Attempt($word: ID!) { attempt(id: $word, success: true) { id } }",
+            variable_values={"word": self.c.pk},
+            context_value=StrawberryDjangoContext(request=request, response=None),
+        )
+        self.assertIsNone(result.errors)
+
+        _, scores = ranking.ranker.rank(self.user, self.target, time=self.now)
+        for score in scores:
+            self.assertAlmostEqual(score, 1., places=3)
+
+    def test_field(self):
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        result = schema.execute_sync(
+            "query ($id: ID!) { word(id: $id) { bestSentence { text } } }",
+            variable_values={"id": self.target.pk},
+            context_value=StrawberryDjangoContext(request=request, response=None)
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["word"]["bestSentence"], {"text": "věta 0"})
+
+
+class AdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        cls.words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(30)])
+        cls.sentences = models.Sentence.objects.bulk_create([models.Sentence(lang=cs, text=f"věta {i}") for i in range(30)])
+        models.Sentence.words.through.objects.bulk_create([
+            models.Sentence.words.through(sentence=s, word=w)
+            for i, s in enumerate(cls.sentences)
+            for w in cls.words[:i+1]
+        ])
+        cls.admin = models.User.objects.create_superuser("admin", password="admin")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_bounded(self):
+        for model in ("word", "sentence"):
+            with self.subTest(model=model):
+                # session, user, filter choices, estimated count (2), page
+                with self.assertNumQueries(6):
+                    response = self.client.get(f"/admin/learn/{model}/")
+                self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/admin/learn/word/")
+        self.assertContains(response, '<td class="field-number_of_sentences">30</td>', html=True)
+
+    def test_preview(self):
+        response = self.client.get(f"/admin/learn/word/{self.words[0].pk}/change/")
+        self.assertContains(response, "věta 19<")
+        self.assertNotContains(response, "věta 20<")
+        self.assertContains(response, f"?words__id__exact={self.words[0].pk}")
+
+        response = self.client.get(f"/admin/learn/sentence/{self.sentences[5].pk}/change/")
+        self.assertContains(response, "slovo5")
+        self.assertNotContains(response, "?sentences__id__exact")
+
+    def test_estimated_count(self):
+        self.assertEqual(admin.estimated_count(models.Sentence), self.sentences[-1].pk)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(admin.estimated_count(models.Sentence), 30)
+
+
+class WordFormTest(TestCase):
+    def setUp(self):
+        wordforms.index.clear()
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.cat = models.Word.objects.create(lang=cs, text="kočka", freq=1)
+        models.WordForm.objects.bulk_create([
+            models.WordForm(lang=cs, form=form, word=self.cat) for form in ("kočka", "kočku", "kočkou")
+        ])
+
+    def test_resolve(self):
+        self.assertEqual(wordforms.index.word("Kočku", "cs"), self.cat.pk)
+        self.assertIsNone(wordforms.index.word("pes", "cs"))
+
+        # Loaded once
+        with self.assertNumQueries(0):
+            self.assertEqual(wordforms.index.lemma("kočkou", "cs"), "kočka")
+
+    def test_lemmatizer_fallback(self):
+        self.assertEqual(wordforms.index.lemma("psy", "cs"), "pes")
+
+    def test_reload(self):
+        wordforms.index.word("kočky", "cs")
+        models.WordForm.objects.create(lang_id="cs", form="kočky", word=self.cat)
+        bump_content_version()
+        self.assertEqual(wordforms.index.word("kočky", "cs"), self.cat.pk)
+
+    def test_version_read_once_per_sentence(self):
+        sentence = models.Sentence.objects.create(lang_id="cs", text="Kočka, kočku a kočkou.")
+        with unittest.mock.patch("learn.wordforms.content_version", wraps=content_version) as version:
+            self.assertEqual(sentence.lemmas[:3], ["kočka", ",", "kočka"])
+        self.assertEqual(version.call_count, 1)
+
+
+class ReviewForecastTest(TestCase):
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(4)])
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+    def forecast(self, days=3):
+        return [count for _, count in models.DueCounter.objects.forecast(self.user, days, today=self.today)]
+
+    def expected(self, days=3):
+        """Forecast computed from the progress rows."""
+        forecast = [0]*days
+        for progress in models.UserWordProgress.objects.filter(user=self.user):
+            if progress.due_day() is not None and (progress.due_day()-self.today).days < days:
+                forecast[max((progress.due_day()-self.today).days, 0)] += 1
+        return forecast
+
+    def test_attempts_maintain_counters(self):
+        for word, hours in zip(self.words, (-48, -30, 0, 40)):
+            progress = models.UserWordProgress.objects.create(user=self.user, word=word)
+            progress.attempt(True, time=self.now+timedelta(hours=hours))
+            progress.attempt(False, time=self.now+timedelta(hours=hours+1))
+
+        self.assertEqual(self.forecast(), self.expected())
+        self.assertEqual(sum(self.forecast(10)), 4)
+
+        with self.assertNumQueries(1):
+            self.forecast(7)
+
+    def test_replay_maintains_counters(self):
+        sync.replay(self.user, [
+            [word.pk, True, (self.now-timedelta(hours=hours)).timestamp()]
+            for word, hours in zip(self.words, (50, 30, 1, 1))
+        ])
+        self.assertEqual(self.forecast(), self.expected())
+
+    def test_rebuild_fallback(self):
+        models.UserWordProgress.objects.bulk_create([
+            models.UserWordProgress(user=self.user, word=word, last_review=self.now, interval=timedelta(days=i))
+            for i, word in enumerate(self.words)
+        ])
+        self.assertEqual(self.forecast(), [1, 1, 1])
+        self.assertEqual(models.DueCounter.objects.filter(user=self.user).count(), 4)
+
+    def test_no_rebuild_of_later_reviews(self):
+        progress = models.UserWordProgress.objects.create(user=self.user, word=self.words[0])
+        progress.attempt(True, time=self.now+timedelta(days=10))
+        models.UserWordProgress.objects.create(user=self.user, word=self.words[1])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.forecast(), [0, 0, 0])
+
+        other = models.User.objects.create_user("other", password="other")
+        models.UserWordProgress.objects.create(user=other, word=self.words[0])
+        with self.assertNumQueries(3):
+            models.DueCounter.objects.forecast(other, 3)
+
+    def test_field(self):
+        models.UserWordProgress.objects.create(user=self.user, word=self.words[0]).attempt(True, time=self.now-timedelta(days=1))
+
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        result = schema.execute_sync(
+            "query { reviewForecast(days: 2) { day count } }",
+            context_value=StrawberryDjangoContext(request=request, response=None)
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["reviewForecast"], [
+            {"day": timezone.localdate().isoformat(), "count": 1},
+            {"day": (timezone.localdate()+timedelta(days=1)).isoformat(), "count": 0},
+        ])
+
+
+class SimulateTest(TransactionTestCase):
+    # The shared-cache in-memory test database locks whole tables,
+    # so the simulation runs in one thread, writing inline
+    @override_settings(LANGTOOL_WRITE_QUEUE=False)
+    def test_simulate(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        models.Course.objects.create(known=en, learning=cs)
+        words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(20)])
+        for i, word in enumerate(words):
+            models.Sentence.objects.create(lang=cs, text=f"věta {i}").words.add(word)
+
+        out = StringIO()
+        call_command("simulate", "-u", "4", "-c", "1", "-d", "0.5", "-k", "5", stdout=out)
+
+        output = out.getvalue()
+        for operation in ("session", "attempt", "new_words", "random_sentence"):
+            self.assertRegex(output, rf"{operation} +\d+ +0 ")
+        self.assertIn("database is locked errors: 0", output)
+        self.assertIn("Write queue wait: none, LANGTOOL_WRITE_QUEUE is off.", output)
+        self.assertFalse(models.User.objects.exists())
+
+    @override_settings(LANGTOOL_WRITE_QUEUE=True)
+    def test_queue_wait(self):
+        command = simulate.Command()
+        command.options = {"url": None}
+        seconds, writes = command.queue_wait()
+        metrics.write_wait_seconds.observe("default", 0.25)
+        self.assertEqual(command.queue_wait(), (seconds+0.25, writes+1))
+
+
+class ProfileOperationTest(TestCase):
+    def test_profile(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(5)])
+        user = models.User.objects.create(username="test")
+
+        query = Path(tempfile.mkdtemp())/"query.graphql"
+        query.write_text("""
+            mutation ($word: ID!) {
+              attempt(id: $word, success: true) {
+                id
+              }
+            }
+        """)
+        collapsed = query.with_name("stacks.txt")
+
+        out = StringIO()
+        call_command(
+            "profileop", str(query), "-V", json.dumps({"word": words[0].pk}), "-u", "test",
+            "-n", "2", "--collapsed", str(collapsed), stdout=out
+        )
+
+        output = out.getvalue()
+        self.assertIn("2 executions", output)
+        self.assertIn("SQL statements", output)
+        self.assertRegex(output, r"(SEARCH|SCAN) learn_")
+        self.assertRegex(collapsed.read_text(), r"execute_sync \(.*\) \d+")
+        # Mutations are rolled back
+        self.assertFalse(models.UserWordProgress.objects.filter(user=user).exists())
+
+    def test_missing_user(self):
+        query = Path(tempfile.mkdtemp())/"query.graphql"
+        query.write_text("query { languages { code } }")
+        with self.assertRaises(CommandError):
+            call_command("profileop", str(query), "-u", "nobody", stdout=StringIO())
+
+    def test_long_inline_variables(self):
+        query = Path(tempfile.mkdtemp())/"query.graphql"
+        query.write_text("query ($texts: [String!]) { words(filters: {text: {inList: $texts}}) { text } }")
+        out = StringIO()
+        call_command("profileop", str(query), "-V", json.dumps({"texts": ["slovo"]*2000}), "-n", "1", stdout=out)
+        self.assertIn("1 executions", out.getvalue())
+
+
+class ConcurrentAttemptTest(TestCase):
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.word = models.Word.objects.create(lang=cs, text="slovo", freq=1)
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.now = timezone.now()
+
+    def execute(self, key):
+        request = RequestFactory().post("/graphql/")
+        request.user = self.user
+        result = schema.execute_sync(
+            """
+            mutation ($word: ID!, $key: String) {
+              attempt(id: $word, success: true, key: $key) {
+                id
+                scheduledReview
+              }
+            }
+            """,
+            variable_values={"word": self.word.pk, "key": key},
+            context_value=StrawberryDjangoContext(request=request, response=None)
+        )
+        self.assertIsNone(result.errors)
+        return result.data["attempt"]
+
+    def test_stale_attempt_reapplied(self):
+        models.UserWordProgress.objects.create(user=self.user, word=self.word).attempt(True, time=self.now)
+        first = models.UserWordProgress.objects.get()
+        second = models.UserWordProgress.objects.get()
+
+        first.attempt(True, time=self.now+timedelta(hours=1))
+        # second still holds the version read before the first attempt
+        second.attempt(False, time=self.now+timedelta(hours=2))
+
+        expected = models.UserWordProgress(user=self.user, word=self.word)
+        for success, hours in [(True, 0), (True, 1), (False, 2)]:
+            expected.attempt(success, time=self.now+timedelta(hours=hours), save=False)
+
+        progress = models.UserWordProgress.objects.get()
+        self.assertEqual(progress.version, 3)
+        self.assertAlmostEqual(progress.alpha, expected.alpha)
+        self.assertEqual(progress.interval, expected.interval)
+        self.assertEqual(progress.last_review, self.now+timedelta(hours=2))
+        self.assertEqual(list(models.DueCounter.objects.values_list("day", "count")), [(progress.due_day(), 1)])
+
+    def test_idempotency_key(self):
+        first = self.execute("k1")
+        retry = self.execute("k1")
+        self.assertEqual(first, retry)
+        self.assertIsNotNone(first["scheduledReview"])
+        self.assertEqual(models.UserWordProgress.objects.get().version, 1)
+
+        self.execute("k2")
+        self.execute(None)
+        self.assertEqual(models.UserWordProgress.objects.get().version, 3)
+
+    def test_expired_keys_pruned(self):
+        self.execute("k1")
+        models.AttemptKey.objects.update(created=self.now-timedelta(days=2))
+
+        self.execute("k1")
+        self.assertEqual(models.UserWordProgress.objects.get().version, 2)
+        self.assertEqual(models.AttemptKey.objects.count(), 1)
+
+
+class PivotTranslationTest(TestCase):
+    def setUp(self):
+        self.cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.ru = models.Language.objects.create(code="ru", name="Russian", native_name="Русский")
+        self.en = models.Language.objects.create(code="en", name="English", native_name="English")
+
+    def sentence(self, lang, link_id, text):
+        return models.Sentence.objects.create(lang=lang, link_id=link_id, text=text)
+
+    def test_add_pivot(self):
+        hello_cs = self.sentence(self.cs, 1, "Ahoj.")
+        bye_cs = self.sentence(self.cs, 2, "Nashle.")
+        hello_ru = self.sentence(self.ru, 3, "Привет.")
+        bye_ru = self.sentence(self.ru, 4, "Пока.")
+        direct_ru = self.sentence(self.ru, 5, "Здравствуй.")
+        hello_en = self.sentence(self.en, 10, "Hello.")
+        # The same pivot sentence loaded twice, joined by its link id
+        hello_en_copy = self.sentence(self.en, 10, "Hello!")
+        bye_en = self.sentence(self.en, 11, "Bye.")
+
+        hello_cs.translations.add(hello_en, direct_ru)
+        bye_cs.translations.add(bye_en)
+        hello_ru.translations.add(hello_en_copy)
+        # Pivot links in the other direction
+        bye_en.translations.add(bye_ru)
+
+        self.assertEqual(models.Translation.objects.add_pivot(self.ru, self.cs, self.en), 2)
+
+        self.assertEqual(set(hello_cs.translations.filter(lang=self.ru)), {hello_ru, direct_ru})
+        self.assertEqual(list(bye_cs.translations.filter(lang=self.ru)), [bye_ru])
+        self.assertEqual(
+            set(models.Translation.objects.filter(from_sentence__lang=self.cs, to_sentence__lang=self.ru).values_list("to_sentence", "pivot", "pivot_link_id")),
+            {(direct_ru.pk, None, None), (hello_ru.pk, "en", 10), (bye_ru.pk, "en", 11)}
+        )
+
+        # Idempotent
+        self.assertEqual(models.Translation.objects.add_pivot(self.ru, self.cs, self.en), 0)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        self.course = models.Course.objects.create(known=en, learning=cs)
+        self.words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(3)])
+        models.Word.objects.create(lang=en, text="word", freq=1)
+
+        self.sentence = models.Sentence.objects.create(lang=cs, text="Věta, \"slovo0\".", link_id=1)
+        self.translation = models.Sentence.objects.create(lang=en, text="Sentence.", link_id=2)
+        self.sentence.translations.add(self.translation)
+        self.sentence.words.add(*self.words[:2])
+
+        self.user = models.User.objects.create_user("learner", password="learner")
+        self.other = models.User.objects.create_user("other", password="other")
+        self.staff = models.User.objects.create_user("staff", password="staff", is_staff=True)
+        for user in (self.user, self.other):
+            models.UserWordProgress.objects.create(user=user, word=self.words[0]).attempt(True)
+
+    def get(self, kind, **params):
+        response = self.client.get(f"/export/{kind}/", params)
+        return response, b"".join(response.streaming_content).decode() if response.streaming else None
+
+    def test_progress_ndjson(self):
+        self.assertEqual(self.client.get("/export/progress/").status_code, 401)
+
+        self.client.force_login(self.user)
+        response, content = self.get("progress")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["user"], self.user.pk)
+        self.assertEqual(rows[0]["interval"], settings.INITIAL_INTERVAL[True])
+
+        # Learners can't export the corpus
+        self.assertEqual(self.client.get("/export/words/").status_code, 403)
+
+    def test_time_filter(self):
+        self.client.force_login(self.staff)
+        tomorrow = (timezone.localdate()+timedelta(days=1)).isoformat()
+
+        _, content = self.get("progress", until=tomorrow)
+        self.assertEqual(len(content.splitlines()), 2)
+        _, content = self.get("progress", since=tomorrow)
+        self.assertEqual(content, "")
+
+        self.assertEqual(self.get("progress", since="yesterday")[0].status_code, 400)
+        self.assertEqual(self.get("words", since=tomorrow)[0].status_code, 400)
+
+    def test_sentences_csv(self):
+        self.client.force_login(self.staff)
+        _, content = self.get("sentences", format="csv", course=self.course.pk)
+
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ["id", "lang", "text", "link_id", "audio", "translations", "words"])
+        self.assertEqual(rows[1:], [[
+            str(self.sentence.pk), "cs", self.sentence.text, "1", "",
+            str(self.translation.pk), f"{self.words[0].pk} {self.words[1].pk}"
+        ]])
+
+    def test_gzip(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/export/words/", {"format": "csv"}, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), 5)
+
+    async def test_asgi(self):
+        read = []
+
+        def rows():
+            for i in range(5):
+                read.append(i)
+                yield (i,)
+
+        request = AsyncRequestFactory().get("/export/words/")
+        request.user = self.staff
+        with unittest.mock.patch.object(export, "export", return_value=(["id"], rows())), \
+                unittest.mock.patch.object(export, "CHUNK_SIZE", 2):
+            response = views.export_view(request, "words")
+            self.assertTrue(response.is_async)
+
+            # Read a chunk at a time, not the whole export before the first one
+            chunks = aiter(response)
+            self.assertEqual(await anext(chunks), b'{"id": 0}\n{"id": 1}\n')
+            self.assertEqual(read, [0, 1])
+            self.assertEqual([chunk async for chunk in chunks], [b'{"id": 2}\n{"id": 3}\n', b'{"id": 4}\n'])
+
+        # Under WSGI the lines are served as they are
+        request = RequestFactory().get("/export/words/")
+        request.user = self.staff
+        self.assertFalse(views.export_view(request, "words").is_async)
+
+    def test_command(self):
+        output = Path(tempfile.mkdtemp())/"words.ndjson.gz"
+        call_command("export", "words", "-c", str(self.course.pk), "-o", str(output), stdout=StringIO())
+
+        with gzip.open(output, "rt") as f:
+            self.assertEqual([json.loads(line)["text"] for line in f], ["slovo0", "slovo1", "slovo2"])
+
+
+class CompactSentencesTest(TransactionTestCase):
+    def test_compact(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        words = models.Word.objects.bulk_create([models.Word(lang=cs, text=f"slovo{i}", freq=1) for i in range(3)])
+
+        hello = models.Sentence.objects.create(lang=cs, text="Ahoj světe.", link_id=1)
+        hello_copy = models.Sentence.objects.create(lang=cs, text=" Ahoj  světe. ", link_id=2)
+        hello_voice = models.Sentence(lang=cs, text="Ahoj světe.")
+        hello_voice.audio.name = "clips/ahoj.mp3"
+        hello_voice.save()
+        other = models.Sentence.objects.create(lang=cs, text="Ahoj, světe.", link_id=3)
+        hi = models.Sentence.objects.create(lang=en, text="Hello world.", link_id=10)
+        hi_copy = models.Sentence.objects.create(lang=en, text="Hello world.", link_id=11)
+
+        hello.translations.add(hi)
+        hello_copy.translations.add(hi_copy)
+        hello.words.add(words[0])
+        hello_copy.words.add(words[0], words[1])
+        hello_voice.words.add(words[2])
+
+        out = StringIO()
+        call_command("compactsentences", stdout=out)
+        self.assertIn("Merged 3 sentences into 2", out.getvalue())
+
+        self.assertEqual(set(models.Sentence.objects.all()), {hello, other, hi})
+        hello.refresh_from_db()
+        self.assertEqual(hello.audio.name, "clips/ahoj.mp3")
+        self.assertEqual(hello.link_id, 1)
+        self.assertEqual(list(hello.translations.all()), [hi])
+        self.assertEqual(set(hello.words.all()), set(words))
+        self.assertEqual(list(models.Sentence.objects.search("světe")), [hello, other])
+
+        out = StringIO()
+        call_command("compactsentences", stdout=out)
+        self.assertIn("Found 0 duplicates", out.getvalue())
+
+
+class ContentRouterTest(TestCase):
+    def setUp(self):
+        self.router = ContentRouter()
+        self.user = models.User.objects.create(username="test")
+
+    def test_single_database(self):
+        self.assertEqual(self.router.db_for_read(models.Word), "default")
+        self.assertIsNone(self.router.allow_migrate("default", "learn", "word"))
+
+        words = models.Word.objects.values_list("pk", flat=True)
+        self.assertIs(ids(words, models.UserWordProgress), words)
+
+        queryset = models.UserWordProgress.objects.select_related("word__lang", "user")
+        self.assertEqual(queryset.query.select_related, {"word": {"lang": {}}, "user": {}})
+        self.assertEqual(queryset._prefetch_related_lookups, ())
+
+    @override_settings(LANGTOOL_CONTENT_DATABASE="content")
+    def test_separate_databases(self):
+        self.assertEqual(self.router.db_for_read(models.Word), "content")
+        self.assertEqual(self.router.db_for_write(models.Translation), "content")
+        self.assertEqual(self.router.db_for_write(models.UserWordProgress), "default")
+        self.assertTrue(self.router.allow_migrate("content", "learn", "sentence_words"))
+        self.assertFalse(self.router.allow_migrate("default", "learn", "sentence"))
+        self.assertFalse(self.router.allow_migrate("content", "learn", "userwordprogress"))
+        self.assertTrue(self.router.allow_migrate("default", "auth", "permission"))
+
+        # Looked up in its own database, passed on as one parameter
+        users = ids(models.User.objects.values_list("pk", flat=True), models.Word)
+        self.assertEqual(list(models.User.objects.filter(pk__in=users)), [self.user])
+
+        models.User.objects.bulk_create([models.User(username=f"user{i}") for i in range(40_000)], batch_size=5000)
+        users = ids(models.User.objects.values_list("pk", flat=True), models.Word)
+        self.assertEqual(models.User.objects.filter(pk__in=users).count(), 40_001)
+
+        queryset = models.UserWordProgress.objects.select_related("word__lang", "user")
+        self.assertEqual(queryset.query.select_related, {"user": {}})
+        (lookup,) = queryset._prefetch_related_lookups
+        self.assertEqual(lookup.prefetch_through, "word")
+        self.assertEqual(lookup.queryset.query.select_related, {"lang": {}})
+
+
+@override_settings(LANGTOOL_CONTENT_DATABASE="content")
+class SeparateDatabasesTest(TestCase):
+    databases = {"default", "content"}
+
+    def test_delete_content(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        course = models.Course.objects.create(known=en, learning=cs)
+        word, other = models.Word.objects.bulk_create([models.Word(lang=cs, text=text, freq=1) for text in ("pes", "kočka")])
+        self.assertFalse(models.Word.objects.using("default").exists())
+
+        user = models.User.objects.create(username="learner", course=course)
+        for w in (word, other):
+            models.UserWordProgress.objects.create(user=user, word=w).attempt(True)
+        models.PackedProgress.objects.create(user=user, lang=cs, data=b"")
+
+        word.delete()
+        self.assertEqual(list(user.word_progress.values_list("word", flat=True)), [other.pk])
+
+        course.delete()
+        user.refresh_from_db()
+        self.assertIsNone(user.course_id)
+
+        # Cascades to the other word in the content database
+        cs.delete()
+        self.assertFalse(user.word_progress.exists())
+        self.assertFalse(user.packed_progress.exists())
+
+    def test_export_progress(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        course = models.Course.objects.create(known=en, learning=cs)
+        words = models.Word.objects.bulk_create([
+            models.Word(lang=lang, text=f"slovo{i}", freq=1) for i in range(5) for lang in (cs, en)
+        ])
+        user = models.User.objects.create(username="learner")
+        models.UserWordProgress.objects.bulk_create([models.UserWordProgress(user=user, word=w) for w in words])
+
+        with unittest.mock.patch.object(export, "CHUNK_SIZE", 3):
+            columns, rows = export.export("progress", course=course.pk)
+            exported = [row[columns.index("word")] for row in rows]
+        self.assertEqual(exported, [w.pk for w in words if w.lang_id == "cs"])
+
+
+@override_settings(LANGTOOL_DIFFICULTY_LENGTH_WEIGHT=0.5)
+class SentenceDifficultyTest(TestCase):
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        self.word = models.Word.objects.create(lang=cs, text="pes", freq=1)
+        self.sentences = models.Sentence.objects.bulk_create([
+            models.Sentence(lang=cs, text=f"věta {i}") for i in range(5)
+        ])
+        for sentence in self.sentences:
+            sentence.words.add(self.word)
+        models.Sentence.objects.set_difficulty([(s.pk, float(i)) for i, s in enumerate(self.sentences)])
+
+    def test_difficulty(self):
+        self.assertEqual(difficulty.difficulty([]), 0.)
+        self.assertEqual(difficulty.difficulty([6., 3., 5.]), 8.-3.+1.5)
+
+        scorer = difficulty.Scorer("cs")
+        self.assertGreater(scorer(["pes", "zeugma"]), scorer(["pes", "je"]))
+        # Punctuation and unknown words
+        self.assertEqual(scorer(["pes", "."]), scorer(["pes"]))
+        self.assertEqual(scorer(["xyzzyq"]), 8.5)
+
+    def test_filter(self):
+        result = schema.execute_sync(
+            "query { sentences(filters: {difficulty: {range: [1, 3]}}, order: {difficulty: DESC}, pagination: {limit: 10}) { difficulty } }"
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual([s["difficulty"] for s in result.data["sentences"]], [3., 2., 1.])
+
+    def test_random_sentence(self):
+        result = schema.execute_sync(
+            "query ($id: ID!) { word(id: $id) { randomSentence(minDifficulty: 3, maxDifficulty: 3) { text } } }",
+            variable_values={"id": self.word.pk}
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["word"]["randomSentence"], {"text": "věta 3"})
+
+        result = schema.execute_sync(
+            "query ($id: ID!) { word(id: $id) { randomSentence(minDifficulty: 10) { text } } }",
+            variable_values={"id": self.word.pk}
+        )
+        self.assertIsNone(result.data["word"]["randomSentence"])
+
+    def test_index(self):
+        plan = models.Sentence.objects.filter(lang_id="cs", difficulty__range=(1, 3)).explain()
+        index = next(index.name for index in models.Sentence._meta.indexes if index.fields == ["lang", "difficulty"])
+        self.assertIn(f"USING INDEX {index} (lang_id=? AND difficulty>? AND difficulty<?)", plan)
+
+
+class TokenizerTest(TestCase):
+    # Single sentences, tokenized by NLTK without Punkt
+    SENTENCES = [
+        ("en", "I don't think it's going to rain today."),
+        ("en", "\"Where are you going?\" she asked."),
+        ("en", "Tom's car costs $3,500 (roughly) -- I can't afford it..."),
+        ("en", "We'll meet at 12:30; bring John's book, please!"),
+        ("en", "I cannot believe you're gonna leave, the kids' toys are everywhere."),
+        ("en", "He said: 'Yes' and left [quickly]."),
+        ("cs", "Kolik stojí ten pes, 2,5 tisíce?"),
+        ("cs", "„Pojď sem!“ řekla Marie."),
+        ("cs", "Zítra (v pondělí) půjdu do školy; a ty?"),
+        ("ru", "«Привет», — сказал он."),
+        ("ru", "Ёлка стоит 1.500 рублей... Дорого!"),
+        ("ru", "Где ты был вчера вечером?"),
+    ]
+
+    def test_treebank_parity(self):
+        treebank = NLTKWordTokenizer()
+        for lang, text in self.SENTENCES:
+            with self.subTest(text=text):
+                tokens, spans = multilang.tokenize(text, lang)
+                self.assertEqual(tokens, treebank.tokenize(text))
+                self.assertEqual(len(spans), len(tokens))
+                for token, (start, end) in zip(tokens, spans):
+                    self.assertEqual(text[start:end], "\"" if token in ("``", "''") else token)
+
+    def test_sentences(self):
+        self.assertEqual(
+            multilang.tokenize("Mr. Smith went to Washington. He didn't like it.", "en")[0],
+            ["Mr.", "Smith", "went", "to", "Washington", ".", "He", "did", "n't", "like", "it", "."]
+        )
+        self.assertEqual(
+            multilang.tokenize("Narodil se 5. května 1990. Pak odešel, tj. zmizel.", "cs")[0],
+            ["Narodil", "se", "5.", "května", "1990", ".", "Pak", "odešel", ",", "tj.", "zmizel", "."]
+        )
+        self.assertEqual(
+            multilang.tokenize("Это я. Открой дверь!", "ru")[0],
+            ["Это", "я", ".", "Открой", "дверь", "!"]
+        )
+
+    def test_unsupported(self):
+        with self.assertRaises(multilang.LangError):
+            multilang.tokenize("Hallo Welt.", "de")
+
+    def test_sentence(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        models.Sentence.objects.create(lang=cs, text="Pes štěká, kočka spí.")
+
+        sentence = models.Sentence.objects.only("text", "lang").get()
+        # The language isn't loaded
+        with self.assertNumQueries(0):
+            self.assertEqual(sentence.tokens, ["Pes", "štěká", ",", "kočka", "spí", "."])
+            self.assertEqual(sentence.spans, [(0, 3), (4, 9), (9, 10), (11, 16), (17, 20), (20, 21)])
+
+
+def multipart_payloads(content):
+    """JSON payloads of the parts of a multipart/mixed incremental response."""
+    assert content.endswith("\r\n-----\r\n")
+    return [json.loads(part.split("\r\n\r\n", 1)[1]) for part in content[:-len("\r\n-----\r\n")].split("\r\n---\r\n")[1:]]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IncrementalDeliveryTest(TransactionTestCase):
+    query = """
+    query ($defer: Boolean! = true) {
+      words(pagination: {limit: 3}, order: {text: ASC}) @stream(initialCount: 1, if: $defer) {
+        text
+        ...Sentence @defer(label: "sentence", if: $defer)
+      }
+    }
+    fragment Sentence on Word { randomSentence { text translations { text } } }
+    """
+
+    def setUp(self):
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        for i in range(3):
+            word = models.Word.objects.create(lang=cs, text=f"slovo{i}", freq=1)
+            sentence = models.Sentence.objects.create(lang=cs, text=f"věta {i}")
+            sentence.words.add(word)
+            sentence.translations.add(models.Sentence.objects.create(lang=en, text=f"sentence {i}"))
+
+    def graphql(self, variables=None, **headers):
+        return self.client.post("/graphql/", {"query": self.query, "variables": variables or {}}, content_type="application/json", headers=headers)
+
+    def sentence(self, i):
+        return {"randomSentence": {"text": f"věta {i}", "translations": [{"text": f"sentence {i}"}]}}
+
+    def assert_incremental(self, payloads):
+        self.assertEqual(payloads[0], {"data": {"words": [{"text": "slovo0"}]}, "hasNext": True})
+        incremental = [result for payload in payloads[1:] for result in payload["incremental"]]
+        self.assertEqual([payload["hasNext"] for payload in payloads[1:]], [True]*(len(payloads)-2) + [False])
+
+        items = {tuple(result["path"]): result["items"] for result in incremental if "items" in result}
+        self.assertEqual(items, {("words", 1): [{"text": "slovo1"}], ("words", 2): [{"text": "slovo2"}]})
+
+        deferred = {tuple(result["path"]): result for result in incremental if "data" in result}
+        self.assertEqual(set(deferred), {("words", 0), ("words", 1), ("words", 2)})
+        for (_, i), result in deferred.items():
+            self.assertEqual(result, {"data": self.sentence(i), "path": ["words", i], "label": "sentence"})
+
+    def test_multipart(self):
+        response = self.graphql(accept="multipart/mixed, application/json")
+        self.assertEqual(response["Content-Type"], 'multipart/mixed; boundary="-"')
+        self.assertNotIn("ETag", response)
+        self.assert_incremental(multipart_payloads(b"".join(response.streaming_content).decode()))
+
+    def test_complete_without_multipart(self):
+        response = self.graphql()
+        self.assertEqual(response.json()["data"], {"words": [{"text": f"slovo{i}", **self.sentence(i)} for i in range(3)]})
+
+    def test_nothing_deferred(self):
+        response = self.graphql({"defer": False}, accept="multipart/mixed")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json()["data"]["words"][0], {"text": "slovo0", **self.sentence(0)})
+
+    def test_errors(self):
+        response = self.client.post(
+            "/graphql/", {"query": "query { words @stream(initialCount: -1) { text } }"},
+            content_type="application/json", headers={"accept": "multipart/mixed"}
+        )
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("initialCount", response.json()["errors"][0]["message"])
+
+    def test_error_after_first_part(self):
+        with unittest.mock.patch.object(incremental.IncrementalExecutionContext, "execute_deferred", side_effect=RuntimeError("boom")):
+            response = self.graphql(accept="multipart/mixed")
+            with self.assertLogs("strawberry.execution", "ERROR"):
+                payloads = multipart_payloads(b"".join(response.streaming_content).decode())
+
+        self.assertEqual(payloads[0]["hasNext"], True)
+        self.assertEqual(payloads[-1], {"errors": [{"message": "boom"}], "hasNext": False})
+
+    def test_body_parsed_once(self):
+        with unittest.mock.patch.object(GraphQLView, "parse_http_body", autospec=True, side_effect=GraphQLView.parse_http_body) as parse:
+            self.graphql(accept="multipart/mixed")
+            self.graphql()
+        self.assertEqual(parse.call_count, 2)
+
+    async def test_async(self):
+        request = AsyncRequestFactory().post(
+            "/graphql/", {"query": self.query}, content_type="application/json", headers={"accept": "multipart/mixed"}
+        )
+        response = await AsyncCachedGraphQLView.as_view(schema=schema)(request)
+        self.assertEqual(response["Content-Type"], 'multipart/mixed; boundary="-"')
+        self.assert_incremental(multipart_payloads(b"".join([part async for part in response.streaming_content]).decode()))
+
+
+#######################
+# Operations          #
+#######################
+
+
+# Client operations with upper bounds on their SQL query counts for the
+# corpus of OperationTestCase. Bounds that grow with the page size are
+# marked, lower them when the N+1 is fixed.
+OPERATIONS = {
+    "words_with_progress": ("""
+        query {
+          words(filters: {lang: {code: "cs"}}, pagination: {limit: 20}) {
+            id
+            text
+            freq
+            progress {
+              lastReview
+              prediction
+            }
+          }
+        }
+    """, 21), # one query per word (Word.progress)
+    "progresses_by_prediction": ("""
+        query {
+          progresses(order: {prediction: ASC}, pagination: {limit: 10}) {
+            id
+            lastReview
+            scheduledReview
+            prediction
+            word {
+              id
+              text
+            }
+          }
+        }
+    """, 11), # one query per progress (word is not prefetched after sorting in Python)
+    "progresses_by_scheduled_review": ("""
+        query ($now: DateTime) {
+          progresses(filters: {scheduledReview: {lte: $now}}, order: {scheduledReview: ASC}, pagination: {limit: 10}) {
+            id
+            lastReview
+            scheduledReview
+            prediction
+            word {
+              id
+              text
+            }
+          }
+        }
+    """, 31), # three queries per progress (prediction loads the deferred alpha, beta and interval)
+    "new_words_with_random_sentence": ("""
+        query {
+          words(filters: {new: true, lang: {code: "cs"}}, pagination: {limit: 10}) {
+            text
+            randomSentence {
+              text
+              translations {
+                text
+              }
+            }
+          }
+        }
+    """, 31), # three queries per word (Word.randomSentence)
+    "random_sentence": ("""
+        query ($word: ID!) {
+          word(id: $word) {
+            randomSentence(filters: {hasAudio: false}) {
+              id
+              text
+              translations {
+                text
+              }
+            }
+          }
+        }
+    """, 4),
+    "attempt": ("""
+        mutation ($word: ID!) {
+          attempt(id: $word, success: true) {
+            id
+            lastReview
+            prediction
+          }
+        }
+    """, 3),
+    "sentence_search": ("""
+        query {
+          sentences(filters: {text: {iContains: "slovo1"}, lang: {code: "cs"}}, pagination: {limit: 20}) {
+            id
+            text
+            translations {
+              text
+            }
+            words {
+              text
+            }
+          }
+        }
+    """, 3),
+    "sentence_fulltext_search": ("""
+        query {
+          sentences(filters: {search: "slovo1"}, pagination: {limit: 20}) {
+            id
+            text
+            translations {
+              text
+            }
+          }
+        }
+    """, 2),
+    "new_words_with_best_sentence": ("""
+        query {
+          words(filters: {new: true, lang: {code: "cs"}}, pagination: {limit: 10}) {
+            text
+            bestSentence {
+              text
+              translations {
+                text
+              }
+            }
+          }
+        }
+    """, 33), # three queries per word (Word.bestSentence)
+    "sentence_tokens": ("""
+        query {
+          sentences(filters: {lang: {code: "cs"}}, pagination: {limit: 20}) {
+            id
+            tokens
+            lemmas
+            spans
+          }
+        }
+    """, 2),
+}
+
+
+class OperationTestCase(TestCase):
+    """
+    Runs client operations against the schema in-process on a small corpus.
+    """
+
+    def setUp(self):
+        ranking.ranker.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+
+        cs = models.Language.objects.create(code="cs", name="Czech", native_name="Čeština")
+        en = models.Language.objects.create(code="en", name="English", native_name="English")
+        models.Course.objects.create(known=en, learning=cs)
+
+        cls.words = models.Word.objects.bulk_create([
+            models.Word(lang=cs, text=f"slovo{i}", freq=1/(i+1)) for i in range(50)
+        ])
+        sentences = models.Sentence.objects.bulk_create([
+            models.Sentence(lang=cs, text=f"věta {i} slovo{i%50}") for i in range(200)
+        ])
+        translations = models.Sentence.objects.bulk_create([
+            models.Sentence(lang=en, text=f"sentence {i}") for i in range(200)
+        ])
+
+        models.Sentence.translations.through.objects.bulk_create([
+            models.Sentence.translations.through(from_sentence=s, to_sentence=t)
+            for s, t in zip(sentences, translations)
+        ])
+        models.Sentence.words.through.objects.bulk_create([
+            models.Sentence.words.through(sentence=s, word=cls.words[(i+k)%50])
+            for i, s in enumerate(sentences)
+            for k in (0, 1, 7)
+        ])
+
+        cls.user = models.User.objects.create_user("learner", password="learner")
+        models.UserWordProgress.objects.bulk_create([
+            models.UserWordProgress(
+                user=cls.user,
+                word=word,
+                last_review=cls.now-timedelta(hours=i),
+                interval=timedelta(hours=i%5+1)
+            )
+            for i, word in enumerate(cls.words[:30])
+        ])
+
+        cls.variables = {
+            "now": cls.now.isoformat(),
+            "word": cls.words[0].id,
+        }
+
+    def execute(self, query, variables=None, user=None):
+        request = RequestFactory().post("/graphql/")
+        request.user = user or AnonymousUser()
+
+        result = schema.execute_sync(
+            query,
+            variable_values=variables,
+            context_value=StrawberryDjangoContext(request=request, response=None)
+        )
+        self.assertIsNone(result.errors)
+        return result
+
+    def execute_operation(self, name):
+        query, _ = OPERATIONS[name]
+        variables = {
+            name: value for name, value in self.variables.items()
+            if f"${name}" in query
+        }
+        return self.execute(query, variables, self.user)
+
+
+class OperationQueryCountTest(OperationTestCase):
+    def assertOperationQueries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            self.execute_operation(name)
+
+        _, max_queries = OPERATIONS[name]
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f"{name} executed {len(queries)} queries:\n" + "\n".join(q["sql"] for q in queries)
+        )
+
+    def test_words_with_progress(self):
+        self.assertOperationQueries("words_with_progress")
+
+    def test_progresses_by_prediction(self):
+        self.assertOperationQueries("progresses_by_prediction")
+
+    def test_progresses_by_scheduled_review(self):
+        self.assertOperationQueries("progresses_by_scheduled_review")
+
+    def test_new_words_with_random_sentence(self):
+        self.assertOperationQueries("new_words_with_random_sentence")
+
+    def test_random_sentence(self):
+        self.assertOperationQueries("random_sentence")
+
+    def test_attempt(self):
+        self.assertOperationQueries("attempt")
+
+    def test_sentence_search(self):
+        self.assertOperationQueries("sentence_search")
+
+    def test_sentence_fulltext_search(self):
+        self.assertOperationQueries("sentence_fulltext_search")
+
+    def test_new_words_with_best_sentence(self):
+        self.assertOperationQueries("new_words_with_best_sentence")
+
+    def test_sentence_tokens(self):
+        self.assertOperationQueries("sentence_tokens")
+
+
+@unittest.skipUnless(os.environ.get("LANGTOOL_BENCHMARK"), "set LANGTOOL_BENCHMARK=<repetitions> to run benchmarks")
+class OperationBenchmark(OperationTestCase):
+    # p95 latency budget of every operation in seconds
+    LATENCY_BUDGET = 0.25
+
+    def test_latency(self):
+        repetitions = int(os.environ["LANGTOOL_BENCHMARK"])
+
+        print(f"\n{'operation':<35}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in OPERATIONS:
+            latencies = []
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                self.execute_operation(name)
+                latencies.append(time.perf_counter()-start)
+
+            q = statistics.quantiles(latencies, n=100)
+            print(f"{name:<35}{q[49]*1000:>10.2f}{q[94]*1000:>10.2f}{q[98]*1000:>10.2f}")
+
+            with self.subTest(operation=name):
+                self.assertLessEqual(q[94], self.LATENCY_BUDGET)
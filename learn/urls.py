@@ -1,13 +1,22 @@
 from django.urls import path
+from django.conf import settings
 
-from strawberry.django.views import GraphQLView
 from .api import schema
 
 from . import views
 
 
+if settings.LANGTOOL_ASYNC_GRAPHQL:
+	GraphQLView = views.AsyncCachedGraphQLView
+else:
+	GraphQLView = views.CachedGraphQLView
+
+
 urlpatterns = [
 	#path("", views.CourseListView.as_view(), name="courses"),
 	#path("course/<int:pk>/", views.CourseDetailView.as_view(), name="course"),
 	path("graphql/", GraphQLView.as_view(schema=schema), name="graphql"),
+	path("metrics/", views.metrics_view, name="metrics"),
+	path("sync/", views.sync_view, name="sync"),
+	path("export/<slug:kind>/", views.export_view, name="export"),
 ]
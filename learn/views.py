@@ -1,6 +1,419 @@
 from django.shortcuts import render
 from django.views.generic import DetailView, ListView
 
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse, Http404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_http_methods
+from django.conf import settings
+from django.utils.http import parse_etags
+from django.utils.cache import patch_vary_headers
+from django.core.handlers.asgi import ASGIRequest
+
+from strawberry import UNSET
+from strawberry.django.views import GraphQLView, AsyncGraphQLView
+from strawberry.http import GraphQLRequestData
+from strawberry.http.exceptions import HTTPException
+from strawberry.types.graphql import OperationType
+from graphql import GraphQLError
+
+from asgiref.sync import sync_to_async
+
+import asyncio
+import msgpack
+import queue
+import json
+import itertools
+
+from langtool.executor import run_sync, submit
+
+from . import cache
+from . import metrics
+from . import sync
+from . import export
+from . import incremental
+from .models import ConcurrentUpdateError
+
+
+MSGPACK = "application/msgpack"
+
+
+def accepts_msgpack(request):
+	return MSGPACK in request.headers.get("Accept", "")
+
+
+def accepts_incremental(request):
+	return incremental.MULTIPART in request.headers.get("Accept", "")
+
+
+def is_incremental(request, data):
+	return accepts_incremental(request) and incremental.uses_directives(data.query)
+
+
+def response_key(request, data):
+	if is_incremental(request, data):
+		return None
+	key = cache.response_key(data.query, data.variables, data.operation_name)
+	if key is not None and accepts_msgpack(request):
+		key += ":msgpack"
+	return key
+
+
+def cached_response(request, entry):
+	content, etag = entry
+	if etag in parse_etags(request.headers.get("If-None-Match", "")):
+		response = HttpResponseNotModified()
+	else:
+		response = HttpResponse(content, content_type=MSGPACK if accepts_msgpack(request) else "application/json")
+	response["ETag"] = etag
+	response["Cache-Control"] = "no-cache"
+	patch_vary_headers(response, ["Accept"])
+	return response
+
+
+class MsgpackMixin:
+	"""
+	Content negotiation for the GraphQL views: requests may be posted
+	as application/msgpack and clients sending Accept: application/msgpack
+	get msgpack-encoded results, which are smaller and faster to parse
+	than JSON (especially the integer pairs of Sentence.spans).
+	"""
+
+	def parse_msgpack(self, body):
+		try:
+			data = msgpack.unpackb(body)
+		except (ValueError, msgpack.UnpackException) as e:
+			raise HTTPException(400, "Unable to parse request body as msgpack") from e
+
+		if not isinstance(data, dict):
+			raise HTTPException(400, "Request body must be a msgpack map")
+
+		return GraphQLRequestData(
+			query=data.get("query"),
+			variables=data.get("variables"),
+			operation_name=data.get("operationName"),
+		)
+
+	def encode_json(self, response_data):
+		if accepts_msgpack(self.request):
+			return msgpack.packb(response_data)
+		return super().encode_json(response_data)
+
+	def create_response(self, response_data, sub_response):
+		response = super().create_response(response_data, sub_response)
+		if accepts_msgpack(self.request):
+			response["Content-Type"] = MSGPACK
+		patch_vary_headers(response, ["Accept"])
+		return response
+
+
+class IncrementalResult:
+	"""The initial payload of an incremental result and an iterator of the rest."""
+
+	def __init__(self, initial, rest):
+		self.initial = initial
+		self.rest = rest
+
+	def parts(self):
+		dumps = json.dumps
+		yield incremental.encode_part(self.initial, dumps)
+		for payload in self.rest:
+			yield incremental.encode_part(payload, dumps)
+		yield incremental.END
+
+	async def async_parts(self):
+		dumps = json.dumps
+		yield incremental.encode_part(self.initial, dumps)
+		async for payload in self.rest:
+			yield incremental.encode_part(payload, dumps)
+		yield incremental.END
+
+
+class IncrementalMixin:
+	"""
+	Incremental delivery (see learn/incremental.py): operations with @defer
+	or @stream of clients accepting multipart/mixed run in the bounded pool
+	of langtool.executor, their payloads are streamed as parts of a
+	multipart/mixed response as soon as they are complete. Results without
+	anything deferred are sent as usual.
+	"""
+
+	def error_payload(self, error):
+		"""
+		Last payload of an execution that failed after the headers were sent,
+		the error can only be reported in a part.
+		"""
+		error = GraphQLError(str(error), original_error=error)
+		self.schema.process_errors([error])
+		return {"errors": [error.formatted], "hasNext": False}
+
+	def create_response(self, response_data, sub_response):
+		if not isinstance(response_data, IncrementalResult):
+			return super().create_response(response_data, sub_response)
+
+		parts = response_data.async_parts() if hasattr(response_data.rest, "__aiter__") else response_data.parts()
+		response = StreamingHttpResponse(parts, content_type=f'{incremental.MULTIPART}; boundary="-"')
+		for name, value in sub_response.items():
+			if name.lower() != "content-type":
+				response[name] = value
+		if sub_response.status_code:
+			response.status_code = sub_response.status_code
+		for name, value in sub_response.cookies.items():
+			response.cookies[name] = value
+		return response
+
+
+class CachedGraphQLView(IncrementalMixin, MsgpackMixin, GraphQLView):
+	"""
+	GraphQL view serving operations that touch no per-user fields
+	from the response cache, with ETag/304 support.
+	"""
+
+	def parse_http_body(self, request):
+		# Parsed once, by run (for the cache key) or execute_operation
+		data = getattr(request.request, "graphql_request_data", None)
+		if data is None:
+			if MSGPACK in (request.content_type or ""):
+				# The adapter decodes the body as text
+				data = self.parse_msgpack(request.request.body)
+			else:
+				data = super().parse_http_body(request)
+			request.request.graphql_request_data = data
+		return data
+
+	def process_result(self, request, result):
+		if isinstance(result, IncrementalResult):
+			return result
+		request.graphql_errors = bool(result.errors)
+		return super().process_result(request, result)
+
+	def execute_operation(self, request, context, root_value):
+		if not accepts_incremental(request) or not incremental.uses_directives(self.parse_http_body(self.request_adapter_class(request)).query):
+			return super().execute_operation(request, context, root_value)
+
+		payloads = queue.SimpleQueue()
+		request.graphql_incremental = payloads.put
+		future = submit(super().execute_operation, request, context, root_value)
+		future.add_done_callback(lambda _: payloads.put(None))
+
+		initial = payloads.get()
+		if initial is None or not initial["hasNext"]:
+			# Failed before executing (e.g. invalid) or nothing was deferred
+			return future.result()
+
+		def rest():
+			yield from iter(payloads.get, None)
+			try:
+				future.result()
+			except Exception as e:
+				yield self.error_payload(e)
+
+		return IncrementalResult(initial, rest())
+
+	def run(self, request, context=UNSET, root_value=UNSET):
+		request_adapter = self.request_adapter_class(request)
+		if not self.is_request_allowed(request_adapter) or self.should_render_graphiql(request_adapter):
+			return super().run(request, context, root_value)
+
+		data = self.parse_http_body(request_adapter)
+		key = response_key(request, data)
+		if key is None:
+			return super().run(request, context, root_value)
+
+		entry = cache.get_response(key)
+		if entry is None:
+			response = super().run(request, context, root_value)
+			if response.status_code != 200 or getattr(request, "graphql_errors", True):
+				return response
+			entry = cache.set_response(key, response.content)
+
+		return cached_response(request, entry)
+
+
+class AsyncCachedGraphQLView(IncrementalMixin, MsgpackMixin, AsyncGraphQLView):
+	"""
+	Async variant of CachedGraphQLView for ASGI deployments.
+
+	The event loop only handles HTTP, the operation itself is executed
+	synchronously in the bounded pool of langtool.executor. This keeps
+	the ORM (and CPU-heavy resolvers like tokenization) off the loop
+	without a thread hop for every resolved field.
+	"""
+
+	async def parse_http_body(self, request):
+		# Parsed once, by run (for the cache key) or execute_operation
+		data = getattr(request.request, "graphql_request_data", None)
+		if data is None:
+			if MSGPACK in (request.content_type or ""):
+				# The adapter decodes the body as text
+				data = self.parse_msgpack(request.request.body)
+			else:
+				data = await super().parse_http_body(request)
+			request.request.graphql_request_data = data
+		return data
+
+	async def process_result(self, request, result):
+		if isinstance(result, IncrementalResult):
+			return result
+		request.graphql_errors = bool(result.errors)
+		return await super().process_result(request, result)
+
+	async def execute_operation(self, request, context, root_value):
+		request_adapter = self.request_adapter_class(request)
+		request_data = await self.parse_http_body(request_adapter)
+
+		allowed_operation_types = OperationType.from_http(request_adapter.method)
+		if not self.allow_queries_via_get and request_adapter.method == "GET":
+			allowed_operation_types = allowed_operation_types - {OperationType.QUERY}
+
+		execution = run_sync(
+			self.schema.execute_sync,
+			request_data.query,
+			root_value=root_value,
+			variable_values=request_data.variables,
+			context_value=context,
+			operation_name=request_data.operation_name,
+			allowed_operation_types=allowed_operation_types,
+		)
+		if not is_incremental(request, request_data):
+			return await execution
+
+		loop = asyncio.get_running_loop()
+		payloads = asyncio.Queue()
+		request.graphql_incremental = lambda payload: loop.call_soon_threadsafe(payloads.put_nowait, payload)
+		task = asyncio.ensure_future(execution)
+		task.add_done_callback(lambda _: payloads.put_nowait(None))
+
+		initial = await payloads.get()
+		if initial is None or not initial["hasNext"]:
+			return await task
+
+		async def rest():
+			while (payload := await payloads.get()) is not None:
+				yield payload
+			try:
+				await task
+			except Exception as e:
+				yield self.error_payload(e)
+
+		return IncrementalResult(initial, rest())
+
+	async def run(self, request, context=UNSET, root_value=UNSET):
+		request_adapter = self.request_adapter_class(request)
+		if not self.is_request_allowed(request_adapter) or self.should_render_graphiql(request_adapter):
+			return await super().run(request, context, root_value)
+
+		data = await self.parse_http_body(request_adapter)
+		key = await run_sync(response_key, request, data)
+		if key is None:
+			return await super().run(request, context, root_value)
+
+		entry = await run_sync(cache.get_response, key)
+		if entry is None:
+			response = await super().run(request, context, root_value)
+			if response.status_code != 200 or getattr(request, "graphql_errors", True):
+				return response
+			entry = await run_sync(cache.set_response, key, response.content)
+
+		return cached_response(request, entry)
+
+
+def metrics_view(request):
+	"""Prometheus metrics of this process."""
+	if not settings.LANGTOOL_METRICS:
+		raise Http404
+	if not request.user.is_staff and request.META.get("REMOTE_ADDR") not in settings.LANGTOOL_METRICS_ALLOWED_IPS:
+		return HttpResponse(status=403)
+	return HttpResponse(metrics.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+@gzip_page
+@require_http_methods(["GET", "POST"])
+def sync_view(request):
+	"""
+	Progress changed since the ?since= watermark (see learn/sync.py),
+	a POST first replays the offline reviews in its body.
+	Speaks msgpack (Accept/Content-Type: application/msgpack) or JSON.
+	"""
+	if not request.user.is_authenticated:
+		return HttpResponse(status=401)
+
+	try:
+		since = request.GET.get("since")
+		since = sync.parse_timestamp(since).timestamp() if since else None
+
+		applied = None
+		if request.method == "POST":
+			if request.content_type == MSGPACK:
+				data = msgpack.unpackb(request.body)
+			else:
+				data = json.loads(request.body)
+			if not isinstance(data, dict):
+				raise sync.SyncError("expected an object with events")
+			applied = sync.replay(request.user, data.get("events", []))
+	except (ValueError, msgpack.UnpackException, sync.SyncError) as e:
+		return HttpResponseBadRequest(str(e))
+	except ConcurrentUpdateError as e:
+		return HttpResponse(str(e), status=409)
+
+	changes = sync.changes_since(request.user, since)
+	if applied is not None:
+		changes["applied"] = applied
+
+	if accepts_msgpack(request):
+		return HttpResponse(msgpack.packb(changes), content_type=MSGPACK)
+	return JsonResponse(changes)
+
+
+async def async_chunks(lines):
+	"""
+	Serve a synchronous iterator of lines under ASGI, where StreamingHttpResponse
+	would read it whole before sending anything. Chunks of export.CHUNK_SIZE
+	lines are read in the thread of the request, which holds the database
+	cursor of the export.
+	"""
+	read = sync_to_async(lambda: "".join(itertools.islice(lines, export.CHUNK_SIZE)), thread_sensitive=True)
+	while chunk := await read():
+		yield chunk
+
+
+@gzip_page
+@require_http_methods(["GET"])
+def export_view(request, kind):
+	"""
+	Stream an export (see learn/export.py) as ?format=ndjson (default) or csv,
+	filtered by ?course=, ?since= and ?until=. Learners can only export
+	their own progress, staff can export everything.
+	"""
+	if not request.user.is_authenticated:
+		return HttpResponse(status=401)
+
+	user = None
+	if not request.user.is_staff:
+		if kind != "progress":
+			return HttpResponse(status=403)
+		user = request.user
+
+	format = request.GET.get("format", "ndjson")
+	try:
+		columns, rows = export.export(
+			kind,
+			course=request.GET.get("course"),
+			since=request.GET.get("since"),
+			until=request.GET.get("until"),
+			user=user,
+		)
+		lines = export.encode(columns, rows, format)
+	except export.ExportError as e:
+		return HttpResponseBadRequest(str(e))
+
+	if isinstance(request, ASGIRequest):
+		lines = async_chunks(lines)
+	response = StreamingHttpResponse(lines, content_type=f"{export.FORMATS[format]}; charset=utf-8")
+	response["Content-Disposition"] = f'attachment; filename="{kind}.{format}"'
+	return response
+
 
 #from .models import Course
 #class CourseDetailView(DetailView):
@@ -0,0 +1,83 @@
+"""
+Resolution of tokens to words through the WordForm table.
+
+Every process loads the forms of a language once into a read-only
+dictionary (normalized form -> (word id, lemma)), it is reloaded when
+the content version changes (see learn/cache.py). Tokens that are not
+in the corpus fall back to multilang.lemmatize.
+
+Checking the version reads the cache, callers resolving many tokens
+(e.g. all tokens of a sentence) should get WordForms by forms_for once.
+"""
+
+from multilang import normalize, lemmatize, LangError
+
+import threading
+
+from .cache import content_version
+from . import models
+
+
+class WordForms:
+    """Forms of a language, as loaded at one content version."""
+
+    def __init__(self, forms, lang_code):
+        self.forms = forms
+        self.lang_code = lang_code
+
+    def normalize(self, token):
+        try:
+            return normalize(token, self.lang_code)
+        except LangError:
+            return token
+
+    def word(self, token):
+        """Id of the word of a token, or None if it is not a form of any word."""
+        entry = self.forms.get(self.normalize(token))
+        return None if entry is None else entry[0]
+
+    def lemma(self, token):
+        entry = self.forms.get(self.normalize(token))
+        if entry is not None:
+            return entry[1]
+        return lemmatize(token, self.lang_code)
+
+
+class WordFormIndex:
+    def __init__(self):
+        self.forms = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.forms.clear()
+
+    def get_forms(self, lang_code):
+        version = content_version()
+        with self.lock:
+            cached = self.forms.get(lang_code)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        forms = {
+            form: (word, text)
+            for form, word, text in models.WordForm.objects
+                .filter(lang_id=lang_code)
+                .values_list("form", "word", "word__text")
+                .iterator(chunk_size=10_000)
+        }
+        with self.lock:
+            self.forms[lang_code] = (version, forms)
+        return forms
+
+    def forms_for(self, lang_code):
+        return WordForms(self.get_forms(lang_code), lang_code)
+
+    def word(self, token, lang_code):
+        return self.forms_for(lang_code).word(token)
+
+    def lemma(self, token, lang_code):
+        return self.forms_for(lang_code).lemma(token)
+
+
+index = WordFormIndex()
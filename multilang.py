@@ -1,5 +1,10 @@
+import re
+
 import simplemma
 
+from nltk.tokenize import word_tokenize
+from nltk.tokenize.util import align_tokens
+
 import pymorphy3
 morph = pymorphy3.MorphAnalyzer()
 
@@ -34,3 +39,152 @@ def lemmatize(word, lang, normalize=True, normalize_fn=normalize):
 			return norm(res[0].normal_form)
 	else:
 		return norm(simplemma.lemmatize(word, lang=lang))
+
+
+# Tokenization
+#
+# Drop-in replacements for nltk.word_tokenize (Punkt sentence splitting
+# followed by the Treebank regex cascade) as a single precompiled regex per
+# language, which yields tokens with their offsets in one pass over the text.
+# Tokens are the same as NLTK's (including `` and '' for straight double
+# quotes) but for contrived input, sentence boundaries are approximated
+# by the per-language abbreviations and capital letters. The benchtokenize
+# command compares both on sentences of the corpus.
+
+# Characters that close a sentence after its final period
+_closers = r"\]\)}>\"'»”’"
+
+# Characters before a straight double quote that make it an opening one
+_openers = r"\s(\[{<«“‘„`"
+
+_punctuation = r"[;@#$%&?!*\[\](){}<>«»“”‘’„]"
+
+# Straight double quotes (and '') become `` or '' as in NLTK
+_open_quote = rf"(?<![^{_openers}])\"|(?<=[{_openers}])''"
+_close_quote = r"\"|''"
+
+# ' before a single letter word ('a)
+_apostrophe = r"'(?=(?i:(?!re|ve|ll|m|t|s|d|n))\w\b)"
+
+# Followed by a space once NLTK has padded the punctuation (clitics are split after it)
+_boundary = rf"(?=\s|$|[,:](?!\d)|[;@#$%&?!*\[\](){{}}<>\"«»“”‘’„`]|''|--|\.\.|\.(?=[{_closers}]*(?:\s|$))|{_apostrophe})"
+
+# Always separate tokens (the final period of every sentence, : and , only if not followed by a digit)
+_separate = [
+	r"\.{2,}",
+	r"--",
+	r"``?",
+	r"\"",
+	r"''",
+	rf"(?<=[^'\s])(?:'[sSmMdD]|'){_boundary}",
+	# After 's, 'm, 'd and ' are split
+	rf"(?<=[^'\s])(?:'ll|'LL|'re|'RE|'ve|'VE|n't|N'T)(?:{_boundary}|(?='[sSmMdD]?(?:\s|$)))",
+	_apostrophe,
+	r"[,:](?!\d)",
+	_punctuation,
+	rf"(?<!\.)\.(?=[{_closers}]*(?:\s|$))",
+]
+
+# English contractions split as NLTK's CONTRACTIONS2 and CONTRACTIONS3 (first and second parts)
+_contraction_pairs = [
+	("can", r"not\b"), ("d", r"'ye\b"), ("gim", r"me\b"), ("gon", r"na\b"),
+	("got", r"ta\b"), ("lem", r"me\b"), ("more", r"'n\b"), ("wan", rf"na{_boundary}"),
+]
+_contractions = (
+	r"\b(?i:" + "|".join(f"{first}(?={second})" for first, second in _contraction_pairs) + ")"
+	r"|(?<![^\s;@#$%&?!*\[\](){}<>«»“”‘’„\"`.,:])(?i:'t)(?=(?i:is|was)\b)"
+)
+_contractions_second = "(?i:" + "|".join(
+	f"(?<={first}){second}" for first, second in [*_contraction_pairs, ("'t", r"(?:is|was)\b")]
+) + ")"
+
+
+class Tokenizer:
+	"""
+	Tokenizer of a language: uppercase are its capital letters (a regex
+	character class without the brackets), abbreviations are lowercase
+	words without their final period that don't end a sentence, English
+	contractions (cannot, gonna, 'tis...) are split if contractions is set.
+	"""
+
+	def __init__(self, uppercase, abbreviations=(), contractions=False):
+		lowercase = rf"(?![{uppercase}])[^\W\d_]"
+		separate = [_contractions, *_separate] if contractions else _separate
+
+		# Most tokens are words followed by a space or punctuation, which
+		# can't be anything else
+		alternatives = [
+			rf"{f'(?!{_contractions})' if contractions else ''}\w+(?=\s|$|[,:](?!\d)|{_punctuation})",
+			_punctuation,
+		]
+		if abbreviations:
+			names = "|".join(re.escape(a) for a in sorted(abbreviations, key=len, reverse=True))
+			alternatives.append(rf"(?i:{names})\.(?=\s+\S)")
+		# Initials (J. R. R. Tolkien) and ordinal numbers (5. května) don't end a sentence
+		alternatives.append(rf"[{uppercase}]\.(?=\s+\S)")
+		alternatives.append(rf"-?[.,]?\d[\d,.\-]*\.(?=\s+{lowercase})")
+		alternatives += [
+			_open_quote,
+			_close_quote,
+			*([_contractions_second] if contractions else []),
+			*separate,
+			# Anything else up to a separate token, which can only start
+			# at a non-word character, after it or at n't
+			rf"(?:(?!{'|'.join(separate)})(?:[^\WnN]+|\S))+",
+		]
+		# Every alternative is a group, quotes are told apart by its index
+		self.quotes = {alternatives.index(_open_quote)+1: "``", alternatives.index(_close_quote)+1: "''"}
+		self.pattern = re.compile(r"\s*(?:" + "|".join(f"({a})" for a in alternatives) + ")")
+
+	def __call__(self, text):
+		"""Tokens of the text and their (start, end) offsets."""
+		tokens = []
+		spans = []
+		for match in self.pattern.finditer(text):
+			group = match.lastindex
+			tokens.append(self.quotes.get(group) or match.group(group))
+			spans.append(match.span(group))
+		return tokens, spans
+
+
+tokenizers = {
+	"cs": Tokenizer(
+		"A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ",
+		abbreviations=(
+			"apod", "atd", "cca", "č", "doc", "dr", "hod", "ing", "mgr", "min", "mj", "např",
+			"ol", "p", "popř", "prof", "př", "resp", "sv", "tj", "tzn", "tzv", "ul",
+		),
+	),
+	"en": Tokenizer(
+		"A-Z",
+		abbreviations=(
+			"a.m", "co", "corp", "dr", "e.g", "etc", "i.e", "inc", "jr", "ltd", "mr", "mrs", "ms",
+			"mt", "p.m", "prof", "sr", "st", "u.k", "u.s", "vs",
+		),
+		contractions=True,
+	),
+	"ru": Tokenizer(
+		"А-ЯЁA-Z",
+		abbreviations=(
+			"г", "гг", "д", "др", "млн", "млрд", "пр", "проф", "руб", "см", "стр", "т.д", "т.е",
+			"т.п", "тыс", "ул",
+		),
+	),
+}
+
+
+def tokenize(text, lang):
+	"""Tokens of the text (as nltk.word_tokenize) and their (start, end) offsets in it."""
+	if lang not in tokenizers:
+		raise LangError("unsupported language")
+	return tokenizers[lang](text)
+
+
+def nltk_tokenize(text, language):
+	"""Tokens and offsets by nltk.word_tokenize, language is the name of a Punkt model (e.g. english)."""
+	tokens = word_tokenize(text, language)
+	try:
+		return tokens, align_tokens(tokens, text)
+	except ValueError:
+		# `` and '' are straight double quotes in the text
+		return tokens, align_tokens([tok.replace("''", "\"").replace("``", "\"") for tok in tokens], text)